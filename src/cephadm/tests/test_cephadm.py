@@ -1,4 +1,5 @@
 # type: ignore
+import json
 import mock
 from mock import patch
 import os
@@ -278,6 +279,123 @@ default via fe80::2480:28ec:5097:3fe2 dev wlp2s0 proto ra metric 20600 pref medi
         result = cd.dict_get_join({'a': 1}, 'a')
         assert result == 1
 
+    @mock.patch('cephadm.call')
+    def test_get_unit_states(self, call):
+        call.return_value = ('UnitFileState=enabled\nActiveState=active\nSubState=running\n'
+                             '\n'
+                             'UnitFileState=disabled\nActiveState=inactive\nSubState=dead\n'
+                             '\n'
+                             'UnitFileState=enabled\nActiveState=activating\nSubState=auto-restart\n',
+                             '', 0)
+        cd.logger = mock.Mock()
+        assert cd.get_unit_states(['a', 'b', 'c']) == {
+            'a': (True, 'running', True),
+            'b': (False, 'stopped', True),
+            'c': (True, 'error', True),
+        }
+        assert call.call_count == 1
+
+    @mock.patch('cephadm.call')
+    def test_get_container_stats(self, call):
+        call.side_effect = [
+            ('ceph-fsid-mon.a\n/ceph-fsid-osd.0\nsomething-else\n', '', 0),
+            ('ceph-fsid-mon.a,id1,image,sha256:iid,2020-03-03 15:52:30,15.2.4\n'
+             '/ceph-fsid-osd.0,id2,image,iid,2020-03-03 15:52:30,\n', '', 0),
+        ]
+        cd.logger = mock.Mock()
+        with mock.patch.object(cd, 'container_path', '/usr/bin/docker'):
+            stats = cd.get_container_stats(
+                ['ceph-fsid-mon.a', 'ceph-fsid-osd.0', 'ceph-fsid-osd.1'])
+        assert stats == {
+            'ceph-fsid-mon.a': ('id1', 'image', 'sha256:iid', '2020-03-03 15:52:30', '15.2.4'),
+            'ceph-fsid-osd.0': ('id2', 'image', 'iid', '2020-03-03 15:52:30', ''),
+        }
+        # osd.1 has no container, so it is not inspected
+        assert call.call_args[0][0][-2:] == ['ceph-fsid-mon.a', 'ceph-fsid-osd.0']
+
+    @mock.patch('cephadm.add_daemon_details')
+    @mock.patch('cephadm.show_units')
+    def test_get_daemon_changes(self, show_units, add_daemon_details, tmpdir):
+        cd.logger = mock.Mock()
+        cd.args = cd._parse_args(['--data-dir', str(tmpdir), 'ls'])
+        a = {'style': 'cephadm:v1', 'fsid': 'fsid', 'name': 'mon.a',
+             'systemd_unit': 'ceph-fsid@mon.a'}
+        b = {'style': 'cephadm:v1', 'fsid': 'fsid', 'name': 'osd.0',
+             'systemd_unit': 'ceph-fsid@osd.0'}
+        props = {'ActiveState': 'active', 'InvocationID': '1'}
+        show_units.return_value = [props, props]
+
+        def detailed():
+            return [d['name'] for d in add_daemon_details.call_args[0][0]]
+
+        with mock.patch.object(cd, 'LOCK_DIR', str(tmpdir)):
+            r = cd.get_daemon_changes([dict(a), dict(b)], '0')
+            assert r['full']
+            assert [d['name'] for d in r['daemons']] == ['mon.a', 'osd.0']
+            assert detailed() == ['mon.a', 'osd.0']
+            gen = r['generation']
+
+            # nothing changed: no details are collected
+            r = cd.get_daemon_changes([dict(a), dict(b)], gen)
+            assert not r['full']
+            assert r['generation'] == gen
+            assert r['daemons'] == []
+            assert detailed() == []
+            assert [d['name'] for d in r['unchanged']] == ['mon.a', 'osd.0']
+
+            # osd.0 was restarted
+            show_units.return_value = [props, dict(props, InvocationID='2')]
+            r = cd.get_daemon_changes([dict(a), dict(b)], gen)
+            assert r['generation'] != gen
+            assert [d['name'] for d in r['daemons']] == ['osd.0']
+            assert detailed() == ['osd.0']
+            assert [d['name'] for d in r['unchanged']] == ['mon.a']
+
+            # a caller that already saw that change gets nothing new
+            r2 = cd.get_daemon_changes([dict(a), dict(b)], r['generation'])
+            assert r2['daemons'] == []
+
+            # mon.a was reconfigured
+            os.makedirs(os.path.join(str(tmpdir), 'fsid', 'mon.a'))
+            with open(os.path.join(str(tmpdir), 'fsid', 'mon.a', 'unit.configured'), 'w'):
+                pass
+            r2 = cd.get_daemon_changes([dict(a), dict(b)], r['generation'])
+            assert [d['name'] for d in r2['daemons']] == ['mon.a']
+
+            # without unit states, every daemon is reported as changed
+            show_units.return_value = None
+            r3 = cd.get_daemon_changes([dict(a), dict(b)], r2['generation'])
+            assert [d['name'] for d in r3['daemons']] == ['mon.a', 'osd.0']
+
+            # generation of a lost state is not trusted
+            show_units.return_value = [props, props]
+            os.unlink(cd.get_ls_state_path())
+            r = cd.get_daemon_changes([dict(a), dict(b)], r3['generation'])
+            assert r['full']
+            assert [d['name'] for d in r['daemons']] == ['mon.a', 'osd.0']
+
+    @mock.patch('cephadm.list_networks')
+    def test_batch(self, list_networks, capsys):
+        list_networks.return_value = {'10.0.0.0/8': ['10.1.2.3']}
+        cmds = [
+            {'argv': ['list-networks']},
+            {'argv': ['no-such-command']},
+            {'argv': ['batch']},
+        ]
+        cd.args = cd._parse_args(['batch'])
+        with mock.patch.object(cd, 'logger', mock.Mock(handlers=[]), create=True), \
+                mock.patch.object(cd, 'container_path', '/usr/bin/podman'), \
+                mock.patch.object(cd, 'injected_stdin', json.dumps(cmds), create=True):
+            assert cd.command_batch() == 0
+        out = json.loads(capsys.readouterr().out)
+        assert len(out) == 3
+        assert out[0]['code'] == 0
+        assert json.loads(out[0]['out']) == {'10.0.0.0/8': ['10.1.2.3']}
+        assert out[1]['code'] == 2
+        assert 'invalid choice' in out[1]['err']
+        assert out[2] == {'out': '', 'err': 'ERROR: batch can not be nested\n', 'code': 1}
+        assert cd.args.func == cd.command_batch
+
 
 class TestCustomContainer(unittest.TestCase):
     cc: cd.CustomContainer
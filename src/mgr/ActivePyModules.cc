@@ -851,6 +851,64 @@ PyObject* ActivePyModules::get_perf_schema_python(
   return f.get();
 }
 
+PyObject* ActivePyModules::get_latest_perf_counters_python(
+    const std::string &svc_type,
+    const std::string &svc_id,
+    int prio_limit)
+{
+  PyThreadState *tstate = PyEval_SaveThread();
+  std::lock_guard l(lock);
+  PyEval_RestoreThread(tstate);
+
+  DaemonStateCollection daemons;
+
+  if (svc_type == "") {
+    daemons = daemon_state.get_all();
+  } else if (svc_id.empty()) {
+    daemons = daemon_state.get_by_service(svc_type);
+  } else {
+    auto key = DaemonKey{svc_type, svc_id};
+    auto got = daemon_state.get(key);
+    if (got != nullptr) {
+      daemons[key] = got;
+    }
+  }
+
+  // schema and latest value of every counter in one go, so that callers
+  // scraping all daemons do not need a call per counter
+  PyFormatter f;
+  for (auto& [key, state] : daemons) {
+    f.open_object_section(ceph::to_string(key).c_str());
+
+    std::lock_guard l(state->lock);
+    for (auto& [counter_name, counter_instance] : state->perf_counters.instances) {
+      const auto &type = state->perf_counters.types[counter_name];
+      if (type.priority < prio_limit) {
+        continue;
+      }
+      f.open_object_section(counter_name.c_str());
+      f.dump_string("description", type.description);
+      if (!type.nick.empty()) {
+        f.dump_string("nick", type.nick);
+      }
+      f.dump_unsigned("type", type.type);
+      f.dump_unsigned("priority", type.priority);
+      f.dump_unsigned("units", type.unit);
+      if (type.type & PERFCOUNTER_LONGRUNAVG) {
+        const auto &avg_data = counter_instance.get_data_avg();
+        f.dump_unsigned("value", avg_data.empty() ? 0 : avg_data.back().s);
+        f.dump_unsigned("count", avg_data.empty() ? 0 : avg_data.back().c);
+      } else {
+        const auto &data = counter_instance.get_data();
+        f.dump_unsigned("value", data.empty() ? 0 : data.back().v);
+      }
+      f.close_section();
+    }
+    f.close_section();
+  }
+  return f.get();
+}
+
 PyObject *ActivePyModules::get_context()
 {
   PyThreadState *tstate = PyEval_SaveThread();
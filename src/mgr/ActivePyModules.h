@@ -93,6 +93,10 @@ public:
   PyObject *get_perf_schema_python(
      const std::string &svc_type,
      const std::string &svc_id);
+  PyObject *get_latest_perf_counters_python(
+     const std::string &svc_type,
+     const std::string &svc_id,
+     int prio_limit);
   PyObject *get_context();
   PyObject *get_osdmap();
   PyObject *with_perf_counters(
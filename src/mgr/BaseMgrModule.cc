@@ -634,6 +634,21 @@ get_perf_schema(BaseMgrModule *self, PyObject *args)
   return self->py_modules->get_perf_schema_python(type_str, svc_id);
 }
 
+static PyObject*
+get_latest_perf_counters(BaseMgrModule *self, PyObject *args)
+{
+  char *type_str = nullptr;
+  char *svc_id = nullptr;
+  int prio_limit = 0;
+  if (!PyArg_ParseTuple(args, "ssi:get_latest_perf_counters", &type_str,
+                        &svc_id, &prio_limit)) {
+    return nullptr;
+  }
+
+  return self->py_modules->get_latest_perf_counters_python(
+      type_str, svc_id, prio_limit);
+}
+
 static PyObject *
 ceph_get_osdmap(BaseMgrModule *self, PyObject *args)
 {
@@ -1137,6 +1152,10 @@ PyMethodDef BaseMgrModule_methods[] = {
   {"_ceph_get_perf_schema", (PyCFunction)get_perf_schema, METH_VARARGS,
     "Get the performance counter schema"},
 
+  {"_ceph_get_latest_perf_counters", (PyCFunction)get_latest_perf_counters,
+    METH_VARARGS,
+    "Get the performance counter schema and latest values"},
+
   {"_ceph_log", (PyCFunction)ceph_log, METH_VARARGS,
    "Emit a (local) log message"},
 
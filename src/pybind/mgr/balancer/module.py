@@ -4,8 +4,10 @@ Balance PG distribution across OSDs.
 
 import copy
 import errno
+import itertools
 import json
 import math
+import operator
 import random
 import time
 from mgr_module import MgrModule, CommandResult
@@ -13,8 +15,35 @@ from threading import Event
 from mgr_module import CRUSHMap
 import datetime
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 TIME_FORMAT = '%Y-%m-%d_%H:%M:%S'
 
+# pads the rows of PGs with a shorter up set in MappingState.get_pg_up_array()
+NO_OSD = -1
+
+
+def sum_by_osd(osds, *values):
+    """
+    Count how often each OSD occurs in the array ``osds`` and sum up each of
+    the ``values`` arrays per OSD. Returns one dict per result, with the OSDs
+    ordered by their first occurrence.
+    """
+    uniq, first, inverse = np.unique(osds, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    keys = uniq[order].tolist()
+    counts = np.bincount(inverse, minlength=len(uniq))
+    r = [dict(zip(keys, counts[order].tolist()))]
+    for v in values:
+        sums = np.zeros(len(uniq), dtype=np.int64)
+        np.add.at(sums, inverse, v)
+        r.append(dict(zip(keys, sums[order].tolist())))
+    return r
+
+
 class MappingState:
     def __init__(self, osdmap, raw_pg_stats, raw_pool_stats, desc=''):
         self.desc = desc
@@ -36,13 +65,59 @@ class MappingState:
             self.pg_up_by_poolid[poolid] = osdmap.map_pool_pgs_up(poolid)
             for a,b in self.pg_up_by_poolid[poolid].items():
                 self.pg_up[a] = b
+        # arrays of the PGs of each pool, see get_pg_up_array() and
+        # get_pg_stat_arrays()
+        self.pg_up_arrays = {}
+        self.pg_stat_arrays = {}
+
+    def get_pg_up_array(self, poolid):
+        """
+        Return the up OSDs of the PGs of a pool, in pg_up order, as an array
+        with one row per PG, padded with NO_OSD.
+        """
+        if poolid not in self.pg_up_arrays:
+            pm = self.pg_up_by_poolid[poolid]
+            lens = np.fromiter(map(len, pm.values()), dtype=np.int64, count=len(pm))
+            flat = np.fromiter(itertools.chain.from_iterable(pm.values()),
+                               dtype=np.int64, count=int(lens.sum()))
+            up = np.full((len(pm), int(lens.max(initial=0))), NO_OSD, dtype=np.int64)
+            rows = np.repeat(np.arange(len(pm)), lens)
+            cols = np.arange(len(flat)) - np.repeat(np.cumsum(lens) - lens, lens)
+            up[rows, cols] = flat
+            self.pg_up_arrays[poolid] = up
+        return self.pg_up_arrays[poolid]
+
+    def get_pg_stat_arrays(self, poolid):
+        """
+        Return the number of objects and of bytes of the PGs of a pool, in
+        pg_up order, as two arrays.
+        """
+        pgids = list(self.pg_up_by_poolid[poolid])
+        cached = self.pg_stat_arrays.get(poolid)
+        if cached is None or cached[0] != pgids:
+            empty = {'num_objects': 0, 'num_bytes': 0}
+            stats = [self.pg_stat.get(pgid, empty) for pgid in pgids]
+            objects = np.fromiter(map(operator.itemgetter('num_objects'), stats),
+                                  dtype=np.int64, count=len(stats))
+            bytes = np.fromiter(map(operator.itemgetter('num_bytes'), stats),
+                                dtype=np.int64, count=len(stats))
+            cached = self.pg_stat_arrays[poolid] = (pgids, objects, bytes)
+        return cached[1], cached[2]
 
     def calc_misplaced_from(self, other_ms):
         num = len(other_ms.pg_up)
         misplaced = 0
-        for pgid, before in other_ms.pg_up.items():
-            if before != self.pg_up.get(pgid, []):
-                misplaced += 1
+        for poolid, other_pm in other_ms.pg_up_by_poolid.items():
+            pm = self.pg_up_by_poolid.get(poolid, {})
+            if np is not None and list(pm) == list(other_pm):
+                up = self.get_pg_up_array(poolid)
+                other_up = other_ms.get_pg_up_array(poolid)
+                if up.shape == other_up.shape:
+                    misplaced += int((up != other_up).any(axis=1).sum())
+                    continue
+            for pgid, before in other_pm.items():
+                if before != self.pg_up.get(pgid, []):
+                    misplaced += 1
         if num > 0:
             return float(misplaced) / float(num)
         return 0.0
@@ -70,10 +145,13 @@ class MsPlan(Plan):
     def final_state(self):
         self.inc.set_osd_reweights(self.osd_weights)
         self.inc.set_crush_compat_weight_set_weights(self.compat_ws)
-        return MappingState(self.initial.osdmap.apply_incremental(self.inc),
-                            self.initial.raw_pg_stats,
-                            self.initial.raw_pool_stats,
-                            'plan %s final' % self.name)
+        ms = MappingState(self.initial.osdmap.apply_incremental(self.inc),
+                          self.initial.raw_pg_stats,
+                          self.initial.raw_pool_stats,
+                          'plan %s final' % self.name)
+        # same pg stats, no need to convert them again
+        ms.pg_stat_arrays = self.initial.pg_stat_arrays
+        return ms
 
     def dump(self):
         return json.dumps(self.inc.dump(), indent=4, sort_keys=True)
@@ -713,6 +791,83 @@ class Module(MgrModule):
         if name in self.plans:
             del self.plans[name]
 
+    def calc_pool_actual_slow(self, pe, ms, pool, poolid, actual_by_root):
+        pm = ms.pg_up_by_poolid[poolid]
+        pgs = 0
+        objects = 0
+        bytes = 0
+        pgs_by_osd = {}
+        objects_by_osd = {}
+        bytes_by_osd = {}
+        for pgid, up in pm.items():
+            for osd in [int(osd) for osd in up]:
+                if osd == CRUSHMap.ITEM_NONE:
+                    continue
+                if osd not in pgs_by_osd:
+                    pgs_by_osd[osd] = 0
+                    objects_by_osd[osd] = 0
+                    bytes_by_osd[osd] = 0
+                pgs_by_osd[osd] += 1
+                objects_by_osd[osd] += ms.pg_stat[pgid]['num_objects']
+                bytes_by_osd[osd] += ms.pg_stat[pgid]['num_bytes']
+                # pick a root to associate this pg instance with.
+                # note that this is imprecise if the roots have
+                # overlapping children.
+                # FIXME: divide bytes by k for EC pools.
+                for root in pe.pool_roots[pool]:
+                    if osd in pe.target_by_root[root]:
+                        actual_by_root[root]['pgs'][osd] += 1
+                        actual_by_root[root]['objects'][osd] += ms.pg_stat[pgid]['num_objects']
+                        actual_by_root[root]['bytes'][osd] += ms.pg_stat[pgid]['num_bytes']
+                        pgs += 1
+                        objects += ms.pg_stat[pgid]['num_objects']
+                        bytes += ms.pg_stat[pgid]['num_bytes']
+                        pe.total_by_root[root]['pgs'] += 1
+                        pe.total_by_root[root]['objects'] += ms.pg_stat[pgid]['num_objects']
+                        pe.total_by_root[root]['bytes'] += ms.pg_stat[pgid]['num_bytes']
+                        break
+        return pgs, objects, bytes, pgs_by_osd, objects_by_osd, bytes_by_osd
+
+    def calc_pool_actual(self, pe, ms, pool, poolid, actual_by_root):
+        """
+        Same as calc_pool_actual_slow(), on the arrays of the MappingState.
+        """
+        up = ms.get_pg_up_array(poolid)
+        pg_objects, pg_bytes = ms.get_pg_stat_arrays(poolid)
+        # one entry per pg instance, in the order of the loop above
+        rows, cols = np.nonzero((up != NO_OSD) & (up != CRUSHMap.ITEM_NONE))
+        osds = up[rows, cols]
+        objects_by_instance = pg_objects[rows]
+        bytes_by_instance = pg_bytes[rows]
+        pgs_by_osd, objects_by_osd, bytes_by_osd = sum_by_osd(
+            osds, objects_by_instance, bytes_by_instance)
+
+        pgs = 0
+        objects = 0
+        bytes = 0
+        unassigned = np.ones(len(osds), dtype=bool)
+        for root in pe.pool_roots[pool]:
+            root_osds = np.fromiter(pe.target_by_root[root], dtype=np.int64,
+                                    count=len(pe.target_by_root[root]))
+            in_root = unassigned & np.isin(osds, root_osds)
+            unassigned &= ~in_root
+            root_pgs, root_objects, root_bytes = sum_by_osd(
+                osds[in_root], objects_by_instance[in_root], bytes_by_instance[in_root])
+            for osd, v in root_pgs.items():
+                actual_by_root[root]['pgs'][osd] += v
+                actual_by_root[root]['objects'][osd] += root_objects[osd]
+                actual_by_root[root]['bytes'][osd] += root_bytes[osd]
+            n = int(in_root.sum())
+            o = int(objects_by_instance[in_root].sum())
+            b = int(bytes_by_instance[in_root].sum())
+            pgs += n
+            objects += o
+            bytes += b
+            pe.total_by_root[root]['pgs'] += n
+            pe.total_by_root[root]['objects'] += o
+            pe.total_by_root[root]['bytes'] += b
+        return pgs, objects, bytes, pgs_by_osd, objects_by_osd, bytes_by_osd
+
     def calc_eval(self, ms, pools):
         pe = Eval(ms)
         pool_rule = {}
@@ -787,41 +942,12 @@ class Module(MgrModule):
 
         # pool and root actual
         for pool, pi in pool_info.items():
-            poolid = pi['pool']
-            pm = ms.pg_up_by_poolid[poolid]
-            pgs = 0
-            objects = 0
-            bytes = 0
-            pgs_by_osd = {}
-            objects_by_osd = {}
-            bytes_by_osd = {}
-            for pgid, up in pm.items():
-                for osd in [int(osd) for osd in up]:
-                    if osd == CRUSHMap.ITEM_NONE:
-                        continue
-                    if osd not in pgs_by_osd:
-                        pgs_by_osd[osd] = 0
-                        objects_by_osd[osd] = 0
-                        bytes_by_osd[osd] = 0
-                    pgs_by_osd[osd] += 1
-                    objects_by_osd[osd] += ms.pg_stat[pgid]['num_objects']
-                    bytes_by_osd[osd] += ms.pg_stat[pgid]['num_bytes']
-                    # pick a root to associate this pg instance with.
-                    # note that this is imprecise if the roots have
-                    # overlapping children.
-                    # FIXME: divide bytes by k for EC pools.
-                    for root in pe.pool_roots[pool]:
-                        if osd in pe.target_by_root[root]:
-                            actual_by_root[root]['pgs'][osd] += 1
-                            actual_by_root[root]['objects'][osd] += ms.pg_stat[pgid]['num_objects']
-                            actual_by_root[root]['bytes'][osd] += ms.pg_stat[pgid]['num_bytes']
-                            pgs += 1
-                            objects += ms.pg_stat[pgid]['num_objects']
-                            bytes += ms.pg_stat[pgid]['num_bytes']
-                            pe.total_by_root[root]['pgs'] += 1
-                            pe.total_by_root[root]['objects'] += ms.pg_stat[pgid]['num_objects']
-                            pe.total_by_root[root]['bytes'] += ms.pg_stat[pgid]['num_bytes']
-                            break
+            if np is not None:
+                calc_pool_actual = self.calc_pool_actual
+            else:
+                calc_pool_actual = self.calc_pool_actual_slow
+            pgs, objects, bytes, pgs_by_osd, objects_by_osd, bytes_by_osd = \
+                calc_pool_actual(pe, ms, pool, pi['pool'], actual_by_root)
             pe.count_by_pool[pool] = {
                 'pgs': {
                     k: v
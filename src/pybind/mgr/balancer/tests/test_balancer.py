@@ -0,0 +1,174 @@
+import contextlib
+import logging
+import random
+import time
+
+from tests import mock
+
+import pytest
+
+from balancer.module import Module, MappingState
+
+# CRUSHMap is mocked in unit tests
+ITEM_NONE = 0x7fffffff
+
+
+@pytest.fixture(autouse=True)
+def crush_map():
+    with mock.patch('balancer.module.CRUSHMap', mock.Mock(ITEM_NONE=ITEM_NONE)):
+        yield
+
+
+class FakeCRUSH(object):
+    def __init__(self, roots):
+        # root id -> (name, osd -> weight)
+        self.roots = roots
+
+    def dump(self):
+        return {}
+
+    def find_takes(self):
+        return list(self.roots)
+
+    def get_item_name(self, item):
+        return self.roots[item][0]
+
+    def get_take_weight_osd_map(self, root):
+        return dict(self.roots[root][1])
+
+
+class FakeOSDMap(object):
+    def __init__(self, num_osds, pools, pg_up, crush):
+        self.num_osds = num_osds
+        # pool id -> (root id, size)
+        self.pools = pools
+        self.pg_up = pg_up
+        self.crush = crush
+
+    def dump(self):
+        return {
+            'pools': [{'pool': poolid, 'pool_name': 'pool%d' % poolid, 'crush_rule': 0}
+                      for poolid in self.pools],
+            'osds': [{'osd': osd, 'weight': 1.0 if osd % 7 else 0.5}
+                     for osd in range(self.num_osds)],
+        }
+
+    def get_crush(self):
+        return self.crush
+
+    def get_pools_by_take(self, take):
+        return [poolid for poolid, (root, _) in self.pools.items() if root == take]
+
+    def map_pool_pgs_up(self, poolid):
+        return self.pg_up[poolid]
+
+
+def make_cluster(num_osds, num_pgs, seed=0):
+    rand = random.Random(seed)
+    half = num_osds // 2
+    roots = {
+        -1: ('default', {osd: rand.uniform(0.5, 2.0) for osd in range(half)}),
+        -2: ('ssd', {osd: rand.uniform(0.5, 2.0) for osd in range(half, num_osds)}),
+    }
+    # a replicated and an EC pool on default, a replicated one on ssd
+    pools = {1: (-1, 3), 2: (-1, 4), 3: (-2, 2)}
+    pg_up = {}
+    pg_stats = []
+    for poolid, (root, size) in pools.items():
+        osds = list(roots[root][1])
+        pg_up[poolid] = {}
+        for ps in range(num_pgs // len(pools)):
+            pgid = '%d.%x' % (poolid, ps)
+            up = rand.sample(osds, size)
+            if poolid == 2 and ps % 11 == 0:
+                up[rand.randrange(size)] = ITEM_NONE
+            if ps % 13 == 0:
+                # degraded
+                up = up[:-1]
+            pg_up[poolid][pgid] = up
+            pg_stats.append({'pgid': pgid, 'stat_sum': {
+                'num_objects': rand.randrange(10000),
+                'num_bytes': rand.randrange(1 << 40),
+            }})
+    osdmap = FakeOSDMap(num_osds, pools, pg_up, FakeCRUSH(roots))
+    return MappingState(osdmap, {'pg_stats': pg_stats},
+                        {'pool_stats': [{'poolid': poolid} for poolid in pools]},
+                        'test')
+
+
+def remap(ms, fraction, seed=0):
+    rand = random.Random(seed)
+    pg_up = {}
+    for poolid, pm in ms.pg_up_by_poolid.items():
+        pg_up[poolid] = dict(pm)
+        for pgid, up in pm.items():
+            if rand.random() < fraction:
+                pg_up[poolid][pgid] = list(reversed(up))
+    osdmap = FakeOSDMap(ms.osdmap.num_osds, ms.osdmap.pools, pg_up, ms.crush)
+    return MappingState(osdmap, ms.raw_pg_stats, ms.raw_pool_stats, 'remapped')
+
+
+class FakeModule(object):
+    log = logging.getLogger(__name__)
+
+    calc_eval = Module.calc_eval
+    calc_pool_actual = Module.calc_pool_actual
+    calc_pool_actual_slow = Module.calc_pool_actual_slow
+
+    def get_module_option(self, key):
+        assert key == 'crush_compat_metrics'
+        return 'pgs,objects,bytes'
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_calc_eval_vectorized(seed):
+    ms = make_cluster(40, 3000, seed)
+    fast = FakeModule().calc_eval(ms, [])
+    with mock.patch('balancer.module.np', None):
+        slow = FakeModule().calc_eval(ms, [])
+    assert fast.show(verbose=True) == slow.show(verbose=True)
+    assert fast.score == slow.score
+
+    pools = ['pool1', 'pool3']
+    fast = FakeModule().calc_eval(ms, pools)
+    with mock.patch('balancer.module.np', None):
+        slow = FakeModule().calc_eval(ms, pools)
+    assert fast.show(verbose=True) == slow.show(verbose=True)
+
+
+def test_calc_misplaced_vectorized():
+    ms = make_cluster(40, 3000)
+    other = remap(ms, 0.1)
+    misplaced = other.calc_misplaced_from(ms)
+    with mock.patch('balancer.module.np', None):
+        assert misplaced == remap(ms, 0.1).calc_misplaced_from(ms)
+    assert 0.05 < misplaced < 0.15
+    assert ms.calc_misplaced_from(ms) == 0.0
+
+
+def bench(num_osds=1000, num_pgs=100000, iterations=5):
+    """
+    Compare the vectorized and the pure Python scoring engine. Run with
+    ``UNITTEST=true python -m balancer.tests.test_balancer``.
+    """
+    ms = make_cluster(num_osds, num_pgs)
+    other = remap(ms, 0.05)
+    for name, np_patch in (('python', mock.patch('balancer.module.np', None)),
+                           ('numpy', contextlib.nullcontext())):
+        with np_patch:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                # a fresh MappingState per iteration, like crush_compat
+                # does; it shares the pg stats of the initial one
+                ms.pg_up_arrays = {}
+                other.pg_up_arrays = {}
+                FakeModule().calc_eval(ms, [])
+                other.calc_misplaced_from(ms)
+            duration = (time.perf_counter() - start) / iterations
+        print('%-6s %d osds, %d pgs: %.3fs per iteration' % (
+            name, num_osds, num_pgs, duration))
+
+
+if __name__ == '__main__':
+    with mock.patch('balancer.module.CRUSHMap', mock.Mock(ITEM_NONE=ITEM_NONE)):
+        bench()
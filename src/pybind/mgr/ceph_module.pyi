@@ -47,6 +47,7 @@ class BaseMgrModule(object):
     def _ceph_get_perf_schema(self, svc_type, svc_name):...
     def _ceph_get_counter(self, svc_type, svc_name, path):...
     def _ceph_get_latest_counter(self, svc_type, svc_name, path):...
+    def _ceph_get_latest_perf_counters(self, svc_type, svc_name, prio_limit):...
     def _ceph_get_metadata(self, svc_type, svc_id):...
     def _ceph_get_daemon_status(self, svc_type, svc_id):...
     def _ceph_send_command(self, *args, **kwargs):...
@@ -17,6 +17,9 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 HOST_CACHE_PREFIX = "host."
+
+# weight of the latest sample in the per-host refresh latency average
+REFRESH_LATENCY_ALPHA = 0.3
 SPEC_STORE_PREFIX = "spec."
 
 
@@ -169,6 +172,8 @@ class HostCache():
         self.mgr: CephadmOrchestrator = mgr
         self.daemons = {}   # type: Dict[str, Dict[str, orchestrator.DaemonDescription]]
         self.last_daemon_update = {}   # type: Dict[str, datetime.datetime]
+        # generation of the daemon state on the host, as reported by `cephadm ls`
+        self.daemon_generation = {}    # type: Dict[str, str]
         self.devices = {}              # type: Dict[str, List[inventory.Device]]
         self.osdspec_previews = {}     # type: Dict[str, List[Dict[str, Any]]]
         self.networks = {}             # type: Dict[str, Dict[str, List[str]]]
@@ -186,6 +191,10 @@ class HostCache():
 
         self.scheduled_daemon_actions: Dict[str, Dict[str, str]] = {}
 
+        # moving average and last value of the refresh duration, in seconds
+        self.refresh_latency: Dict[str, float] = {}
+        self.last_refresh_duration: Dict[str, float] = {}
+
     def load(self):
         # type: () -> None
         for k, v in self.mgr.get_store_prefix(HOST_CACHE_PREFIX).items():
@@ -200,9 +209,13 @@ class HostCache():
                     self.last_device_update[host] = str_to_datetime(j['last_device_update'])
                 else:
                     self.device_refresh_queue.append(host)
-                # for services, we ignore the persisted last_*_update
-                # and always trigger a new scrape on mgr restart.
+                # for services, we always trigger a new scrape on mgr restart.
+                # If we know the generation of the persisted daemons, trust
+                # them until then; the scrape only needs to fetch the changes.
                 self.daemon_refresh_queue.append(host)
+                if 'daemon_generation' in j and 'last_daemon_update' in j:
+                    self.daemon_generation[host] = j['daemon_generation']
+                    self.last_daemon_update[host] = str_to_datetime(j['last_daemon_update'])
                 self.daemons[host] = {}
                 self.osdspec_previews[host] = []
                 self.devices[host] = []
@@ -239,10 +252,14 @@ class HostCache():
                     host, e))
                 pass
 
-    def update_host_daemons(self, host, dm):
-        # type: (str, Dict[str, orchestrator.DaemonDescription]) -> None
+    def update_host_daemons(self, host, dm, generation=None):
+        # type: (str, Dict[str, orchestrator.DaemonDescription], Optional[str]) -> None
         self.daemons[host] = dm
         self.last_daemon_update[host] = datetime.datetime.utcnow()
+        if generation:
+            self.daemon_generation[host] = generation
+        elif host in self.daemon_generation:
+            del self.daemon_generation[host]
 
     def update_host_devices_networks(self, host, dls, nets):
         # type: (str, List[inventory.Device], Dict[str,List[str]]) -> None
@@ -280,6 +297,9 @@ class HostCache():
         self.daemon_refresh_queue.append(host)
         if host in self.last_daemon_update:
             del self.last_daemon_update[host]
+        # explicit invalidations get a full scrape
+        if host in self.daemon_generation:
+            del self.daemon_generation[host]
         self.mgr.event.set()
 
     def invalidate_host_devices(self, host):
@@ -301,6 +321,8 @@ class HostCache():
         }
         if host in self.last_daemon_update:
             j['last_daemon_update'] = datetime_to_str(self.last_daemon_update[host])
+        if host in self.daemon_generation:
+            j['daemon_generation'] = self.daemon_generation[host]
         if host in self.last_device_update:
             j['last_device_update'] = datetime_to_str(self.last_device_update[host])
         for name, dd in self.daemons[host].items():
@@ -340,14 +362,38 @@ class HostCache():
             del self.networks[host]
         if host in self.last_daemon_update:
             del self.last_daemon_update[host]
+        if host in self.daemon_generation:
+            del self.daemon_generation[host]
         if host in self.last_device_update:
             del self.last_device_update[host]
         if host in self.daemon_config_deps:
             del self.daemon_config_deps[host]
         if host in self.scheduled_daemon_actions:
             del self.scheduled_daemon_actions[host]
+        if host in self.refresh_latency:
+            del self.refresh_latency[host]
+        if host in self.last_refresh_duration:
+            del self.last_refresh_duration[host]
         self.mgr.set_store(HOST_CACHE_PREFIX + host, None)
 
+    def update_refresh_latency(self, host: str, seconds: float) -> None:
+        self.last_refresh_duration[host] = seconds
+        if host in self.refresh_latency:
+            self.refresh_latency[host] += REFRESH_LATENCY_ALPHA * \
+                (seconds - self.refresh_latency[host])
+        else:
+            self.refresh_latency[host] = seconds
+
+    def get_hosts_by_refresh_priority(self) -> List[str]:
+        """
+        Hosts whose daemons were refreshed longest ago come first. Among
+        equally stale hosts, slow ones come first so they start early.
+        """
+        def key(host: str) -> Tuple[datetime.datetime, float]:
+            return (self.last_daemon_update.get(host, datetime.datetime.min),
+                    -self.refresh_latency.get(host, 0.0))
+        return sorted(self.get_hosts(), key=key)
+
     def get_hosts(self):
         # type: () -> List[str]
         r = []
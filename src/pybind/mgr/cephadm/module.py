@@ -1,8 +1,10 @@
 import json
 import errno
+import queue
+import hashlib
 import logging
 import shlex
-from collections import defaultdict
+from collections import defaultdict, deque
 from configparser import ConfigParser
 from contextlib import contextmanager
 from functools import wraps
@@ -10,7 +12,7 @@ from tempfile import TemporaryDirectory
 from threading import Event
 
 import string
-from typing import List, Dict, Optional, Callable, Tuple, TypeVar, \
+from typing import List, Dict, Deque, Optional, Callable, Tuple, TypeVar, \
     Any, Set, TYPE_CHECKING, cast, Iterator, Union, NamedTuple
 
 import datetime
@@ -20,6 +22,7 @@ import tempfile
 import multiprocessing.pool
 import shutil
 import subprocess
+import time
 
 from ceph.deployment import inventory
 from ceph.deployment.drive_group import DriveGroupSpec
@@ -69,11 +72,6 @@ except ImportError as e:
     remoto = None
     remoto_import_error = str(e)
 
-try:
-    from typing import List
-except ImportError:
-    pass
-
 logger = logging.getLogger(__name__)
 
 T = TypeVar('T')
@@ -90,6 +88,13 @@ CEPH_DATEFMT = '%Y-%m-%dT%H:%M:%S.%fZ'
 
 CEPH_TYPES = set(CEPH_UPGRADE_ORDER)
 
+# a host refresh may take this many times its average before we stop
+# waiting for it, but we always wait at least HOST_REFRESH_MIN_DEADLINE
+HOST_REFRESH_LATENCY_FACTOR = 5
+HOST_REFRESH_MIN_DEADLINE = 60
+# number of hosts refreshed concurrently
+HOST_REFRESH_WORKERS = 10
+
 
 class CephadmCompletion(orchestrator.Completion[T]):
     def evaluate(self):
@@ -147,6 +152,13 @@ class CephadmOrchestrator(orchestrator.Orchestrator, MgrModule,
             'default': 10 * 60,
             'desc': 'how frequently to perform a host check',
         },
+        {
+            'name': 'host_refresh_timeout',
+            'type': 'secs',
+            'default': 10 * 60,
+            'desc': 'maximum time to wait for a host refresh before moving on '
+                    '(hosts with a known refresh latency get a shorter deadline)',
+        },
         {
             'name': 'mode',
             'type': 'str',
@@ -293,6 +305,7 @@ class CephadmOrchestrator(orchestrator.Orchestrator, MgrModule,
             self.device_cache_timeout = 0
             self.daemon_cache_timeout = 0
             self.host_check_interval = 0
+            self.host_refresh_timeout = 0
             self.mode = ''
             self.container_image_base = ''
             self.container_image_prometheus = ''
@@ -326,8 +339,18 @@ class CephadmOrchestrator(orchestrator.Orchestrator, MgrModule,
         except (IOError, TypeError) as e:
             raise RuntimeError("unable to read cephadm at '%s': %s" % (
                 path, str(e)))
+        self._cephadm_digest = hashlib.sha256(self._cephadm.encode('utf-8')).hexdigest()
+        # hosts holding a verified copy of the current cephadm binary
+        self._cephadm_binary_hosts: Set[str] = set()
+
+        self.perf_counters: Dict[str, int] = defaultdict(int)
 
         self._worker_pool = multiprocessing.pool.ThreadPool(10)
+        # host refreshes run on their own pool, so that refreshes left
+        # behind by a pass do not hold up deployments
+        self._refresh_pool = multiprocessing.pool.ThreadPool(HOST_REFRESH_WORKERS)
+        # hosts with a refresh running, possibly left behind by an earlier pass
+        self._refreshing_hosts: Set[str] = set()
 
         self._reconfig_ssh()
 
@@ -405,6 +428,8 @@ class CephadmOrchestrator(orchestrator.Orchestrator, MgrModule,
         self.log.debug('shutdown')
         self._worker_pool.close()
         self._worker_pool.join()
+        # do not wait for refreshes that were given up on
+        self._refresh_pool.close()
         self.run = False
         self.event.set()
 
@@ -429,12 +454,13 @@ class CephadmOrchestrator(orchestrator.Orchestrator, MgrModule,
             return f"Host {host} failed to login to {url} as {username} with given password"
         return
 
-    def _check_host(self, host):
+    def _check_host(self, host, prefetched=None):
         if host not in self.inventory:
             return
         self.log.debug(' checking %s' % host)
         try:
-            out, err, code = self._run_cephadm(
+            out, err, code = self._prefetched_or_run(
+                prefetched,
                 host, cephadmNoImage, 'check-host', [],
                 error_ok=True, no_fsid=True)
             self.cache.update_last_host_check(host)
@@ -747,6 +773,7 @@ class CephadmOrchestrator(orchestrator.Orchestrator, MgrModule,
             self.log.debug('_reset_con close %s' % host)
             conn.exit()
             del self._cons[host]
+        self._cephadm_binary_hosts.discard(host)
 
     def _reset_cons(self):
         for host, conn_and_r in self._cons.items():
@@ -754,6 +781,7 @@ class CephadmOrchestrator(orchestrator.Orchestrator, MgrModule,
             conn, r = conn_and_r
             conn.exit()
         self._cons = {}
+        self._cephadm_binary_hosts = set()
 
     def offline_hosts_remove(self, host):
         if host in self.offline_hosts:
@@ -914,6 +942,22 @@ class CephadmOrchestrator(orchestrator.Orchestrator, MgrModule,
     def _get_user(self):
         return 0, self.ssh_user, ''
 
+    @orchestrator._cli_read_command(
+        'cephadm perf dump',
+        desc='Dump cephadm module performance counters')
+    def _perf_dump(self):
+        dump: Dict[str, Any] = dict(self.perf_counters)
+        dump['host_refresh'] = {
+            host: {
+                'latency_avg': self.cache.refresh_latency.get(host),
+                'last_duration': self.cache.last_refresh_duration.get(host),
+                'deadline': self._host_refresh_deadline(host),
+                'in_progress': host in self._refreshing_hosts,
+            }
+            for host in self.cache.get_hosts()
+        }
+        return 0, json.dumps(dump, indent=4, sort_keys=True), ''
+
     @orchestrator._cli_read_command(
         'cephadm set-user',
         'name=user,type=CephString',
@@ -1197,6 +1241,82 @@ To check that the host is reachable:
 
         return image
 
+    def _cephadm_argv(self,
+                      entity: Union[CephadmNoImage, str],
+                      command: str,
+                      args: List[str],
+                      no_fsid: Optional[bool] = False,
+                      image: Optional[str] = "",
+                      env_vars: Optional[List[str]] = None,
+                      ) -> List[str]:
+        """
+        Build the argv for a single cephadm invocation.
+        """
+        assert image or entity
+        if not image and entity is not cephadmNoImage:
+            image = self._get_container_image(entity)
+
+        final_args = []
+
+        if env_vars:
+            for env_var_pair in env_vars:
+                final_args.extend(['--env', env_var_pair])
+
+        if image:
+            final_args.extend(['--image', image])
+        final_args.append(command)
+
+        if not no_fsid:
+            final_args += ['--fsid', self._cluster_fsid]
+
+        # batch sub-commands carry their own options
+        if self.container_init and command != 'batch':
+            final_args += ['--container-init']
+
+        final_args += args
+        return final_args
+
+    def _run_cephadm_batch(self,
+                           host: str,
+                           calls: List[Dict[str, Any]],
+                           ) -> List[Tuple[List[str], List[str], int]]:
+        """
+        Run several cephadm commands on the remote host in one invocation
+
+        Each call is a dict of keyword arguments for ``_run_cephadm``.
+        Returns one ``(out, err, code)`` tuple per call. Failing calls do
+        not raise, but failing to reach the host does.
+        """
+        if self.mode != 'root' or len(calls) < 2:
+            # only root mode is guaranteed to run a cephadm that knows 'batch'
+            return [self._run_cephadm(host, error_ok=True, **c) for c in calls]
+
+        batch = []
+        for c in calls:
+            batch.append({
+                'argv': self._cephadm_argv(c['entity'], c['command'], c['args'],
+                                           no_fsid=c.get('no_fsid', False),
+                                           image=c.get('image', ''),
+                                           env_vars=c.get('env_vars')),
+                'stdin': c.get('stdin') or None,
+            })
+        out, err, code = self._run_cephadm(host, cephadmNoImage, 'batch', [],
+                                           stdin=json.dumps(batch),
+                                           no_fsid=True, error_ok=True)
+        try:
+            results = json.loads(''.join(out))
+            if not isinstance(results, list) or len(results) != len(calls):
+                raise ValueError('expected %d results' % len(calls))
+            ret = [(r['out'].splitlines(), r['err'].splitlines(), r['code'])
+                   for r in results]
+        except (ValueError, TypeError, KeyError) as e:
+            self.log.warning('cephadm batch on %s failed (%s), falling back to single calls' % (
+                host, e))
+            return [self._run_cephadm(host, error_ok=True, **c) for c in calls]
+        self.perf_counters['cephadm_batch_calls'] += 1
+        self.perf_counters['cephadm_batched_commands'] += len(calls)
+        return ret
+
     def _run_cephadm(self,
                      host: str,
                      entity: Union[CephadmNoImage, str],
@@ -1216,46 +1336,33 @@ To check that the host is reachable:
         """
         with self._remote_connection(host, addr) as tpl:
             conn, connr = tpl
-            assert image or entity
-            if not image and entity is not cephadmNoImage:
-                image = self._get_container_image(entity)
-
-            final_args = []
-
-            if env_vars:
-                for env_var_pair in env_vars:
-                    final_args.extend(['--env', env_var_pair])
-
-            if image:
-                final_args.extend(['--image', image])
-            final_args.append(command)
-
-            if not no_fsid:
-                final_args += ['--fsid', self._cluster_fsid]
-
-            if self.container_init:
-                final_args += ['--container-init']
-
-            final_args += args
+            final_args = self._cephadm_argv(entity, command, args,
+                                            no_fsid=no_fsid, image=image, env_vars=env_vars)
 
             self.log.debug('args: %s' % (' '.join(final_args)))
             if self.mode == 'root':
                 if stdin:
                     self.log.debug('stdin: %s' % stdin)
-                script = 'injected_argv = ' + json.dumps(final_args) + '\n'
-                if stdin:
-                    script += 'injected_stdin = ' + json.dumps(stdin) + '\n'
-                script += self._cephadm
                 python = connr.choose_python()
                 if not python:
                     raise RuntimeError(
                         'unable to find python on %s (tried %s in %s)' % (
                             host, remotes.PYTHONS, remotes.PATH))
                 try:
+                    path = self._deploy_cephadm_binary(host, connr)
                     out, err, code = remoto.process.check(
                         conn,
-                        [python, '-u'],
-                        stdin=script.encode('utf-8'))
+                        [python, '-u', path] + final_args,
+                        stdin=stdin.encode('utf-8') if stdin else None)
+                    if self._cephadm_binary_missing(code, err):
+                        # someone removed our copy underneath us; repair and retry
+                        self.log.info('cephadm binary vanished from %s, redeploying' % host)
+                        self._cephadm_binary_hosts.discard(host)
+                        path = self._deploy_cephadm_binary(host, connr)
+                        out, err, code = remoto.process.check(
+                            conn,
+                            [python, '-u', path] + final_args,
+                            stdin=stdin.encode('utf-8') if stdin else None)
                 except RuntimeError as e:
                     self._reset_con(host)
                     if error_ok:
@@ -1286,6 +1393,43 @@ To check that the host is reachable:
                         code, '\n'.join(err)))
             return out, err, code
 
+    @property
+    def cephadm_binary_path(self) -> str:
+        """
+        Content-addressed location of the cephadm binary on managed hosts.
+        """
+        return '/var/lib/ceph/%s/cephadm.%s' % (self._cluster_fsid, self._cephadm_digest)
+
+    def _deploy_cephadm_binary(self, host: str, connr: Any) -> str:
+        """
+        Make sure ``host`` holds a copy of our cephadm binary at
+        ``cephadm_binary_path``, pushing it if it is missing or corrupt.
+        Copies of other cephadm versions are removed when pushing it.
+
+        The remote digest is only verified once per connection; afterwards
+        the cached copy is trusted.
+        """
+        path = self.cephadm_binary_path
+        if host in self._cephadm_binary_hosts:
+            self.perf_counters['cephadm_binary_cache_hit'] += 1
+            return path
+        if connr.file_sha256(path) == self._cephadm_digest:
+            self.perf_counters['cephadm_binary_cache_hit'] += 1
+        else:
+            self.perf_counters['cephadm_binary_cache_miss'] += 1
+            self.log.info('Deploying cephadm binary to %s:%s' % (host, path))
+            connr.write_file(path, self._cephadm, 0o700)
+            removed = connr.remove_stale_cephadm(path)
+            if removed:
+                self.log.info('Removed stale cephadm binaries from %s: %s' % (host, removed))
+        self._cephadm_binary_hosts.add(host)
+        return path
+
+    @staticmethod
+    def _cephadm_binary_missing(code: int, err: List[str]) -> bool:
+        # python exits with 2 if it can't open the script it was given
+        return code == 2 and any("can't open file" in line for line in err or [])
+
     def _hosts_with_daemon_inventory(self) -> List[HostSpec]:
         """
         Returns all hosts that went through _refresh_host_daemons().
@@ -1418,15 +1562,20 @@ To check that the host is reachable:
         bad_hosts = []
         failures = []
 
-        @forall_hosts
         def refresh(host):
-            if self.cache.host_needs_check(host):
-                r = self._check_host(host)
+            needs_check = self.cache.host_needs_check(host)
+            needs_daemons = self.cache.host_needs_daemon_refresh(host)
+            needs_devices = self.cache.host_needs_device_refresh(host)
+            prefetched = self._prefetch_host_refresh(
+                host, needs_check, needs_daemons, needs_devices)
+
+            if needs_check:
+                r = self._check_host(host, prefetched.get('check-host'))
                 if r is not None:
                     bad_hosts.append(r)
-            if self.cache.host_needs_daemon_refresh(host):
+            if needs_daemons and host not in self.offline_hosts:
                 self.log.debug('refreshing %s daemons' % host)
-                r = self._refresh_host_daemons(host)
+                r = self._refresh_host_daemons(host, prefetched.get('ls'))
                 if r:
                     failures.append(r)
 
@@ -1437,9 +1586,10 @@ To check that the host is reachable:
                 if r:
                     bad_hosts.append(r)
 
-            if self.cache.host_needs_device_refresh(host):
+            if needs_devices and host not in self.offline_hosts:
                 self.log.debug('refreshing %s devices' % host)
-                r = self._refresh_host_devices(host)
+                r = self._refresh_host_devices(host, prefetched.get('ceph-volume'),
+                                               prefetched.get('list-networks'))
                 if r:
                     failures.append(r)
 
@@ -1455,7 +1605,7 @@ To check that the host is reachable:
                 if r:
                     bad_hosts.append(r)
 
-        refresh(self.cache.get_hosts())
+        failures.extend(self._run_host_refreshes(refresh))
 
         health_changed = False
         if 'CEPHADM_HOST_CHECK_FAILED' in self.health_checks:
@@ -1483,17 +1633,180 @@ To check that the host is reachable:
         if health_changed:
             self.set_health_checks(self.health_checks)
 
-    def _refresh_host_daemons(self, host) -> Optional[str]:
+    def _host_refresh_deadline(self, host: str) -> float:
+        latency = self.cache.refresh_latency.get(host)
+        if latency is None:
+            return self.host_refresh_timeout
+        return min(self.host_refresh_timeout,
+                   max(HOST_REFRESH_MIN_DEADLINE, HOST_REFRESH_LATENCY_FACTOR * latency))
+
+    def _run_host_refreshes(self, refresh: Callable[[str], None]) -> List[str]:
+        """
+        Run ``refresh`` for all hosts on the refresh pool, stalest hosts first.
+
+        The whole pass ends after ``host_refresh_timeout``. A host with a
+        known refresh latency is given up on earlier, once it takes much
+        longer than usual. Refreshes that were given up on keep running and
+        update the cache when they complete; their hosts are skipped by later
+        passes until then. Hosts are only handed out to free workers, hosts
+        that did not get one in time are the stalest ones of the next pass.
+        Returns failure messages.
+        """
+        failures = []
+        pass_deadline = time.monotonic() + self.host_refresh_timeout
+        started: Dict[str, float] = {}
+        done: 'queue.Queue[Tuple[str, Optional[Exception]]]' = queue.Queue()
+
+        def timed_refresh(host: str) -> None:
+            error: Optional[Exception] = None
+            try:
+                refresh(host)
+            except Exception as e:
+                self.log.exception(f'refreshing host {host} failed')
+                error = e
+            finally:
+                self.cache.update_refresh_latency(host, time.monotonic() - started[host])
+                self._refreshing_hosts.discard(host)
+                done.put((host, error))
+
+        queued: Deque[str] = deque()
+        for host in self.cache.get_hosts_by_refresh_priority():
+            if host in self._refreshing_hosts:
+                failures.append(f'host {host} is still being refreshed by an earlier pass')
+                continue
+            queued.append(host)
+
+        running: Set[str] = set()
+        error: Optional[Exception] = None
+        while True:
+            now = time.monotonic()
+            while queued and now < pass_deadline and \
+                    len(self._refreshing_hosts) < HOST_REFRESH_WORKERS:
+                host = queued.popleft()
+                self._refreshing_hosts.add(host)
+                started[host] = now
+                running.add(host)
+                self._refresh_pool.apply_async(timed_refresh, (host,))
+            if not running:
+                break
+
+            deadlines = {
+                host: min(pass_deadline, started[host] + self._host_refresh_deadline(host))
+                for host in running
+            }
+            try:
+                host, e = done.get(timeout=max(min(deadlines.values()) - now, 0))
+            except queue.Empty:
+                now = time.monotonic()
+                for host, deadline in deadlines.items():
+                    if now >= deadline:
+                        running.discard(host)
+                        self.perf_counters['host_refresh_timeouts'] += 1
+                        failures.append(f'host {host} refresh did not finish within '
+                                        f'{deadline - started[host]:.0f}s')
+                continue
+            # refreshes given up on earlier in this pass are not waited for
+            if host in running:
+                running.discard(host)
+                error = error or e
+        if queued:
+            self.log.info(f'postponing the refresh of {len(queued)} hosts to the next pass')
+        if error:
+            raise error
+        return failures
+
+    def _prefetch_host_refresh(self, host: str, needs_check: bool, needs_daemons: bool,
+                               needs_devices: bool) -> Dict[str, Any]:
+        """
+        Run all cephadm commands a refresh of ``host`` needs in one batch.
+
+        Returns the ``(out, err, code)`` results keyed by command, or the
+        exception for all of them if the batch failed as a whole. Commands
+        that are not part of the result are run one by one later.
+        """
+        calls: Dict[str, Dict[str, Any]] = {}
+        if needs_check and host in self.inventory:
+            calls['check-host'] = dict(entity=cephadmNoImage, command='check-host', args=[],
+                                       no_fsid=True)
+        if needs_daemons and host not in self.offline_hosts:
+            calls['ls'] = dict(entity='mon', command='ls', args=self._ls_args(host),
+                               no_fsid=True)
+        if needs_devices and host not in self.offline_hosts:
+            calls['ceph-volume'] = dict(entity='osd', command='ceph-volume',
+                                        args=['--', 'inventory', '--format=json'])
+            calls['list-networks'] = dict(entity='mon', command='list-networks', args=[],
+                                          no_fsid=True)
+        if len(calls) < 2:
+            return {}
         try:
-            out, err, code = self._run_cephadm(
-                host, 'mon', 'ls', [], no_fsid=True)
+            results: List[Any] = self._run_cephadm_batch(host, list(calls.values()))
+        except OrchestratorError as e:
+            # host is unreachable, no point in trying again command by command
+            results = [e] * len(calls)
+        except Exception as e:
+            self.log.debug('batched refresh of %s failed: %s' % (host, e))
+            return {}
+        return dict(zip(calls.keys(), results))
+
+    def _prefetched_or_run(self, prefetched: Any, host: str, *args: Any,
+                           **kwargs: Any) -> Tuple[List[str], List[str], int]:
+        """
+        Return a result of ``_prefetch_host_refresh``, with the error semantics
+        of ``_run_cephadm``, or run the command if it was not prefetched.
+        """
+        if prefetched is None:
+            return self._run_cephadm(host, *args, **kwargs)
+        if isinstance(prefetched, Exception):
+            raise prefetched
+        out, err, code = prefetched
+        if code and not kwargs.get('error_ok'):
+            raise OrchestratorError(
+                'cephadm exited with an error code: %d, stderr:%s' % (
+                    code, '\n'.join(err)))
+        return out, err, code
+
+    def _ls_args(self, host: str) -> List[str]:
+        # only the cephadm binary we push ourselves is known to support this
+        if self.mode != 'root':
+            return []
+        return ['--since-generation', self.cache.daemon_generation.get(host, '0')]
+
+    def _refresh_host_daemons(self, host, prefetched=None) -> Optional[str]:
+        try:
+            out, err, code = self._prefetched_or_run(
+                prefetched,
+                host, 'mon', 'ls', self._ls_args(host), no_fsid=True)
             if code:
                 return 'host %s cephadm ls returned %d: %s' % (
                     host, code, err)
         except Exception as e:
             return 'host %s scrape failed: %s' % (host, e)
-        ls = json.loads(''.join(out))
+        j = json.loads(''.join(out))
         dm = {}
+        generation = None
+        if isinstance(j, dict):
+            # incremental: only daemons that changed are described
+            generation = j.get('generation')
+            ls = j.get('daemons', [])
+            if not j.get('full'):
+                cached = self.cache.daemons.get(host, {})
+                for d in j.get('unchanged', []):
+                    if not d['style'].startswith('cephadm') or \
+                            d['fsid'] != self._cluster_fsid or \
+                            '.' not in d['name']:
+                        continue
+                    if d['name'] not in cached:
+                        # we lost track; do a full scrape next time
+                        self.log.debug('Daemon %s on %s not cached, forcing full refresh' % (
+                            d['name'], host))
+                        generation = None
+                        self.cache.daemon_refresh_queue.append(host)
+                        continue
+                    sd = cached[d['name']]
+                    sd.last_refresh = datetime.datetime.utcnow()
+                    dm[sd.name()] = sd
+        else:
+            ls = j
         for d in ls:
             if not d['style'].startswith('cephadm'):
                 continue
@@ -1532,13 +1845,15 @@ To check that the host is reachable:
                 sd.status = None
             dm[sd.name()] = sd
         self.log.debug('Refreshed host %s daemons (%d)' % (host, len(dm)))
-        self.cache.update_host_daemons(host, dm)
+        self.cache.update_host_daemons(host, dm, generation)
         self.cache.save_host(host)
         return None
 
-    def _refresh_host_devices(self, host) -> Optional[str]:
+    def _refresh_host_devices(self, host, prefetched_inventory=None,
+                              prefetched_networks=None) -> Optional[str]:
         try:
-            out, err, code = self._run_cephadm(
+            out, err, code = self._prefetched_or_run(
+                prefetched_inventory,
                 host, 'osd',
                 'ceph-volume',
                 ['--', 'inventory', '--format=json'])
@@ -1549,7 +1864,8 @@ To check that the host is reachable:
             return 'host %s ceph-volume inventory failed: %s' % (host, e)
         devices = json.loads(''.join(out))
         try:
-            out, err, code = self._run_cephadm(
+            out, err, code = self._prefetched_or_run(
+                prefetched_networks,
                 host, 'mon',
                 'list-networks',
                 [],
@@ -1,6 +1,7 @@
 # ceph-deploy ftw
 import os
 import errno
+import hashlib
 import tempfile
 import shutil
 
@@ -24,6 +25,65 @@ def choose_python():
     return None
 
 
+def file_sha256(path):
+    """
+    Return the hex sha256 digest of ``path``, or None if it does not exist.
+    """
+    h = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                h.update(chunk)
+    except (IOError, OSError) as e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise
+    return h.hexdigest()
+
+
+def write_file(path, content, mode=0o600):
+    """
+    Atomically write ``content`` to ``path``, creating parent directories.
+    """
+    dirname = os.path.dirname(path)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname, 0o700)
+    fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.' + os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if not isinstance(content, bytes):
+                content = content.encode('utf-8')
+            f.write(content)
+        os.chmod(tmp, mode)
+        os.rename(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def remove_stale_cephadm(path):
+    """
+    Remove the other ``cephadm.<sha256>`` copies next to ``path``, left
+    behind by earlier versions of cephadm.
+    """
+    dirname, keep = os.path.split(path)
+    removed = []
+    for name in os.listdir(dirname):
+        digest = name[len('cephadm.'):]
+        if name == keep or not name.startswith('cephadm.') or len(digest) != 64:
+            continue
+        if not all(c in '0123456789abcdef' for c in digest):
+            continue
+        try:
+            os.unlink(os.path.join(dirname, name))
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+        removed.append(name)
+    return removed
+
+
 if __name__ == '__channelexec__':
     for item in channel:  # type: ignore
         channel.send(eval(item))  # type: ignore
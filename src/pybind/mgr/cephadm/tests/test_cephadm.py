@@ -1,5 +1,8 @@
 import datetime
 import json
+import os
+import threading
+import time
 from contextlib import contextmanager
 from unittest.mock import ANY
 
@@ -24,6 +27,7 @@ from orchestrator import ServiceDescription, DaemonDescription, InventoryHost, \
 from tests import mock
 from .fixtures import cephadm_module, wait, _run_cephadm, match_glob, with_host, \
     with_cephadm_module, with_service, assert_rm_service
+from cephadm import remotes
 from cephadm.module import CephadmOrchestrator, CEPH_DATEFMT
 
 """
@@ -176,6 +180,165 @@ class TestCephadm(object):
             c = cephadm_module.list_daemons()
             assert wait(cephadm_module, c)[0].name() == 'rgw.myrgw.foobar'
 
+    @mock.patch("cephadm.module.CephadmOrchestrator._run_cephadm")
+    def test_refresh_incremental(self, _run_cephadm, cephadm_module: CephadmOrchestrator):
+        a = dict(name='rgw.myrgw.a', style='cephadm', fsid='fsid', state='running')
+        b = dict(name='rgw.myrgw.b', style='cephadm', fsid='fsid', state='running')
+        _run_cephadm.return_value = ([json.dumps({
+            'generation': 'x:1', 'full': True, 'daemons': [a, b], 'unchanged': []})], '', 0)
+        with with_host(cephadm_module, 'test', refresh_hosts=False):
+            cephadm_module._refresh_host_daemons('test')
+            _run_cephadm.assert_called_with(
+                'test', 'mon', 'ls', ['--since-generation', '0'], no_fsid=True)
+            assert cephadm_module.cache.daemon_generation['test'] == 'x:1'
+
+            # b changed, a was removed
+            _run_cephadm.return_value = ([json.dumps({
+                'generation': 'x:2', 'full': False,
+                'daemons': [dict(b, state='error')], 'unchanged': []})], '', 0)
+            cephadm_module._refresh_host_daemons('test')
+            _run_cephadm.assert_called_with(
+                'test', 'mon', 'ls', ['--since-generation', 'x:1'], no_fsid=True)
+            dds = wait(cephadm_module, cephadm_module.list_daemons())
+            assert [(dd.name(), dd.status) for dd in dds] == [('rgw.myrgw.b', -1)]
+
+            # nothing changed
+            _run_cephadm.return_value = ([json.dumps({
+                'generation': 'x:2', 'full': False,
+                'daemons': [], 'unchanged': [dict(name=b['name'], style='cephadm', fsid='fsid')]
+            })], '', 0)
+            cephadm_module._refresh_host_daemons('test')
+            dds = wait(cephadm_module, cephadm_module.list_daemons())
+            assert [(dd.name(), dd.status) for dd in dds] == [('rgw.myrgw.b', -1)]
+
+            # the persisted generation is trusted after a restart
+            cephadm_module.cache.daemon_generation = {}
+            cephadm_module.cache.last_daemon_update = {}
+            cephadm_module.cache.load()
+            assert cephadm_module.cache.daemon_generation['test'] == 'x:2'
+            assert cephadm_module.cache.host_had_daemon_refresh('test')
+
+            # explicit invalidation asks for everything
+            cephadm_module.cache.invalidate_host_daemons('test')
+            assert 'test' not in cephadm_module.cache.daemon_generation
+
+    @mock.patch("cephadm.module.CephadmOrchestrator._run_cephadm", _run_cephadm('[]'))
+    def test_refresh_deadline(self, cephadm_module: CephadmOrchestrator):
+        with with_host(cephadm_module, 'test'), with_host(cephadm_module, 'slow'):
+            assert set(cephadm_module.cache.refresh_latency) == {'test', 'slow'}
+
+            # stalest host first
+            cephadm_module.cache.last_daemon_update['test'] = datetime.datetime.utcnow()
+            assert cephadm_module.cache.get_hosts_by_refresh_priority() == ['slow', 'test']
+
+            cephadm_module.host_refresh_timeout = 0.2
+            release = threading.Event()
+            orig = cephadm_module._refresh_host_daemons
+
+            def refresh_host_daemons(host, prefetched=None):
+                if host == 'slow':
+                    release.wait(10)
+                return orig(host, prefetched)
+
+            cephadm_module.cache.invalidate_host_daemons('test')
+            cephadm_module.cache.invalidate_host_daemons('slow')
+            with mock.patch.object(cephadm_module, '_refresh_host_daemons', refresh_host_daemons):
+                cephadm_module._refresh_hosts_and_daemons()
+                assert cephadm_module.perf_counters['host_refresh_timeouts'] == 1
+                assert cephadm_module.health_checks['CEPHADM_REFRESH_FAILED']['detail'] == [
+                    'host slow refresh did not finish within 0s']
+
+                # the slow host is not scheduled again while still running
+                cephadm_module._refresh_hosts_and_daemons()
+                assert cephadm_module.health_checks['CEPHADM_REFRESH_FAILED']['detail'] == [
+                    'host slow is still being refreshed by an earlier pass']
+
+                release.set()
+                for _ in range(100):
+                    if 'slow' not in cephadm_module._refreshing_hosts:
+                        break
+                    time.sleep(0.1)
+                assert cephadm_module.cache.host_had_daemon_refresh('slow')
+
+            dump = json.loads(cephadm_module._perf_dump()[1])
+            assert dump['host_refresh']['slow']['in_progress'] is False
+            assert dump['host_refresh']['slow']['last_duration'] > 0.2
+
+    @mock.patch("cephadm.module.HOST_REFRESH_WORKERS", 1)
+    @mock.patch("cephadm.module.CephadmOrchestrator._run_cephadm", _run_cephadm('[]'))
+    def test_refresh_pass_deadline(self, cephadm_module: CephadmOrchestrator):
+        with with_host(cephadm_module, 'test'), with_host(cephadm_module, 'slow'):
+            cephadm_module.host_refresh_timeout = 0.2
+            release = threading.Event()
+            refreshed = []
+            orig = cephadm_module._refresh_host_daemons
+
+            def refresh_host_daemons(host, prefetched=None):
+                refreshed.append(host)
+                if host == 'slow':
+                    release.wait(10)
+                return orig(host, prefetched)
+
+            cephadm_module.cache.invalidate_host_daemons('test')
+            cephadm_module.cache.invalidate_host_daemons('slow')
+            cephadm_module.cache.last_daemon_update['test'] = datetime.datetime.utcnow()
+            assert cephadm_module.cache.get_hosts_by_refresh_priority() == ['slow', 'test']
+            with mock.patch.object(cephadm_module, '_refresh_host_daemons', refresh_host_daemons):
+                start = time.monotonic()
+                cephadm_module._refresh_hosts_and_daemons()
+                # the only worker is busy with the slow host, the queued host
+                # is postponed when the pass ends
+                assert time.monotonic() - start < 5
+                assert refreshed == ['slow']
+                assert cephadm_module.health_checks['CEPHADM_REFRESH_FAILED']['detail'] == [
+                    'host slow refresh did not finish within 0s']
+
+                # no worker is free while the slow host is still running
+                cephadm_module._refresh_hosts_and_daemons()
+                assert refreshed == ['slow']
+
+                release.set()
+                for _ in range(100):
+                    if 'slow' not in cephadm_module._refreshing_hosts:
+                        break
+                    time.sleep(0.1)
+                cephadm_module._refresh_hosts_and_daemons()
+                assert 'test' in refreshed
+
+    @mock.patch("cephadm.module.CephadmOrchestrator._get_container_image", lambda _, __: 'image')
+    def test_refresh_batched(self, cephadm_module: CephadmOrchestrator):
+        ls = [dict(name='rgw.myrgw.foobar', style='cephadm', fsid='fsid', state='running')]
+        outputs = {
+            'check-host': '',
+            'ls': json.dumps(ls),
+            'ceph-volume': '[]',
+            'list-networks': json.dumps({'10.0.0.0/8': ['10.1.2.3']}),
+        }
+        batches = []
+
+        def command_of(argv):
+            return [a for a in argv if a in outputs][0]
+
+        def _run_cephadm(_, host, entity, command, args, **kwargs):
+            if command == 'batch':
+                cmds = json.loads(kwargs['stdin'])
+                batches.append(cmds)
+                return [json.dumps([
+                    {'out': outputs[command_of(c['argv'])],
+                     'err': '', 'code': 0}
+                    for c in cmds
+                ])], [], 0
+            return [outputs.get(command, '{}')], [], 0
+
+        with mock.patch("cephadm.module.CephadmOrchestrator._run_cephadm", _run_cephadm):
+            with with_host(cephadm_module, 'test'):
+                assert len(batches) == 1
+                assert [command_of(c['argv']) for c in batches[0]] == [
+                    'check-host', 'ls', 'ceph-volume', 'list-networks']
+                assert cephadm_module.cache.networks['test'] == {'10.0.0.0/8': ['10.1.2.3']}
+                c = cephadm_module.list_daemons()
+                assert wait(cephadm_module, c)[0].name() == 'rgw.myrgw.foobar'
+
     @mock.patch("cephadm.module.CephadmOrchestrator._run_cephadm", _run_cephadm('[]'))
     @mock.patch("cephadm.services.cephadmservice.RgwService.create_realm_zonegroup_zone", lambda _, __, ___: None)
     def test_daemon_action(self, cephadm_module: CephadmOrchestrator):
@@ -864,6 +1027,48 @@ class TestCephadm(object):
         with with_cephadm_module({'manage_etc_ceph_ceph_conf': True}) as m:
             assert m.manage_etc_ceph_ceph_conf is True
 
+    @mock.patch("cephadm.module.CephadmOrchestrator._get_connection")
+    @mock.patch("remoto.process.check")
+    def test_cephadm_binary_cache(self, _check, _get_connection, cephadm_module):
+        conn, connr = mock.Mock(), mock.Mock()
+        connr.choose_python.return_value = '/usr/bin/python3'
+        connr.file_sha256.return_value = None
+        connr.remove_stale_cephadm.return_value = ['cephadm.' + 'a' * 64]
+        _get_connection.return_value = conn, connr
+        _check.return_value = ['{}'], [], 0
+
+        path = cephadm_module.cephadm_binary_path
+        assert path.startswith('/var/lib/ceph/fsid/cephadm.')
+
+        with with_host(cephadm_module, 'test', refresh_hosts=False):
+            # adding the host pushed the binary, later calls reuse it
+            cephadm_module._run_cephadm('test', 'mon', 'ls', [], image='image')
+            cephadm_module._run_cephadm('test', 'mon', 'ls', [], image='image')
+            connr.write_file.assert_called_once_with(path, cephadm_module._cephadm, 0o700)
+            connr.remove_stale_cephadm.assert_called_once_with(path)
+            _check.assert_called_with(
+                conn, ['/usr/bin/python3', '-u', path, '--image', 'image', 'ls',
+                       '--fsid', 'fsid'], stdin=None)
+            assert cephadm_module.perf_counters['cephadm_binary_cache_miss'] == 1
+            assert cephadm_module.perf_counters['cephadm_binary_cache_hit'] == 2
+
+            # the remote copy vanished: repair and retry
+            _check.side_effect = [
+                ([], ["python3: can't open file '%s': [Errno 2]" % path], 2),
+                (['{}'], [], 0),
+            ]
+            out, err, code = cephadm_module._run_cephadm('test', 'mon', 'ls', [], image='image')
+            assert code == 0
+            assert connr.write_file.call_count == 2
+
+    def test_remove_stale_cephadm(self, tmpdir):
+        keep = 'cephadm.' + '1' * 64
+        stale = 'cephadm.' + '2' * 64
+        for name in [keep, stale, 'cephadm.log', 'mon.a']:
+            tmpdir.join(name).write('')
+        assert remotes.remove_stale_cephadm(str(tmpdir.join(keep))) == [stale]
+        assert sorted(os.listdir(str(tmpdir))) == sorted([keep, 'cephadm.log', 'mon.a'])
+
     @mock.patch("cephadm.module.CephadmOrchestrator._run_cephadm")
     def test_registry_login(self, _run_cephadm, cephadm_module: CephadmOrchestrator):
         def check_registry_credentials(url, username, password):
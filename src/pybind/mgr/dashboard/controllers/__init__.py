@@ -3,6 +3,7 @@
 from __future__ import absolute_import
 
 import collections
+import hashlib
 import importlib
 import inspect
 import json
@@ -19,7 +20,7 @@ from functools import wraps
 import cherrypy
 
 from ..security import Scope, Permission
-from ..tools import getargspec, TaskManager, get_request_body_params
+from ..tools import getargspec, TaskManager, get_request_body_params, json_dumps
 from ..exceptions import ScopeNotValid, PermissionNotValid
 from ..services.auth import AuthManager, JwtManager
 from ..plugins import PLUGIN_MANAGER
@@ -671,10 +672,28 @@ class BaseController(object):
                 return ret.encode('utf8')
             if json_response:
                 cherrypy.response.headers['Content-Type'] = 'application/json'
-                ret = json.dumps(ret).encode('utf8')
+                ret = json_dumps(ret)
+                if cherrypy.request.method == 'GET' and cherrypy.response.status in (None, 200):
+                    ret = BaseController._validate_etag(ret)
             return ret
         return inner
 
+    @staticmethod
+    def _validate_etag(body):
+        """
+        Tags the response with a hash of its body and answers 304 (Not
+        Modified) to clients which already have it. The tag is weak, as the
+        body might be compressed afterwards.
+        """
+        etag = 'W/"{}"'.format(hashlib.blake2b(body, digest_size=16).hexdigest())
+        cherrypy.response.headers['ETag'] = etag
+        conditions = [str(c) for c in cherrypy.request.headers.elements('If-None-Match')]
+        if '*' in conditions or etag[2:] in [c[2:] if c.startswith('W/') else c
+                                             for c in conditions]:
+            cherrypy.response.status = 304
+            return b''
+        return body
+
     @property
     def _request(self):
         return self.Request(cherrypy.request)
@@ -4,8 +4,9 @@ import json
 import logging
 import time
 
+import cherrypy
+
 from ceph.deployment.drive_group import DriveGroupSpec, DriveGroupValidationError  # type: ignore
-from mgr_util import get_most_recent_rate
 
 from . import ApiController, RESTController, Endpoint, Task
 from . import CreatePermission, ReadPermission, UpdatePermission, DeletePermission, \
@@ -17,6 +18,7 @@ from ..security import Scope
 from ..services.ceph_service import CephService, SendCommandError
 from ..services.exception import handle_send_command_error, handle_orchestrator_error
 from ..services.orchestrator import OrchClient, OrchFeature
+from ..services.osd import OsdTable, osd_table_changed
 from ..tools import str_to_bool
 
 from typing import Any, Dict, List, Union  # pylint: disable=C0411
@@ -44,43 +46,20 @@ def osd_task(name, metadata, wait_for=2.0):
 @ApiController('/osd', Scope.OSD)
 @ControllerDoc('OSD management API', 'OSD')
 class Osd(RESTController):
-    def list(self):
-        osds = self.get_osd_map()
-
-        # Extending by osd stats information
-        for stat in mgr.get('osd_stats')['osd_stats']:
-            if stat['osd'] in osds:
-                osds[stat['osd']]['osd_stats'] = stat
-
-        # Extending by osd node information
-        nodes = mgr.get('osd_map_tree')['nodes']
-        for node in nodes:
-            if node['type'] == 'osd' and node['id'] in osds:
-                osds[node['id']]['tree'] = node
-
-        # Extending by osd parent node information
-        for host in [n for n in nodes if n['type'] == 'host']:
-            for osd_id in host['children']:
-                if osd_id >= 0 and osd_id in osds:
-                    osds[osd_id]['host'] = host
-
-        # Extending by osd histogram data
-        for osd_id, osd in osds.items():
-            osd['stats'] = {}
-            osd['stats_history'] = {}
-            osd_spec = str(osd_id)
-            if 'osd' not in osd:
-                continue  # pragma: no cover - simple early continue
-            for stat in ['osd.op_w', 'osd.op_in_bytes', 'osd.op_r', 'osd.op_out_bytes']:
-                prop = stat.split('.')[1]
-                rates = CephService.get_rates('osd', osd_spec, stat)
-                osd['stats'][prop] = get_most_recent_rate(rates)
-                osd['stats_history'][prop] = rates
-            # Gauge stats
-            for stat in ['osd.numpg', 'osd.stat_bytes', 'osd.stat_bytes_used']:
-                osd['stats'][stat.split('.')[1]] = mgr.get_latest('osd', osd_spec, stat)
-
-        return list(osds.values())
+    @EndpointDoc("List OSDs",
+                 parameters={
+                     'columns': (str, 'Comma separated attributes to return, e.g. '
+                                      '"id,host.name,stats.op_w"'),
+                     'offset': (int, 'Index of the first OSD returned'),
+                     'limit': (int, 'Maximum number of OSDs returned'),
+                     'sort': (str, 'Attribute to sort by, prefixed by + or -'),
+                 })
+    def list(self, columns=None, offset=0, limit=None, sort=None):
+        osds, total = OsdTable.query(columns.split(',') if columns else None,
+                                     int(offset), int(limit) if limit is not None else None,
+                                     sort)
+        cherrypy.response.headers['X-Total-Count'] = str(total)
+        return osds
 
     @staticmethod
     def get_osd_map(svc_id=None):
@@ -118,6 +97,7 @@ class Osd(RESTController):
             'osd_metadata': mgr.get_metadata('osd', svc_id),
         }
 
+    @osd_table_changed()
     def set(self, svc_id, device_class):  # pragma: no cover
         old_device_class = CephService.send_command('mon', 'osd crush get-device-class',
                                                     ids=[svc_id])
@@ -158,6 +138,7 @@ class Osd(RESTController):
     @raise_if_no_orchestrator([OrchFeature.OSD_DELETE, OrchFeature.OSD_GET_REMOVE_STATUS])
     @handle_orchestrator_error('osd')
     @osd_task('delete', {'svc_id': '{svc_id}'})
+    @osd_table_changed()
     def delete(self, svc_id, preserve_id=None, force=None):  # pragma: no cover
         replace = False
         check: Union[Dict[str, Any], bool] = False
@@ -198,6 +179,7 @@ class Osd(RESTController):
     @RESTController.Resource('PUT')
     @EndpointDoc("Mark OSD flags (out, in, down, lost, ...)",
                  parameters={'svc_id': (str, 'SVC ID')})
+    @osd_table_changed()
     def mark(self, svc_id, action):
         """
         Note: osd must be marked `down` before marking lost.
@@ -217,6 +199,7 @@ class Osd(RESTController):
 
     @RESTController.Resource('POST')
     @allow_empty_body
+    @osd_table_changed()
     def reweight(self, svc_id, weight):
         """
         Reweights the OSD temporarily.
@@ -271,6 +254,7 @@ class Osd(RESTController):
 
     @CreatePermission
     @osd_task('create', {'tracking_id': '{tracking_id}'})
+    @osd_table_changed()
     def create(self, method, data, tracking_id):  # pylint: disable=W0622
         if method == 'bare':
             return self._create_bare(data)
@@ -281,6 +265,7 @@ class Osd(RESTController):
 
     @RESTController.Resource('POST')
     @allow_empty_body
+    @osd_table_changed()
     def purge(self, svc_id):
         """
         Note: osd must be marked `down` before removal.
@@ -290,6 +275,7 @@ class Osd(RESTController):
 
     @RESTController.Resource('POST')
     @allow_empty_body
+    @osd_table_changed()
     def destroy(self, svc_id):
         """
         Mark osd as being destroyed. Keeps the ID intact (allowing reuse), but
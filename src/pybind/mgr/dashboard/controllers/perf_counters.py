@@ -26,9 +26,9 @@ class PerfCounter(RESTController):
     service_type = None  # type: str
 
     def get(self, service_id):
-        schema_dict = mgr.get_perf_schema(self.service_type, str(service_id))
+        counters_dict = mgr.get_latest_perf_counters(self.service_type, str(service_id))
         try:
-            schema = schema_dict["{}.{}".format(self.service_type, service_id)]
+            schema = counters_dict["{}.{}".format(self.service_type, service_id)]
         except KeyError as e:
             raise cherrypy.HTTPError(404, "{0} not found".format(e))
         counters = []
@@ -43,8 +43,7 @@ class PerfCounter(RESTController):
                     self.service_type, service_id, key)
                 counter['unit'] = mgr._unit_to_str(value['units'])
             else:
-                counter['value'] = mgr.get_latest(
-                    self.service_type, service_id, key)
+                counter['value'] = value['value']
                 counter['unit'] = ''
             counters.append(counter)
 
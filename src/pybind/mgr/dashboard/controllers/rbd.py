@@ -27,7 +27,8 @@ logger = logging.getLogger(__name__)
 RBD_SCHEMA = ([{
     "status": (int, 'Status of the image'),
     "value": ([str], ''),
-    "pool_name": (str, 'pool name')
+    "pool_name": (str, 'pool name'),
+    "total": (int, 'Number of images matching the search')
 }])
 
 RBD_TRASH_SCHEMA = [{
@@ -77,7 +78,7 @@ class Rbd(RESTController):
     ALLOW_DISABLE_FEATURES = {"exclusive-lock", "object-map", "fast-diff", "deep-flatten",
                               "journaling"}
 
-    def _rbd_list(self, pool_name=None):
+    def _rbd_list(self, pool_name=None, offset=0, limit=None, search='', sort='+name'):
         if pool_name:
             pools = [pool_name]
         else:
@@ -86,11 +87,10 @@ class Rbd(RESTController):
         result = []
         for pool in pools:
             # pylint: disable=unbalanced-tuple-unpacking
-            status, value = RbdService.rbd_pool_list(pool)
-            for i, image in enumerate(value):
-                value[i]['configuration'] = RbdConfiguration(
-                    pool, image['namespace'], image['name']).list()
-            result.append({'status': status, 'value': value, 'pool_name': pool})
+            status, (value, total) = RbdService.rbd_pool_list(pool, None, offset, limit,
+                                                              search, sort)
+            result.append({'status': status, 'value': value, 'pool_name': pool,
+                           'total': total})
         return result
 
     @handle_rbd_error()
@@ -98,10 +98,15 @@ class Rbd(RESTController):
     @EndpointDoc("Display Rbd Images",
                  parameters={
                      'pool_name': (str, 'Pool Name'),
+                     'offset': (int, 'Index of the first image returned per pool'),
+                     'limit': (int, 'Maximum number of images returned per pool'),
+                     'search': (str, 'Only list images whose name contains this'),
+                     'sort': (str, 'Image attribute to sort by, prefixed by + or -'),
                  },
                  responses={200: RBD_SCHEMA})
-    def list(self, pool_name=None):
-        return self._rbd_list(pool_name)
+    def list(self, pool_name=None, offset=0, limit=None, search='', sort='+name'):
+        limit = int(limit) if limit is not None else None
+        return self._rbd_list(pool_name, int(offset), limit, search, sort)
 
     @handle_rbd_error()
     @handle_rados_error('pool')
@@ -447,8 +452,8 @@ class RbdNamespace(RESTController):
     def delete(self, pool_name, namespace):
         with mgr.rados.open_ioctx(pool_name) as ioctx:
             # pylint: disable=unbalanced-tuple-unpacking
-            _, images = RbdService.rbd_pool_list(pool_name, namespace)
-            if images:
+            _, (_, num_images) = RbdService.rbd_pool_list(pool_name, namespace, 0, 0)
+            if num_images:
                 raise DashboardException(
                     msg='Namespace contains images which must be deleted first',
                     code='namespace_contains_images',
@@ -461,9 +466,9 @@ class RbdNamespace(RESTController):
             namespaces = self.rbd_inst.namespace_list(ioctx)
             for namespace in namespaces:
                 # pylint: disable=unbalanced-tuple-unpacking
-                _, images = RbdService.rbd_pool_list(pool_name, namespace)
+                _, (_, num_images) = RbdService.rbd_pool_list(pool_name, namespace, 0, 0)
                 result.append({
                     'namespace': namespace,
-                    'num_images': len(images) if images else 0
+                    'num_images': num_images
                 })
             return result
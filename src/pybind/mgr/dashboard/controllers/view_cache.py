@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from . import ApiController, RESTController, ControllerDoc, EndpointDoc
+from ..security import Scope
+from ..tools import ViewCache
+
+VIEW_CACHE_SCHEMA = [{
+    "name": (str, "Cached function"),
+    "entries": (int, "Number of cached argument tuples"),
+    "hits": (int, "Calls answered from the cache"),
+    "misses": (int, "Calls starting a fetch"),
+    "coalesced": (int, "Calls waiting for a fetch already in progress"),
+    "stale": (int, "Calls answered with stale data"),
+    "no_data": (int, "Calls failing for lack of data"),
+    "errors": (int, "Failed fetches"),
+    "evictions": (int, "Evicted entries"),
+    "fetches": (int, "Completed fetches"),
+    "latency_last": (float, "Duration of the last fetch"),
+    "latency_avg": (float, "Average duration of the fetches"),
+    "latency_max": (float, "Longest duration of a fetch"),
+    "latency_total": (float, "Total duration of the fetches"),
+    "maxsize": (int, "Maximum number of entries"),
+    "ttl": (float, "Time after which unused entries are evicted"),
+    "timeout": (float, "Time to wait for a fetch"),
+    "stale_period": (float, "Time a fetched value is considered fresh"),
+}]
+
+
+@ApiController('/view_cache', Scope.MANAGER)
+@ControllerDoc("Dashboard View Cache Statistics", "ViewCache")
+class ViewCacheStats(RESTController):
+
+    @EndpointDoc("Display the statistics of the dashboard view caches",
+                 responses={200: VIEW_CACHE_SCHEMA})
+    def list(self):
+        return ViewCache.dump_all_stats()
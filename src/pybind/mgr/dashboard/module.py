@@ -37,6 +37,7 @@ from .grafana import push_local_dashboards
 from .tools import NotificationQueue, RequestLoggingTool, TaskManager, \
                    prepare_url_prefix, str_to_bool
 from .services.auth import AuthManager, AuthManagerTool, JwtManager
+from .services.osd import OsdTable
 from .services.sso import SSO_COMMANDS, \
                           handle_sso_command
 from .services.exception import dashboard_exception_handler
@@ -326,6 +327,7 @@ class Module(MgrModule, CherryPyConfig):
         cherrypy.engine.start()
         NotificationQueue.start_queue()
         TaskManager.init()
+        OsdTable.start()
         logger.info('Engine started.')
         update_dashboards = str_to_bool(
             self.get_module_option('GRAFANA_UPDATE_DASHBOARDS', 'False'))
@@ -341,6 +343,7 @@ class Module(MgrModule, CherryPyConfig):
         self.shutdown_event.wait()
         self.shutdown_event.clear()
         NotificationQueue.stop()
+        OsdTable.stop()
         cherrypy.engine.stop()
         logger.info('Engine stopped')
 
@@ -2,6 +2,9 @@
 from __future__ import absolute_import
 import json
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 
 import rados
 
@@ -12,7 +15,7 @@ from .. import mgr
 from ..exceptions import DashboardException
 
 try:
-    from typing import Dict, Any, Union  # pylint: disable=unused-import
+    from typing import Dict, Any, List, Optional, Set, Union  # pylint: disable=unused-import
 except ImportError:
     pass  # For typing only
 
@@ -27,6 +30,13 @@ class SendCommandError(rados.Error):
 
 
 class CephService(object):
+    # number of daemons asked for SMART data concurrently
+    SMART_WORKERS = 16
+    # seconds to wait for the SMART data of a host or daemon
+    SMART_TIMEOUT = 60
+
+    _smart_lock = threading.Lock()
+    _smart_executor = None  # type: Optional[ThreadPoolExecutor]
 
     OSD_FLAG_NO_SCRUB = 'noscrub'
     OSD_FLAG_NO_DEEP_SCRUB = 'nodeep-scrub'
@@ -196,54 +206,104 @@ class CephService(object):
         except Exception:  # pylint: disable=broad-except
             return outb
 
+    @classmethod
+    def _submit_smart_command(cls, daemon):
+        with cls._smart_lock:
+            if cls._smart_executor is None:
+                cls._smart_executor = ThreadPoolExecutor(max_workers=cls.SMART_WORKERS)
+        return cls._smart_executor.submit(cls._get_smart_data_by_daemon_command, daemon)
+
     @staticmethod
-    def _get_smart_data_by_device(device):
-        # type: (dict) -> Dict[str, dict]
-        # Check whether the device is associated with daemons.
-        if 'daemons' in device and device['daemons']:
-            dev_smart_data = None
-
-            # The daemons associated with the device. Note, the list may
-            # contain daemons that are 'down' or 'destroyed'.
-            daemons = device.get('daemons')
-
-            # Get a list of all OSD daemons on all hosts that are 'up'
-            # because SMART data can not be retrieved from daemons that
-            # are 'down' or 'destroyed'.
-            osd_tree = CephService.send_command('mon', 'osd tree')
-            osd_daemons_up = [
-                node['name'] for node in osd_tree.get('nodes', {})
-                if node.get('status') == 'up'
-            ]
-
-            # Finally get the daemons on the host of the given device
-            # that are 'up'. All daemons on the same host can deliver
-            # SMART data, thus it is not relevant for us which daemon
-            # we are using.
-            daemons = list(set(daemons) & set(osd_daemons_up))  # type: ignore
-
-            for daemon in daemons:
-                svc_type, svc_id = daemon.split('.')
-                try:
-                    dev_smart_data = CephService.send_command(
-                        svc_type, 'smart', svc_id, devid=device['devid'])
-                except SendCommandError:
-                    # Try to retrieve SMART data from another daemon.
+    def _get_osd_daemons_up():
+        # type: () -> Set[str]
+        return {
+            'osd.{}'.format(osd['osd']) for osd in mgr.get('osd_map')['osds'] if osd['up']
+        }
+
+    @classmethod
+    def _get_smart_data_by_devices(cls, devices):
+        # type: (List[dict]) -> Dict[str, dict]
+        """
+        Get the SMART data of the given devices.
+
+        `smart` without a device ID returns the data of all the devices of a
+        daemon, so every daemon is asked once for all the devices it covers.
+        The daemons are asked concurrently. Devices whose daemon fails or
+        does not reply within `SMART_TIMEOUT` seconds are retried on their
+        other daemons, as long as time is left.
+        """
+        # SMART data can not be retrieved from daemons that are 'down' or
+        # 'destroyed'. All daemons using a device can deliver its data.
+        osd_daemons_up = cls._get_osd_daemons_up()
+        candidates = {}  # type: Dict[str, Set[str]]
+        for device in devices:
+            if device['devid'] in candidates:
+                continue
+            daemons = set(device.get('daemons') or [])
+            if not daemons:
+                logger.warning('[SMART] No daemons associated with device ID "%s"',
+                               device['devid'])
+                continue
+            candidates[device['devid']] = daemons & osd_daemons_up
+
+        smart_data = {}  # type: Dict[str, dict]
+        deadline = time.time() + cls.SMART_TIMEOUT
+        pending = {devid for devid, daemons in candidates.items() if daemons}
+        while pending and time.time() < deadline:
+            # assign the pending devices to as few daemons as possible
+            assignment = {}  # type: Dict[str, Set[str]]
+            unassigned = set(pending)
+            while unassigned:
+                covered = {}  # type: Dict[str, Set[str]]
+                for devid in unassigned:
+                    for daemon in candidates[devid]:
+                        covered.setdefault(daemon, set()).add(devid)
+                if not covered:
+                    break
+                daemon = max(sorted(covered), key=lambda d: len(covered[d]))
+                assignment[daemon] = covered[daemon]
+                unassigned -= covered[daemon]
+
+            futures = {cls._submit_smart_command(daemon): daemon for daemon in assignment}
+            done, _ = wait(futures, timeout=max(deadline - time.time(), 0))
+            for future in done:
+                result = future.result()
+                if result is None:
                     continue
-                for dev_id, dev_data in dev_smart_data.items():
-                    if 'error' in dev_data:
-                        logger.warning(
-                            '[SMART] Error retrieving smartctl data for device ID "%s": %s',
-                            dev_id, dev_data)
-                break
-            if dev_smart_data is None:
+                for devid in assignment[futures[future]] & set(result):
+                    smart_data[devid] = result[devid]
+            for daemon, devids in assignment.items():
+                # do not ask this daemon again for the devices it missed
+                for devid in devids - set(smart_data):
+                    candidates[devid].discard(daemon)
+            pending = {devid for devid in candidates
+                       if devid not in smart_data and candidates[devid]}
+
+        failed = [devid for devid in candidates if devid not in smart_data]
+        if failed:
+            if not smart_data:
                 raise DashboardException(
-                    'Failed to retrieve SMART data for device ID "{}"'.format(
-                        device['devid']))
-            return dev_smart_data
-        logger.warning('[SMART] No daemons associated with device ID "%s"',
-                       device['devid'])
-        return {}
+                    'Failed to retrieve SMART data for device ID(s) "{}"'.format(
+                        '", "'.join(sorted(failed))))
+            logger.warning('[SMART] Failed to retrieve SMART data for device ID(s) %s',
+                           ', '.join(sorted(failed)))
+        return smart_data
+
+    @staticmethod
+    def _get_smart_data_by_daemon_command(daemon):
+        # type: (str) -> Optional[Dict[str, dict]]
+        svc_type, svc_id = daemon.split('.')
+        try:
+            dev_smart_data = CephService.send_command(svc_type, 'smart', svc_id)
+        except SendCommandError:
+            # The devices will be retried on another daemon.
+            return None
+        for dev_id, dev_data in dev_smart_data.items():
+            if 'error' in dev_data:
+                logger.warning(
+                    '[SMART] Error retrieving smartctl data for device ID "%s": %s',
+                    dev_id, dev_data)
+        return dev_smart_data
 
     @staticmethod
     def get_devices_by_host(hostname):
@@ -272,13 +332,9 @@ class CephService(object):
           dictionary.
         """
         devices = CephService.get_devices_by_host(hostname)
-        smart_data = {}  # type: dict
-        if devices:
-            for device in devices:
-                if device['devid'] not in smart_data:
-                    smart_data.update(
-                        CephService._get_smart_data_by_device(device))
-        return smart_data
+        if not devices:
+            return {}
+        return CephService._get_smart_data_by_devices(devices)
 
     @staticmethod
     def get_smart_data_by_daemon(daemon_type, daemon_id):
@@ -292,13 +348,9 @@ class CephService(object):
           key in the dictionary.
         """
         devices = CephService.get_devices_by_daemon(daemon_type, daemon_id)
-        smart_data = {}  # type: Dict[str, dict]
-        if devices:
-            for device in devices:
-                if device['devid'] not in smart_data:
-                    smart_data.update(
-                        CephService._get_smart_data_by_device(device))
-        return smart_data
+        if not devices:
+            return {}
+        return CephService._get_smart_data_by_devices(devices)
 
     @classmethod
     def get_rates(cls, svc_type, svc_name, path):
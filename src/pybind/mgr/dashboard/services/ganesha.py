@@ -4,7 +4,9 @@ from __future__ import absolute_import
 
 import logging
 import re
+import threading
 
+from mgr_util import GaneshaConfParser
 from orchestrator import OrchestratorError
 from .cephfs import CephFS
 from .cephx import CephX
@@ -14,6 +16,10 @@ from .. import mgr
 from ..settings import Settings
 from ..exceptions import DashboardException
 
+try:
+    from typing import Dict, List, Tuple
+except ImportError:
+    pass  # For typing only
 
 logger = logging.getLogger('ganesha')
 
@@ -163,200 +169,6 @@ class Ganesha(object):
         return result
 
 
-class GaneshaConfParser(object):
-    def __init__(self, raw_config):
-        self.pos = 0
-        self.text = ""
-        self.clean_config(raw_config)
-
-    def clean_config(self, raw_config):
-        for line in raw_config.split("\n"):
-            cardinal_idx = line.find('#')
-            if cardinal_idx == -1:
-                self.text += line
-            else:
-                # remove comments
-                self.text += line[:cardinal_idx]
-            if line.startswith("%"):
-                self.text += "\n"
-
-    def remove_all_whitespaces(self):
-        new_text = ""
-        in_string = False
-        in_section = False
-        for i, cha in enumerate(self.text):
-            if in_section:
-                if cha != '"' and self.text[i-1] != '\\':
-                    new_text += cha
-                elif cha == '\n':
-                    new_text += cha
-                    in_section = False
-                elif i == (len(self.text)-1):
-                    if cha != '"' and self.text[i-1] != '\\':
-                        new_text += cha
-                    in_section = False
-            elif not in_section and (i == 0 or self.text[i-1] == '\n') and cha == '%':
-                in_section = True
-                new_text += cha
-            elif in_string or cha not in [' ', '\n', '\t']:
-                new_text += cha
-            elif cha == '"' and self.text[i-1] != '\\':
-                in_string = not in_string
-        self.text = new_text
-
-    def stream(self):
-        return self.text[self.pos:]
-
-    def parse_block_name(self):
-        idx = self.stream().find('{')
-        if idx == -1:
-            raise Exception("Cannot find block name")
-        block_name = self.stream()[:idx]
-        self.pos += idx+1
-        return block_name
-
-    def parse_block_or_section(self):
-        if self.stream().startswith("%url "):
-            # section line
-            self.pos += 5
-            idx = self.stream().find('\n')
-            if idx == -1:
-                value = self.stream()
-                self.pos += len(self.stream())
-            else:
-                value = self.stream()[:idx]
-                self.pos += idx+1
-            block_dict = {'block_name': '%url', 'value': value}
-            return block_dict
-
-        block_name = self.parse_block_name().upper()
-        block_dict = {'block_name': block_name}
-        self.parse_block_body(block_dict)
-        if self.stream()[0] != '}':
-            raise Exception("No closing bracket '}' found at the end of block")
-        self.pos += 1
-        return block_dict
-
-    def parse_parameter_value(self, raw_value):
-        colon_idx = raw_value.find(',')
-
-        if colon_idx == -1:
-            try:
-                return int(raw_value)
-            except ValueError:
-                if raw_value == "true":
-                    return True
-                if raw_value == "false":
-                    return False
-                if raw_value.find('"') == 0:
-                    return raw_value[1:-1]
-                return raw_value
-        else:
-            return [self.parse_parameter_value(v.strip())
-                    for v in raw_value.split(',')]
-
-    def parse_stanza(self, block_dict):
-        equal_idx = self.stream().find('=')
-        semicolon_idx = self.stream().find(';')
-        if equal_idx == -1:
-            raise Exception("Malformed stanza: no equal symbol found.")
-        parameter_name = self.stream()[:equal_idx].lower()
-        parameter_value = self.stream()[equal_idx+1:semicolon_idx]
-        block_dict[parameter_name] = self.parse_parameter_value(
-            parameter_value)
-        self.pos += semicolon_idx+1
-
-    def parse_block_body(self, block_dict):
-        last_pos = self.pos
-        while True:
-            semicolon_idx = self.stream().find(';')
-            lbracket_idx = self.stream().find('{')
-            rbracket_idx = self.stream().find('}')
-
-            if rbracket_idx == 0:
-                # block end
-                return
-
-            if (semicolon_idx != -1 and lbracket_idx != -1
-                    and semicolon_idx < lbracket_idx) \
-                    or (semicolon_idx != -1 and lbracket_idx == -1):
-                self.parse_stanza(block_dict)
-            elif (semicolon_idx != -1 and lbracket_idx != -1
-                  and semicolon_idx > lbracket_idx) or (
-                      semicolon_idx == -1 and lbracket_idx != -1):
-                if '_blocks_' not in block_dict:
-                    block_dict['_blocks_'] = []
-                block_dict['_blocks_'].append(self.parse_block_or_section())
-            else:
-                raise Exception("Malformed stanza: no semicolon found.")
-
-            if last_pos == self.pos:
-                raise Exception("Infinite loop while parsing block content")
-            last_pos = self.pos
-
-    def parse(self):
-        self.remove_all_whitespaces()
-        blocks = []
-        while self.stream():
-            block_dict = self.parse_block_or_section()
-            blocks.append(block_dict)
-        return blocks
-
-    @staticmethod
-    def _indentation(depth, size=4):
-        conf_str = ""
-        for _ in range(0, depth*size):
-            conf_str += " "
-        return conf_str
-
-    @staticmethod
-    def write_block_body(block, depth=0):
-        def format_val(key, val):
-            if isinstance(val, list):
-                return ', '.join([format_val(key, v) for v in val])
-            if isinstance(val, bool):
-                return str(val).lower()
-            if isinstance(val, int) or (block['block_name'] == 'CLIENT'
-                                        and key == 'clients'):
-                return '{}'.format(val)
-            return '"{}"'.format(val)
-
-        conf_str = ""
-        for key, val in block.items():
-            if key == 'block_name':
-                continue
-            elif key == '_blocks_':
-                for blo in val:
-                    conf_str += GaneshaConfParser.write_block(blo, depth)
-            elif val:
-                conf_str += GaneshaConfParser._indentation(depth)
-                conf_str += '{} = {};\n'.format(key, format_val(key, val))
-        return conf_str
-
-    @staticmethod
-    def write_block(block, depth):
-        if block['block_name'] == "%url":
-            return '%url "{}"\n\n'.format(block['value'])
-
-        conf_str = ""
-        conf_str += GaneshaConfParser._indentation(depth)
-        conf_str += format(block['block_name'])
-        conf_str += " {\n"
-        conf_str += GaneshaConfParser.write_block_body(block, depth+1)
-        conf_str += GaneshaConfParser._indentation(depth)
-        conf_str += "}\n\n"
-        return conf_str
-
-    @staticmethod
-    def write_conf(blocks):
-        if not isinstance(blocks, list):
-            blocks = [blocks]
-        conf_str = ""
-        for block in blocks:
-            conf_str += GaneshaConfParser.write_block(block, 0)
-        return conf_str
-
-
 class FSal(object):
     def __init__(self, name):
         self.name = name
@@ -752,6 +564,11 @@ class Export(object):
 class GaneshaConf(object):
     # pylint: disable=R0902
 
+    # parsed export and daemon configuration objects, by (pool, namespace,
+    # object name), along with the object version they were parsed from
+    _parsed_objects = {}  # type: Dict[Tuple[str, str, str], Tuple[int, List[dict]]]
+    _parsed_objects_lock = threading.Lock()
+
     def __init__(self, cluster_id, rados_pool, rados_namespace):
         self.cluster_id = cluster_id
         self.rados_pool = rados_pool
@@ -790,31 +607,49 @@ class GaneshaConf(object):
         pool, ns = Ganesha.get_pool_and_namespace(cluster_id)
         return cls(cluster_id, pool, ns)
 
+    def _read_conf_object(self, ioctx, obj):
+        """
+        Returns the parsed configuration of an object. Objects are only read
+        and parsed again once their version changed.
+        """
+        cache_key = (self.rados_pool, self.rados_namespace or '', obj.key)
+        size, _ = obj.stat()
+        version = ioctx.get_last_version()
+        with self._parsed_objects_lock:
+            cached = self._parsed_objects.get(cache_key)
+        if cached and cached[0] == version:
+            return cached[1]
+        raw_config = obj.read(size)
+        raw_config = raw_config.decode("utf-8")
+        logger.debug("read configuration from rados object %s/%s/%s:\n%s",
+                     self.rados_pool, self.rados_namespace, obj.key, raw_config)
+        blocks = GaneshaConfParser(raw_config).parse()
+        with self._parsed_objects_lock:
+            self._parsed_objects[cache_key] = (version, blocks)
+        return blocks
+
     def _read_raw_config(self):
+        keys = set()
         with mgr.rados.open_ioctx(self.rados_pool) as ioctx:
             if self.rados_namespace:
                 ioctx.set_namespace(self.rados_namespace)
             objs = ioctx.list_objects()
             for obj in objs:
                 if obj.key.startswith("export-"):
-                    size, _ = obj.stat()
-                    raw_config = obj.read(size)
-                    raw_config = raw_config.decode("utf-8")
-                    logger.debug("read export configuration from rados "
-                                 "object %s/%s/%s:\n%s", self.rados_pool,
-                                 self.rados_namespace, obj.key, raw_config)
-                    self.export_conf_blocks.extend(
-                        GaneshaConfParser(raw_config).parse())
+                    self.export_conf_blocks.extend(self._read_conf_object(ioctx, obj))
                 elif obj.key.startswith("conf-"):
-                    size, _ = obj.stat()
-                    raw_config = obj.read(size)
-                    raw_config = raw_config.decode("utf-8")
-                    logger.debug("read daemon configuration from rados "
-                                 "object %s/%s/%s:\n%s", self.rados_pool,
-                                 self.rados_namespace, obj.key, raw_config)
                     idx = obj.key.find('-')
                     self.daemons_conf_blocks[obj.key[idx+1:]] = \
-                        GaneshaConfParser(raw_config).parse()
+                        self._read_conf_object(ioctx, obj)
+                else:
+                    continue
+                keys.add(obj.key)
+        # forget removed objects
+        with self._parsed_objects_lock:
+            for cache_key in list(self._parsed_objects):
+                if cache_key[:2] == (self.rados_pool, self.rados_namespace or '') \
+                        and cache_key[2] not in keys:
+                    del self._parsed_objects[cache_key]
 
     def _write_raw_config(self, conf_block, obj):
         raw_config = GaneshaConfParser.write_conf(conf_block)
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from mgr_module import MgrModule
+from mgr_util import get_most_recent_rate
+
+from .. import mgr
+from ..exceptions import DashboardException
+from .ceph_service import CephService
+
+try:
+    from typing import Any, Dict, List, Optional, Tuple
+except ImportError:
+    pass  # For typing only
+
+
+logger = logging.getLogger('osd_table')
+
+_MISSING = object()
+
+
+class OsdTable(object):
+    """
+    Table of all OSDs as returned by `GET /api/osd`, joined with their
+    statistics, CRUSH node, host and perf counters.
+
+    Building the table costs several calls into the mgr per OSD, so it is
+    not built per request. Once started, a background thread rebuilds it
+    every `REFRESH_INTERVAL` seconds for as long as it has been read within
+    the last `IDLE_TIMEOUT` seconds. A read of a missing or outdated table
+    rebuilds it in the calling thread.
+    """
+    REFRESH_INTERVAL = 5.0
+    IDLE_TIMEOUT = 60.0
+
+    RATE_COUNTERS = ['osd.op_w', 'osd.op_in_bytes', 'osd.op_r', 'osd.op_out_bytes']
+    GAUGE_COUNTERS = ['osd.numpg', 'osd.stat_bytes', 'osd.stat_bytes_used']
+
+    _lock = threading.Lock()
+    _cond = threading.Condition(_lock)
+    # held while building the table, so that it is built once at a time
+    _build_lock = threading.Lock()
+    _rows = None  # type: Optional[List[Dict[str, Any]]]
+    _updated = 0.0
+    _last_read = 0.0
+    _running = False
+    _thread = None  # type: Optional[threading.Thread]
+
+    @classmethod
+    def start(cls):
+        with cls._lock:
+            if cls._thread:
+                return
+            cls._running = True
+            cls._thread = threading.Thread(target=cls._serve, name='osd_table')
+            cls._thread.daemon = True
+        logger.debug("starting OSD table refresh")
+        cls._thread.start()
+
+    @classmethod
+    def stop(cls):
+        with cls._lock:
+            thread = cls._thread
+            if not thread:
+                return
+            cls._thread = None
+            cls._running = False
+            cls._cond.notify_all()
+        thread.join()
+        logger.debug("OSD table refresh stopped")
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._rows = None
+            cls._updated = 0.0
+
+    @classmethod
+    def _idle(cls):
+        return time.time() - cls._last_read > cls.IDLE_TIMEOUT
+
+    @classmethod
+    def _fresh_rows(cls):
+        # allow the background refresh to be late by one interval
+        if time.time() - cls._updated < 2 * cls.REFRESH_INTERVAL:
+            return cls._rows
+        return None
+
+    @classmethod
+    def _serve(cls):
+        while True:
+            with cls._lock:
+                while cls._running and cls._idle():
+                    cls._cond.wait()
+                if not cls._running:
+                    return
+            try:
+                with cls._build_lock:
+                    cls._refresh()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("failed to refresh the OSD table")
+            with cls._lock:
+                cls._cond.wait_for(lambda: not cls._running, cls.REFRESH_INTERVAL)
+
+    @classmethod
+    def _refresh(cls):
+        # must be called with `_build_lock` held
+        start = time.time()
+        rows = cls.build()
+        with cls._lock:
+            cls._rows = rows
+            cls._updated = time.time()
+        logger.debug("built the OSD table of %d OSDs in %.3fs", len(rows),
+                     cls._updated - start)
+        return rows
+
+    @classmethod
+    def rows(cls):
+        # type: () -> List[Dict[str, Any]]
+        """
+        :return: the rows of the table. They are shared by all readers and
+            must not be modified.
+        """
+        with cls._lock:
+            was_idle = cls._idle()
+            cls._last_read = time.time()
+            if was_idle:
+                cls._cond.notify_all()
+            rows = cls._fresh_rows()
+        if rows is not None:
+            return rows
+        with cls._build_lock:
+            # another reader might have built it in the meantime
+            with cls._lock:
+                rows = cls._fresh_rows()
+            if rows is not None:
+                return rows
+            return cls._refresh()
+
+    @classmethod
+    def build(cls):
+        # type: () -> List[Dict[str, Any]]
+        osds = {}  # type: Dict[int, Dict[str, Any]]
+        for osd in mgr.get('osd_map')['osds']:
+            osd['id'] = osd['osd']
+            osds[osd['osd']] = osd
+
+        for stat in mgr.get('osd_stats')['osd_stats']:
+            if stat['osd'] in osds:
+                osds[stat['osd']]['osd_stats'] = stat
+
+        # OSD and host nodes in a single pass
+        for node in mgr.get('osd_map_tree')['nodes']:
+            if node['type'] == 'osd':
+                if node['id'] in osds:
+                    osds[node['id']]['tree'] = node
+            elif node['type'] == 'host':
+                for osd_id in node['children']:
+                    if osd_id in osds:
+                        osds[osd_id]['host'] = node
+
+        # the latest values of all OSDs at once
+        counters = mgr.get_latest_perf_counters('osd', '', MgrModule.PRIO_USEFUL)
+        for osd_id, osd in osds.items():
+            osd_spec = str(osd_id)
+            osd['stats'] = {}
+            osd['stats_history'] = {}
+            for path in cls.RATE_COUNTERS:
+                prop = path.split('.')[1]
+                rates = CephService.get_rates('osd', osd_spec, path)
+                osd['stats'][prop] = get_most_recent_rate(rates)
+                osd['stats_history'][prop] = rates
+            osd_counters = counters.get('osd.{}'.format(osd_spec), {})
+            for path in cls.GAUGE_COUNTERS:
+                osd['stats'][path.split('.')[1]] = osd_counters.get(path, {}).get('value', 0)
+
+        return list(osds.values())
+
+    @staticmethod
+    def _lookup(row, column):
+        value = row
+        for key in column.split('.'):
+            if not isinstance(value, dict) or key not in value:
+                return _MISSING
+            value = value[key]
+        return value
+
+    @classmethod
+    def _sort_key(cls, row, column):
+        value = cls._lookup(row, column)
+        if value is _MISSING or value is None:
+            return (False, 0)
+        return (True, value)
+
+    @classmethod
+    def _select(cls, row, columns):
+        selected = {}  # type: Dict[str, Any]
+        for column in columns:
+            value = cls._lookup(row, column)
+            if value is _MISSING:
+                continue
+            keys = column.split('.')
+            target = selected
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+        return selected
+
+    @classmethod
+    def query(cls, columns=None, offset=0, limit=None, sort=None):
+        # type: (Optional[List[str]], int, Optional[int], Optional[str]) -> Tuple[List, int]
+        """
+        Return a page of the table.
+
+        :param columns: the attributes to return, dotted paths like
+            `stats.op_w` select nested ones. All of them by default.
+        :param offset: index of the first row returned
+        :param limit: maximum number of rows returned
+        :param sort: dotted path of the attribute to sort by, prefixed by
+            '+' (ascending) or '-' (descending). Rows keep the OSD map
+            order by default. Only attributes holding numbers or strings
+            can be sorted by, others raise a `DashboardException`.
+        :return: the rows and the total number of OSDs
+        """
+        rows = cls.rows()
+        if sort:
+            reverse = sort.startswith('-')
+            column = sort.lstrip('+-')
+            keys = [cls._sort_key(row, column) for row in rows]
+            # only numbers, or only strings, can be compared
+            values = [key[1] for key in keys if key[0]]
+            numbers = all(isinstance(v, (int, float)) for v in values)
+            if not numbers and not all(isinstance(v, str) for v in values):
+                raise DashboardException(msg='Cannot sort OSDs by {}'.format(column),
+                                         code='invalid_sort_key', component='osd')
+            order = sorted(range(len(rows)), key=keys.__getitem__, reverse=reverse)
+            rows = [rows[i] for i in order]
+        end = offset + limit if limit is not None else None
+        page = rows[offset:end]
+        if columns:
+            page = [cls._select(row, columns) for row in page]
+        return page, len(rows)
+
+
+@contextmanager
+def osd_table_changed():
+    """
+    Make the OSD table be rebuilt on its next read once the decorated
+    operation on OSDs is done, whether it succeeded or not.
+    """
+    try:
+        yield
+    finally:
+        OsdTable.reset()
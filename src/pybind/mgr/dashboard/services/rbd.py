@@ -2,16 +2,20 @@
 # pylint: disable=unused-argument
 from __future__ import absolute_import
 
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import cherrypy
 
 import rbd
 
 from .. import mgr
+from ..exceptions import DashboardException
 from ..tools import ViewCache
 from .ceph_service import CephService
 
 try:
-    from typing import List
+    from typing import Dict, List, Tuple
 except ImportError:
     pass  # For typing only
 
@@ -220,9 +224,29 @@ class RbdConfiguration(object):
 
 
 class RbdService(object):
+    # number of images inspected concurrently when listing a pool
+    LIST_WORKERS = 8
+    # scalar image attributes the image list can be sorted by
+    SORT_KEYS = frozenset([
+        'name', 'id', 'unique_id', 'pool_name', 'namespace', 'data_pool', 'size', 'obj_size',
+        'num_objs', 'order', 'block_name_prefix', 'image_format', 'features', 'timestamp',
+        'stripe_count', 'stripe_unit'])
+    # used bytes between two snapshots never change once the later one is
+    # taken, so they are cached by (pool, namespace, image id, snap id,
+    # previous snap id). Only the usage of the image head is recomputed.
+    _snap_usage_cache = {}  # type: Dict[Tuple, int]
+    _lock = threading.Lock()
+    _executor = None
+
+    @classmethod
+    def _map(cls, fn, items):
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=cls.LIST_WORKERS)
+        return list(cls._executor.map(fn, items))
 
     @classmethod
-    def _rbd_disk_usage(cls, image, snaps, whole_object=True):
+    def _rbd_disk_usage(cls, image, snaps, whole_object=True, cache_key=None):
         class DUCallback(object):
             def __init__(self):
                 self.used_size = 0
@@ -233,20 +257,28 @@ class RbdService(object):
 
         snap_map = {}
         prev_snap = None
+        prev_snap_id = None
         total_used_size = 0
-        for _, size, name in snaps:
-            image.set_snap(name)
-            du_callb = DUCallback()
-            image.diff_iterate(0, size, prev_snap, du_callb,
-                               whole_object=whole_object)
-            snap_map[name] = du_callb.used_size
-            total_used_size += du_callb.used_size
+        for snap_id, size, name in snaps:
+            key = cache_key + (snap_id, prev_snap_id) if cache_key and name else None
+            used_size = cls._snap_usage_cache.get(key) if key else None
+            if used_size is None:
+                image.set_snap(name)
+                du_callb = DUCallback()
+                image.diff_iterate(0, size, prev_snap, du_callb,
+                                   whole_object=whole_object)
+                used_size = du_callb.used_size
+                if key:
+                    cls._snap_usage_cache[key] = used_size
+            snap_map[name] = used_size
+            total_used_size += used_size
             prev_snap = name
+            prev_snap_id = snap_id
 
         return total_used_size, snap_map
 
     @classmethod
-    def _rbd_image(cls, ioctx, pool_name, namespace, image_name):
+    def _rbd_image(cls, ioctx, pool_name, namespace, image_name, brief=False):
         with rbd.Image(ioctx, image_name) as img:
 
             stat = img.stat()
@@ -296,6 +328,9 @@ class RbdService(object):
                 snap['is_protected'] = img.is_protected_snap(snap['name'])
                 snap['used_bytes'] = None
                 snap['children'] = []
+                if brief:
+                    stat['snapshots'].append(snap)
+                    continue
                 img.set_snap(snap['name'])
                 for child_pool_name, child_image_name in img.list_children():
                     snap['children'].append({
@@ -306,14 +341,17 @@ class RbdService(object):
 
             # disk usage
             img_flags = img.flags()
-            if 'fast-diff' in stat['features_name'] and \
+            if brief:
+                stat['total_disk_usage'] = None
+                stat['disk_usage'] = None
+            elif 'fast-diff' in stat['features_name'] and \
                     not rbd.RBD_FLAG_FAST_DIFF_INVALID & img_flags:
                 snaps = [(s['id'], s['size'], s['name'])
                          for s in stat['snapshots']]
                 snaps.sort(key=lambda s: s[0])
                 snaps += [(snaps[-1][0] + 1 if snaps else 0, stat['size'], None)]
                 total_prov_bytes, snaps_prov_bytes = cls._rbd_disk_usage(
-                    img, snaps, True)
+                    img, snaps, True, (pool_name, namespace, stat['id']))
                 stat['total_disk_usage'] = total_prov_bytes
                 for snap, prov_bytes in snaps_prov_bytes.items():
                     if snap is None:
@@ -327,42 +365,101 @@ class RbdService(object):
                 stat['total_disk_usage'] = None
                 stat['disk_usage'] = None
 
-            stat['configuration'] = RbdConfiguration(pool_ioctx=ioctx, image_name=image_name).list()
+            if not brief:
+                stat['configuration'] = RbdConfiguration(
+                    pool_ioctx=ioctx, image_name=image_name).list()
 
             return stat
 
     @classmethod
-    def _rbd_image_names(cls, ioctx):
-        rbd_inst = rbd.RBD()
-        return rbd_inst.list(ioctx)
+    def _rbd_image_stat(cls, ioctx, pool_name, namespace, image_name, brief=False):
+        return cls._rbd_image(ioctx, pool_name, namespace, image_name, brief)
 
     @classmethod
-    def _rbd_image_stat(cls, ioctx, pool_name, namespace, image_name):
-        return cls._rbd_image(ioctx, pool_name, namespace, image_name)
+    def _rbd_image_stats(cls, pool_name, refs, brief=False):
+        """
+        Inspects the (namespace, image name) pairs concurrently, images
+        removed in the meanwhile are left out. `brief` skips the disk usage,
+        snapshot children and configuration of the images.
+        """
+        def _stat(ref):
+            namespace, name = ref
+            with mgr.rados.open_ioctx(pool_name) as ioctx:
+                ioctx.set_namespace(namespace)
+                try:
+                    return cls._rbd_image_stat(ioctx, pool_name, namespace, name, brief)
+                except rbd.ImageNotFound:
+                    # may have been removed in the meanwhile
+                    return None
+
+        return [stat for stat in cls._map(_stat, refs) if stat is not None]
 
     @classmethod
-    @ViewCache()
-    def rbd_pool_list(cls, pool_name, namespace=None):
+    def _rbd_pool_image_refs(cls, pool_name, namespace=None):
         rbd_inst = rbd.RBD()
         with mgr.rados.open_ioctx(pool_name) as ioctx:
-            result = []
             if namespace:
                 namespaces = [namespace]
             else:
                 namespaces = rbd_inst.namespace_list(ioctx)
                 # images without namespace
                 namespaces.append('')
+            refs = []
+            image_ids = set()
             for current_namespace in namespaces:
                 ioctx.set_namespace(current_namespace)
-                names = cls._rbd_image_names(ioctx)
-                for name in names:
-                    try:
-                        stat = cls._rbd_image_stat(ioctx, pool_name, current_namespace, name)
-                    except rbd.ImageNotFound:
-                        # may have been removed in the meanwhile
-                        continue
-                    result.append(stat)
-            return result
+                for image in rbd_inst.list2(ioctx):
+                    refs.append((current_namespace, image['name']))
+                    image_ids.add((pool_name, current_namespace, image['id']))
+        # forget the usage of removed images
+        with cls._lock:
+            for key in list(cls._snap_usage_cache):
+                if key[0] == pool_name and (not namespace or key[1] == namespace) \
+                        and key[:3] not in image_ids:
+                    del cls._snap_usage_cache[key]
+        return refs
+
+    @classmethod
+    def rbd_pool_list(cls, pool_name, namespace=None, offset=0, limit=None, search='',
+                      sort='+name'):
+        """
+        Lists the images of a pool, or of one of its namespaces.
+
+        Images are filtered by `search` (a substring of their name) and
+        sorted by the `sort` key, prefixed by '+' (ascending) or '-'
+        (descending). Only the `limit` images starting at `offset` are
+        returned, along with the number of images matching `search`.
+        Sorting by name does not require inspecting the images outside of
+        the requested page. Disk usage is only computed for that page.
+
+        :return: tuple of the status of the cached value and of the tuple of
+            the list of images and the number of matching images
+        """
+        key = sort.lstrip('+-') or 'name'
+        if key not in cls.SORT_KEYS:
+            raise DashboardException(msg='Cannot sort images by {}'.format(key),
+                                     code='invalid_sort_key', component='rbd')
+        return cls._rbd_pool_list(pool_name, namespace, offset, limit, search, sort)
+
+    @classmethod
+    @ViewCache()
+    def _rbd_pool_list(cls, pool_name, namespace, offset, limit, search, sort):
+        refs = cls._rbd_pool_image_refs(pool_name, namespace)
+        if search:
+            refs = [ref for ref in refs if search in ref[1]]
+        total = len(refs)
+        reverse = sort.startswith('-')
+        key = sort.lstrip('+-') or 'name'
+        end = offset + limit if limit is not None else None
+        if key == 'name':
+            refs.sort(key=lambda ref: (ref[1], ref[0]), reverse=reverse)
+            return cls._rbd_image_stats(pool_name, refs[offset:end]), total
+
+        stats = cls._rbd_image_stats(pool_name, refs, brief=True)
+        stats.sort(key=lambda stat: (stat.get(key) is not None, stat.get(key)),
+                   reverse=reverse)
+        refs = [(stat['namespace'], stat['name']) for stat in stats[offset:end]]
+        return cls._rbd_image_stats(pool_name, refs), total
 
     @classmethod
     def get_image(cls, image_spec):
@@ -8,7 +8,8 @@ try:
 except ImportError:
     import unittest.mock as mock
 
-from ..services.ceph_service import CephService
+from ..exceptions import DashboardException
+from ..services.ceph_service import CephService, SendCommandError
 
 
 class CephServiceTest(unittest.TestCase):
@@ -65,3 +66,39 @@ class CephServiceTest(unittest.TestCase):
 
     def test_get_pg_status_without_match(self):
         self.assertEqual(self.service.get_pool_pg_status('no-pool'), {})
+
+    def test_get_smart_data_by_host(self):
+        self.mgr.return_value = {'osds': [{'osd': 0, 'up': 1}, {'osd': 1, 'up': 0},
+                                          {'osd': 2, 'up': 1}, {'osd': 3, 'up': 1}]}
+        devices = [
+            {'devid': 'dev0', 'daemons': ['osd.0']},
+            {'devid': 'dev1', 'daemons': ['osd.0', 'osd.1']},
+            {'devid': 'dev2', 'daemons': ['osd.1', 'osd.2', 'osd.3']},
+            {'devid': 'dev3', 'daemons': ['osd.3']},
+            {'devid': 'dev4', 'daemons': []},
+        ]
+
+        def send_command(srv_type, prefix, srv_spec='', **kwargs):
+            self.assertEqual((srv_type, prefix, kwargs), ('osd', 'smart', {}))
+            if srv_spec == '3':
+                raise SendCommandError('failed', prefix, {}, -5)
+            return {
+                '0': {'dev0': {'dev': 0}, 'dev1': {'dev': 1}},
+                '2': {'dev2': {'dev': 2}},
+            }[srv_spec]
+
+        with mock.patch.object(CephService, 'get_devices_by_host', return_value=devices), \
+                mock.patch.object(CephService, 'send_command',
+                                  side_effect=send_command) as send_command_mock:
+            smart_data = CephService.get_smart_data_by_host('host0')
+        self.assertEqual(smart_data, {'dev0': {'dev': 0}, 'dev1': {'dev': 1},
+                                      'dev2': {'dev': 2}})
+        # osd.0 covers two devices at once, dev2 is retried on osd.2
+        # after osd.3 failed.
+        self.assertEqual(sorted(call[0][2] for call in send_command_mock.call_args_list),
+                         ['0', '2', '3'])
+
+        with mock.patch.object(CephService, 'get_devices_by_host', return_value=devices[3:]), \
+                mock.patch.object(CephService, 'send_command', side_effect=send_command):
+            with self.assertRaises(DashboardException):
+                CephService.get_smart_data_by_host('host0')
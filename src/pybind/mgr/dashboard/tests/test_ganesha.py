@@ -85,22 +85,28 @@ EXPORT
     conf_nodeb = '%url "rados://ganesha/ns/export-1"'
 
     class RObject(object):
-        def __init__(self, key, raw):
+        def __init__(self, key, raw, io_mock=None):
             self.key = key
             self.raw = raw
+            self.version = 1
+            self.io_mock = io_mock
 
         def read(self, _):
             return self.raw.encode('utf-8')
 
         def stat(self):
+            if self.io_mock:
+                self.io_mock.get_last_version.return_value = self.version
             return len(self.raw), None
 
     def _ioctx_write_full_mock(self, key, content):
         if key not in self.temp_store:
             self.temp_store[key] = GaneshaConfTest.RObject(key,
-                                                           content.decode('utf-8'))
+                                                           content.decode('utf-8'),
+                                                           self.io_mock)
         else:
             self.temp_store[key].raw = content.decode('utf-8')
+            self.temp_store[key].version += 1
 
     def _ioctx_remove_mock(self, key):
         del self.temp_store[key]
@@ -121,6 +127,9 @@ EXPORT
         }
 
         self.io_mock = MagicMock()
+        for obj in self.temp_store.values():
+            obj.io_mock = self.io_mock
+        GaneshaConf._parsed_objects.clear()  # pylint: disable=protected-access
         self.io_mock.list_objects.side_effect = self._ioctx_list_objects_mock
         self.io_mock.write_full.side_effect = self._ioctx_write_full_mock
         self.io_mock.remove_object.side_effect = self._ioctx_remove_mock
@@ -643,3 +652,25 @@ EXPORT
         self.assertEqual(export.cluster_id, '_default_')
         self.assertEqual(export.attr_expiration_time, 0)
         self.assertEqual(export.security_label, True)
+
+    def test_parsed_objects_are_cached(self):
+        conf = GaneshaConf.instance('_default_')
+        self.assertEqual(len(conf.exports), 2)
+        parse = GaneshaConfParser.parse
+        ganesha.GaneshaConfParser.parse = MagicMock(side_effect=AssertionError)
+        try:
+            # unchanged objects are not parsed again
+            self.assertEqual(len(GaneshaConf.instance('_default_').exports), 2)
+        finally:
+            ganesha.GaneshaConfParser.parse = parse
+
+        self._ioctx_write_full_mock('export-2', self.export_2.replace('"/rgw"', '"/rgw2"')
+                                    .encode('utf-8'))
+        conf = GaneshaConf.instance('_default_')
+        self.assertEqual(conf.get_export(2).pseudo, '/rgw2')
+
+        conf.remove_export(1)
+        conf = GaneshaConf.instance('_default_')
+        self.assertEqual(list(conf.exports), [2])
+        self.assertNotIn(('ganesha', 'ns', 'export-1'),
+                         GaneshaConf._parsed_objects)  # pylint: disable=protected-access
@@ -8,6 +8,7 @@ from ceph.deployment.service_spec import PlacementSpec  # type: ignore
 
 from . import ControllerTestCase
 from ..controllers.osd import Osd
+from ..services.osd import OsdTable
 from ..tools import NotificationQueue, TaskManager
 from .. import mgr
 from .helper import update_dict
@@ -205,6 +206,8 @@ class OsdTest(ControllerTestCase):
     def _mock_osd_list(self, osd_stat_ids, osdmap_tree_node_ids, osdmap_ids):
         def mgr_get_replacement(*args, **kwargs):
             method = args[0] or kwargs['method']
+            if method == 'osd_map':
+                return {'osds': list(OsdHelper.gen_osdmap(osdmap_ids).values())}
             if method == 'osd_stats':
                 return {'osd_stats': OsdHelper.gen_osd_stats(osd_stat_ids)}
             if method == 'osd_map_tree':
@@ -216,11 +219,22 @@ class OsdTest(ControllerTestCase):
                 return {path: OsdHelper.gen_mgr_get_counter()}
             raise NotImplementedError()
 
-        with mock.patch.object(Osd, 'get_osd_map', return_value=OsdHelper.gen_osdmap(osdmap_ids)):
-            with mock.patch.object(mgr, 'get', side_effect=mgr_get_replacement):
-                with mock.patch.object(mgr, 'get_counter', side_effect=mgr_get_counter_replacement):
-                    with mock.patch.object(mgr, 'get_latest', return_value=1146609664):
-                        yield
+        def mgr_get_latest_perf_counters_replacement(svc_type, svc_name, _):
+            if svc_type == 'osd' and not svc_name:
+                return {
+                    'osd.{}'.format(i): {
+                        path: {'value': 1146609664} for path in OsdTable.GAUGE_COUNTERS
+                    } for i in osd_stat_ids
+                }
+            raise NotImplementedError()
+
+        OsdTable.reset()
+        with mock.patch.object(mgr, 'get', side_effect=mgr_get_replacement):
+            with mock.patch.object(mgr, 'get_counter', side_effect=mgr_get_counter_replacement):
+                with mock.patch.object(mgr, 'get_latest_perf_counters',
+                                       side_effect=mgr_get_latest_perf_counters_replacement):
+                    yield
+        OsdTable.reset()
 
     def test_osd_list_aggregation(self):
         """
@@ -237,6 +251,50 @@ class OsdTest(ControllerTestCase):
             self.assertEqual(len(self.json_body()), 2, 'It should display two OSDs without failure')
             self.assertStatus(200)
 
+    def test_osd_list_paginated(self):
+        osds = [0, 1, 2, 3]
+        with self._mock_osd_list(osd_stat_ids=osds, osdmap_tree_node_ids=osds,
+                                 osdmap_ids=osds):
+            self._get('/api/osd?offset=1&limit=2&sort=-id&columns=id,host.name,stats.numpg')
+            self.assertStatus(200)
+            self.assertHeader('X-Total-Count', '4')
+            self.assertJsonBody([
+                {'id': 2, 'host': {'name': 'ceph-1'}, 'stats': {'numpg': 1146609664}},
+                {'id': 1, 'host': {'name': 'ceph-1'}, 'stats': {'numpg': 1146609664}},
+            ])
+
+            self._get('/api/osd?columns=stats_history.op_w')
+            self.assertEqual(len(self.json_body()), 4)
+            self.assertEqual(self.json_body()[0], {'stats_history': {'op_w': [[1551973860, 0.0],
+                                                                              [1551973865, 0.0],
+                                                                              [1551973870, 0.0]]}})
+
+    def test_osd_list_sort_key(self):
+        osds = [0, 1, 2, 3]
+        with self._mock_osd_list(osd_stat_ids=osds, osdmap_tree_node_ids=osds,
+                                 osdmap_ids=osds):
+            self._get('/api/osd?sort=%2Bhost.name&columns=id')
+            self.assertStatus(200)
+            # objects cannot be compared
+            for sort in ('tree', '-host', 'stats_history.op_w'):
+                self._get('/api/osd?sort={}&columns=id'.format(sort))
+                self.assertStatus(400)
+
+    @mock.patch('dashboard.controllers.osd.CephService')
+    def test_osd_list_after_change(self, ceph_service):
+        with self._mock_osd_list(osd_stat_ids=[0, 1], osdmap_tree_node_ids=[0, 1],
+                                 osdmap_ids=[0, 1]):
+            self._get('/api/osd?columns=id')
+            self.assertJsonBody([{'id': 0}, {'id': 1}])
+            with mock.patch.object(OsdTable, 'build', wraps=OsdTable.build) as build:
+                self._get('/api/osd?columns=id')
+                build.assert_not_called()
+                self._post('/api/osd/1/purge')
+                self.assertStatus(200)
+                ceph_service.send_command.assert_called()
+                self._get('/api/osd?columns=id')
+                build.assert_called_once()
+
     @mock.patch('dashboard.controllers.osd.CephService')
     def test_osd_create_bare(self, ceph_service):
         ceph_service.send_command.return_value = '5'
@@ -8,7 +8,9 @@ try:
 except ImportError:
     import unittest.mock as mock
 
-from ..services.rbd import get_image_spec, parse_image_spec, RbdConfiguration
+from ..exceptions import DashboardException
+from ..services.rbd import get_image_spec, parse_image_spec, RbdConfiguration, RbdService
+from ..tools import ViewCache
 
 
 class RbdServiceTest(unittest.TestCase):
@@ -43,3 +45,42 @@ class RbdServiceTest(unittest.TestCase):
         self.assertEqual(config.list(), [])
         config = RbdConfiguration('good-pool')
         self.assertEqual(config.list(), [1, 2, 3])
+
+    @mock.patch('dashboard.services.rbd.RbdService._rbd_image_stat')
+    @mock.patch('dashboard.services.rbd.RbdService._rbd_pool_image_refs')
+    @mock.patch('dashboard.mgr.rados')
+    def test_rbd_pool_list_paginated(self, _rados, image_refs, image_stat):
+        sizes = {'img{}'.format(i): i % 3 for i in range(10)}
+        image_refs.return_value = [('', name) for name in sorted(sizes, reverse=True)]
+
+        def _stat(ioctx, pool_name, namespace, name, brief):
+            stat = {'name': name, 'namespace': namespace, 'size': sizes[name]}
+            if not brief:
+                stat['disk_usage'] = 1
+            return stat
+        image_stat.side_effect = _stat
+
+        status, (images, total) = RbdService.rbd_pool_list('pool', None, 2, 3, '', '+name')
+        self.assertEqual(status, ViewCache.VALUE_OK)
+        self.assertEqual(total, 10)
+        self.assertEqual([i['name'] for i in images], ['img2', 'img3', 'img4'])
+        # disk usage is only computed for the requested page
+        self.assertEqual(image_stat.call_count, 3)
+
+        image_stat.reset_mock()
+        _, (images, total) = RbdService.rbd_pool_list('pool', None, 0, 2, 'img', '-size')
+        self.assertEqual(total, 10)
+        self.assertEqual([i['size'] for i in images], [2, 2])
+        self.assertTrue(all('disk_usage' in i for i in images))
+
+        _, (images, total) = RbdService.rbd_pool_list('pool', None, 0, None, 'img1', '+name')
+        self.assertEqual((total, [i['name'] for i in images]), (1, ['img1']))
+
+    @mock.patch('dashboard.services.rbd.RbdService._rbd_pool_image_refs')
+    def test_rbd_pool_list_sort_key(self, image_refs):
+        # only scalar attributes can be compared
+        for sort in ('+snapshots', '-parent', '+features_name', '+disk_usage', '+foo'):
+            with self.assertRaises(DashboardException) as ctx:
+                RbdService.rbd_pool_list('pool', None, 0, None, '', sort)
+            self.assertEqual(ctx.exception.status, 400)
+        image_refs.assert_not_called()
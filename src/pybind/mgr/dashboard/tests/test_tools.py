@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
+import threading
+import time
 import unittest
 
 import cherrypy
@@ -15,7 +17,7 @@ from ..services.exception import handle_rados_error
 from ..controllers import RESTController, ApiController, Controller, \
                           BaseController, Proxy
 from ..tools import dict_contains_path, json_str_to_object, partial_dict,\
-                    dict_get, RequestLoggingTool
+                    dict_get, RequestLoggingTool, ViewCache
 
 
 # pylint: disable=W0613
@@ -90,6 +92,17 @@ class RESTControllerTest(ControllerTestCase):
         self.assertHeader('Content-Type', 'application/json')
         self.assertBody('[]')
 
+    def test_etag(self):
+        self._get("/foo/default")
+        self.assertStatus('200 OK')
+        etag = self.assertHeader('ETag')
+        self._get("/foo/default", headers=[('If-None-Match', etag)])
+        self.assertStatus(304)
+        self.assertBody('')
+        self._get("/foo/other", headers=[('If-None-Match', etag)])
+        self.assertStatus('200 OK')
+        self.assertJsonBody({'detail': ['other', []]})
+
     def test_fill(self):
         sess_mock = RamSession()
         with patch('cherrypy.session', sess_mock, create=True):
@@ -201,3 +214,89 @@ class TestFunctions(unittest.TestCase):
         self.assertFalse(dict_get({'foo': {'bar': False}}, 'foo.bar'))
         self.assertIsNone(dict_get({'foo': {'bar': False}}, 'foo.bar.baz'))
         self.assertEqual(dict_get({'foo': {'bar': False}, 'baz': 'xyz'}, 'baz'), 'xyz')
+
+
+class ViewCacheTest(unittest.TestCase):
+
+    def test_coalesce_concurrent_calls(self):
+        calls = []
+
+        @ViewCache(timeout=5)
+        def _fetch(arg):
+            calls.append(arg)
+            time.sleep(0.2)
+            return arg * 2
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(_fetch(21)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, [21])
+        self.assertEqual(results, [(ViewCache.VALUE_OK, 42)] * 5)
+        self.assertEqual(_fetch(21), (ViewCache.VALUE_OK, 42))
+        self.assertEqual(calls, [21])
+
+    def test_stale_period(self):
+        calls = []
+
+        @ViewCache(stale_period=0)
+        def _fetch():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(_fetch(), (ViewCache.VALUE_OK, 1))
+        self.assertEqual(_fetch(), (ViewCache.VALUE_OK, 2))
+
+    def test_lru_eviction(self):
+        view = ViewCache(maxsize=2)
+        fetch = view(lambda arg: arg)
+        for arg in (1, 2, 1, 3):
+            fetch(arg)
+        self.assertEqual(list(view.cache_by_args), [(1,), (3,)])
+        stats = view.dump_stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['entries'], 2)
+
+    def test_ttl_eviction(self):
+        view = ViewCache(ttl=0)
+        fetch = view(lambda arg: arg)
+        fetch(1)
+        time.sleep(0.01)
+        fetch(2)
+        self.assertEqual(list(view.cache_by_args), [(2,)])
+
+    def test_nested_fetch_does_not_wait_for_workers(self):
+        @ViewCache(stale_period=0)
+        def _inner():
+            return 1
+
+        @ViewCache(timeout=5, stale_period=0)
+        def _outer(arg):
+            return _inner()[1] + arg
+
+        # occupy every worker with a fetch depending on another view
+        results = []
+        threads = [threading.Thread(target=lambda i=i: results.append(_outer(i)))
+                   for i in range(ViewCache.MAX_WORKERS * 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results),
+                         [(ViewCache.VALUE_OK, i + 1) for i in range(ViewCache.MAX_WORKERS * 2)])
+
+    def test_dump_all_stats(self):
+        @ViewCache()
+        def _viewcache_stats_test():
+            return 1
+
+        _viewcache_stats_test()
+        stats = [s for s in ViewCache.dump_all_stats()
+                 if s['name'].endswith('_viewcache_stats_test')]
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]['fetches'], 1)
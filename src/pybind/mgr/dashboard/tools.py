@@ -6,12 +6,14 @@ import json
 import logging
 
 import collections
+import concurrent.futures
 from datetime import datetime, timedelta
 from distutils.util import strtobool
 import fnmatch
 import time
 import threading
 import urllib
+import weakref
 
 import cherrypy
 
@@ -24,10 +26,48 @@ from .services.auth import JwtManager
 
 try:
     from typing import Any, AnyStr, Callable, DefaultDict, Deque,\
-        Dict, List, Set, Tuple, Union  # noqa pylint: disable=unused-import
+        Dict, List, Optional, Set, Tuple, Union  # noqa pylint: disable=unused-import
 except ImportError:
     pass  # For typing only
 
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+
+def _json_dumps_stdlib(obj):
+    # type: (Any) -> bytes
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def _json_dumps_orjson(obj):
+    # type: (Any) -> bytes
+    try:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # e.g. integers exceeding 64 bits
+        return _json_dumps_stdlib(obj)
+
+
+# available JSON encoders, the first one is used to serialize responses
+JSON_ENCODERS = collections.OrderedDict()  # type: collections.OrderedDict
+if orjson is not None:
+    JSON_ENCODERS['orjson'] = _json_dumps_orjson
+JSON_ENCODERS['json'] = _json_dumps_stdlib
+
+
+def json_dumps(obj):
+    # type: (Any) -> bytes
+    """
+    Serializes `obj` into UTF-8 encoded JSON with the fastest encoder
+    available, see `JSON_ENCODERS`.
+
+    >>> json_dumps({'a': [1, 2]})
+    b'{"a":[1,2]}'
+    """
+    return next(iter(JSON_ENCODERS.values()))(obj)
+
 
 class RequestLoggingTool(cherrypy.Tool):
     def __init__(self):
@@ -127,69 +167,83 @@ class RequestLoggingTool(cherrypy.Tool):
 
 # pylint: disable=too-many-instance-attributes
 class ViewCache(object):
+    """
+    Caches the results of a function by its positional arguments, so that
+    dashboard views do not hit the cluster on every request.
+
+    Values fetched less than `stale_period` seconds ago are returned
+    immediately. Older values are refreshed in a worker pool shared by all
+    views, concurrent callers wait for the same fetch. If the fetch does not
+    complete within `timeout`, the most recent value is returned as stale.
+
+    At most `maxsize` argument tuples are kept per view, the least recently
+    used ones are evicted first. Entries unused for `ttl` seconds are evicted
+    as well.
+    """
     VALUE_OK = 0
     VALUE_STALE = 1
     VALUE_NONE = 2
 
-    class GetterThread(threading.Thread):
-        def __init__(self, view, fn, args, kwargs):
-            super(ViewCache.GetterThread, self).__init__()
-            self._view = view
-            self.event = threading.Event()
-            self.fn = fn
-            self.args = args
-            self.kwargs = kwargs
+    # number of threads shared by all views to fetch values
+    MAX_WORKERS = 8
 
-        # pylint: disable=broad-except
-        def run(self):
-            t0 = 0.0
-            t1 = 0.0
-            try:
-                t0 = time.time()
-                self._view.logger.debug("starting execution of %s", self.fn)
-                val = self.fn(*self.args, **self.kwargs)
-                t1 = time.time()
-            except Exception as ex:
-                with self._view.lock:
-                    self._view.logger.exception("Error while calling fn=%s ex=%s", self.fn,
-                                                str(ex))
-                    self._view.value = None
-                    self._view.value_when = None
-                    self._view.getter_thread = None
-                    self._view.exception = ex
-            else:
-                with self._view.lock:
-                    self._view.latency = t1 - t0
-                    self._view.value = val
-                    self._view.value_when = datetime.now()
-                    self._view.getter_thread = None
-                    self._view.exception = None
-
-            self._view.logger.debug("execution of %s finished in: %s", self.fn,
-                                    t1 - t0)
-            self.event.set()
+    _executor = None  # type: Optional[concurrent.futures.ThreadPoolExecutor]
+    _executor_lock = threading.Lock()
+    _views = weakref.WeakSet()  # type: weakref.WeakSet
+    # set while a worker fetches a value
+    _fetching = threading.local()
 
     class RemoteViewCache(object):
-        # Return stale data if
-        STALE_PERIOD = 1.0
-
-        def __init__(self, timeout):
-            self.getter_thread = None
-            # Consider data within 1s old to be sufficiently fresh
-            self.timeout = timeout
-            self.event = threading.Event()
+        def __init__(self, view):
+            self.view = view
+            self.future = None  # type: Optional[concurrent.futures.Future]
             self.value_when = None
             self.value = None
-            self.latency = 0
+            self.latency = 0.0
             self.exception = None
+            self.last_used = time.time()
             self.lock = threading.Lock()
-            self.logger = logging.getLogger('viewcache')
 
         def reset(self):
             with self.lock:
                 self.value_when = None
                 self.value = None
 
+        # pylint: disable=broad-except
+        def fetch(self, fn, args, kwargs):
+            nested = getattr(ViewCache._fetching, 'active', False)
+            ViewCache._fetching.active = True
+            t0 = time.time()
+            t1 = t0
+            try:
+                self.view.logger.debug("starting execution of %s", fn)
+                val = fn(*args, **kwargs)
+                t1 = time.time()
+            except Exception as ex:
+                with self.lock:
+                    self.view.logger.exception("Error while calling fn=%s ex=%s", fn,
+                                               str(ex))
+                    self.value = None
+                    self.value_when = None
+                    if not nested:
+                        self.future = None
+                    self.exception = ex
+                self.view.count('errors')
+            else:
+                with self.lock:
+                    self.latency = t1 - t0
+                    self.value = val
+                    self.value_when = datetime.now()
+                    if not nested:
+                        self.future = None
+                    self.exception = None
+                self.view.record_latency(t1 - t0)
+            finally:
+                ViewCache._fetching.active = nested
+
+            self.view.logger.debug("execution of %s finished in: %s", fn,
+                                   t1 - t0)
+
         def run(self, fn, args, kwargs):
             """
             If data less than `stale_period` old is available, return it
@@ -206,23 +260,36 @@ class ViewCache(object):
             """
             with self.lock:
                 now = datetime.now()
+                self.last_used = time.time()
                 if self.value_when and now - self.value_when < timedelta(
-                        seconds=self.STALE_PERIOD):
+                        seconds=self.view.stale_period):
+                    self.view.count('hits')
                     return ViewCache.VALUE_OK, self.value
 
-                if self.getter_thread is None:
-                    self.getter_thread = ViewCache.GetterThread(self, fn, args,
-                                                                kwargs)
-                    self.getter_thread.start()
+                # when called from a fetch, the value is fetched by the
+                # calling worker: waiting for another one could block all of
+                # them.
+                nested = getattr(ViewCache._fetching, 'active', False)
+                future = self.future
+                if nested or future is None:
+                    self.view.count('misses')
+                    if not nested:
+                        future = ViewCache.executor().submit(self.fetch, fn, args, kwargs)
+                        self.future = future
                 else:
-                    self.logger.debug("getter_thread still alive for: %s", fn)
-
-                ev = self.getter_thread.event
+                    self.view.count('coalesced')
+                    self.view.logger.debug("fetch still in progress for: %s", fn)
 
-            success = ev.wait(timeout=self.timeout)
+            if nested:
+                self.fetch(fn, args, kwargs)
+                done = True
+            else:
+                assert future is not None
+                finished, _ = concurrent.futures.wait([future], timeout=self.view.timeout)
+                done = bool(finished)
 
             with self.lock:
-                if success:
+                if done:
                     # We fetched the data within the timeout
                     if self.exception:
                         # execution raised an exception
@@ -231,28 +298,104 @@ class ViewCache(object):
                     return ViewCache.VALUE_OK, self.value
                 if self.value_when is not None:
                     # We have some data, but it doesn't meet freshness requirements
+                    self.view.count('stale')
                     return ViewCache.VALUE_STALE, self.value
                 # We have no data, not even stale data
+                self.view.count('no_data')
                 raise ViewCacheNoDataException()
 
-    def __init__(self, timeout=5):
+    def __init__(self, timeout=5, stale_period=1.0, maxsize=128, ttl=600):
         self.timeout = timeout
-        self.cache_by_args = {}
+        self.stale_period = stale_period
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.cache_by_args = collections.OrderedDict()  # type: collections.OrderedDict
+        self.lock = threading.Lock()
+        self.name = None  # type: Any
+        self.logger = logging.getLogger('viewcache')
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'stale': 0,
+            'no_data': 0,
+            'errors': 0,
+            'evictions': 0,
+            'fetches': 0,
+            'latency_last': 0.0,
+            'latency_max': 0.0,
+            'latency_total': 0.0,
+        }
+        ViewCache._views.add(self)
+
+    @classmethod
+    def executor(cls):
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=cls.MAX_WORKERS, thread_name_prefix='viewcache')
+            return cls._executor
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def record_latency(self, latency):
+        with self.lock:
+            self.stats['fetches'] += 1
+            self.stats['latency_last'] = latency
+            self.stats['latency_max'] = max(self.stats['latency_max'], latency)
+            self.stats['latency_total'] += latency
+
+    def _get_entry(self, args):
+        with self.lock:
+            rvc = self.cache_by_args.get(args, None)
+            if rvc:
+                self.cache_by_args.move_to_end(args)
+                return rvc
+            rvc = ViewCache.RemoteViewCache(self)
+            self.cache_by_args[args] = rvc
+            expire = time.time() - self.ttl
+            while len(self.cache_by_args) > 1:
+                oldest = next(iter(self.cache_by_args.values()))
+                if len(self.cache_by_args) <= self.maxsize and oldest.last_used >= expire:
+                    break
+                self.cache_by_args.popitem(last=False)
+                self.stats['evictions'] += 1
+            return rvc
 
     def __call__(self, fn):
+        self.name = '{}.{}'.format(fn.__module__, fn.__qualname__)
+
         def wrapper(*args, **kwargs):
-            rvc = self.cache_by_args.get(args, None)
-            if not rvc:
-                rvc = ViewCache.RemoteViewCache(self.timeout)
-                self.cache_by_args[args] = rvc
-            return rvc.run(fn, args, kwargs)
+            return self._get_entry(args).run(fn, args, kwargs)
         wrapper.reset = self.reset  # type: ignore
         return wrapper
 
     def reset(self):
-        for _, rvc in self.cache_by_args.items():
+        with self.lock:
+            entries = list(self.cache_by_args.values())
+        for rvc in entries:
             rvc.reset()
 
+    def dump_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self.cache_by_args)
+        stats['latency_avg'] = \
+            stats['latency_total'] / stats['fetches'] if stats['fetches'] else 0.0
+        stats.update(name=self.name, maxsize=self.maxsize, ttl=self.ttl,
+                     timeout=self.timeout, stale_period=self.stale_period)
+        return stats
+
+    @classmethod
+    def dump_all_stats(cls):
+        """
+        :return: the statistics of every view cache, by the cached function
+        """
+        return sorted((view.dump_stats() for view in list(cls._views) if view.name),
+                      key=lambda stats: stats['name'])
+
 
 class NotificationQueue(threading.Thread):
     _ALL_TYPES_ = '__ALL__'
@@ -2,13 +2,17 @@
 Device health monitoring
 """
 
+import contextlib
 import errno
 import json
+import os
 from mgr_module import MgrModule, CommandResult
 import operator
+import queue
 import rados
 from threading import Event
 from datetime import datetime, timedelta, date, time
+import time as _time
 
 TIME_FORMAT = '%Y%m%d-%H%M%S'
 
@@ -23,6 +27,27 @@ HEALTH_MESSAGES = {
 
 MAX_SAMPLES=500
 
+# number of scraped devices whose metrics are written to the pool at once
+SCRAPE_WRITE_BATCH = 64
+
+
+class ScrapeResult(CommandResult):
+    """
+    A ``smart`` command sent to a daemon by :meth:`Module.scrape_all`.
+    It hands itself to the ``done`` queue on completion, so the scraper
+    can wait for whichever daemon answers first.
+    """
+    def __init__(self, daemon_type, daemon_id, done):
+        super(ScrapeResult, self).__init__('')
+        self.daemon_type = daemon_type
+        self.daemon_id = daemon_id
+        self.done = done
+        self.deadline = None
+
+    def complete(self, r, outb, outs):
+        super(ScrapeResult, self).complete(r, outb, outs)
+        self.done.put(self)
+
 
 class Module(MgrModule):
     MODULE_OPTIONS = [
@@ -82,6 +107,20 @@ class Module(MgrModule):
             'desc': 'how frequently to wake up and check device health',
             'runtime': True,
         },
+        {
+            'name': 'scrape_concurrency',
+            'default': 32,
+            'type': 'int',
+            'desc': 'how many daemons to scrape health metrics from at once',
+            'runtime': True,
+        },
+        {
+            'name': 'scrape_timeout',
+            'default': 120,
+            'type': 'secs',
+            'desc': 'how long to wait for a daemon to report its device health metrics',
+            'runtime': True,
+        },
     ]
 
     COMMANDS = [
@@ -324,28 +363,100 @@ class Module(MgrModule):
         osdmap = self.get("osd_map")
         assert osdmap is not None
         ioctx = self.open_connection()
-        did_device = {}
-        ids = []
-        for osd in osdmap['osds']:
-            ids.append(('osd', str(osd['osd'])))
-        monmap = self.get("mon_map")
-        for mon in monmap['mons']:
-            ids.append(('mon', mon['name']))
-        for daemon_type, daemon_id in ids:
-            raw_smart_data = self.do_scrape_daemon(daemon_type, daemon_id)
-            if not raw_smart_data:
-                continue
+        ids = self.pick_scrape_daemons(osdmap, self.get("mon_map"),
+                                       self.get("devices"))
+        self.log.debug('scraping %d daemons' % len(ids))
+        did_device = set()
+        metrics = []
+        for daemon_type, daemon_id, raw_smart_data in self.scrape_daemons(ids):
             for device, raw_data in raw_smart_data.items():
                 if device in did_device:
                     self.log.debug('skipping duplicate %s' % device)
                     continue
-                did_device[device] = 1
+                did_device.add(device)
                 data = self.extract_smart_features(raw_data)
                 if device and data:
-                    self.put_device_metrics(ioctx, device, data)
+                    metrics.append((device, data))
+            if len(metrics) >= SCRAPE_WRITE_BATCH:
+                self.put_device_metrics_batch(ioctx, metrics)
+                metrics = []
+        if metrics:
+            self.put_device_metrics_batch(ioctx, metrics)
         ioctx.close()
         return 0, "", ""
 
+    def pick_scrape_daemons(self, osdmap, monmap, devices):
+        """
+        Pick one running daemon to scrape for each known device.  A
+        daemon reports all of its devices at once, so a device that is
+        shared with an already picked daemon does not add another one.
+
+        :return: a list of (daemon_type, daemon_id)
+        """
+        running = set('osd.%d' % osd['osd'] for osd in osdmap['osds']
+                      if osd['up'])
+        running.update('mon.%s' % mon['name'] for mon in monmap['mons'])
+        picked = set()
+        ids = []
+        for dev in devices['devices']:
+            candidates = [who for who in dev.get('daemons', [])
+                          if who in running]
+            if not candidates:
+                self.log.debug('no running daemon to scrape %s from' %
+                               dev['devid'])
+                continue
+            if any(who in picked for who in candidates):
+                continue
+            picked.add(candidates[0])
+            ids.append(tuple(candidates[0].split('.', 1)))
+        return ids
+
+    def scrape_daemons(self, ids):
+        """
+        Send ``smart`` to the given daemons, keeping up to
+        ``scrape_concurrency`` of them in flight, and yield
+        ``(daemon_type, daemon_id, raw_smart_data)`` in the order they
+        answer.  A daemon that does not answer within ``scrape_timeout``
+        is skipped.
+        """
+        concurrency = max(int(self.scrape_concurrency), 1)
+        timeout = int(self.scrape_timeout) or 120
+        todo = list(reversed(ids))
+        in_flight = set()
+        done = queue.Queue()
+        while self.run and (todo or in_flight):
+            while todo and len(in_flight) < concurrency:
+                daemon_type, daemon_id = todo.pop()
+                self.log.debug('scraping %s.%s' % (daemon_type, daemon_id))
+                result = ScrapeResult(daemon_type, daemon_id, done)
+                result.deadline = _time.monotonic() + timeout
+                in_flight.add(result)
+                self.send_command(result, daemon_type, daemon_id, json.dumps({
+                    'prefix': 'smart',
+                    'format': 'json',
+                    'devid': '',
+                }), '')
+            wait = min(r.deadline for r in in_flight) - _time.monotonic()
+            try:
+                result = done.get(timeout=max(wait, 0))
+            except queue.Empty:
+                now = _time.monotonic()
+                for result in [r for r in in_flight if r.deadline <= now]:
+                    self.log.warning(
+                        '%s.%s did not report device health metrics '
+                        'within %d seconds' % (result.daemon_type,
+                                               result.daemon_id, timeout))
+                    in_flight.remove(result)
+                continue
+            if result not in in_flight:
+                # answered after it timed out
+                continue
+            in_flight.remove(result)
+            raw_smart_data = self.parse_smart_data(
+                result.daemon_type, result.daemon_id, result.outb)
+            if raw_smart_data:
+                yield result.daemon_type, result.daemon_id, raw_smart_data
+
     def scrape_device(self, devid):
         r = self.get("device " + devid)
         if not r or 'device' not in r.keys():
@@ -378,7 +489,9 @@ class Module(MgrModule):
             'devid': devid,
         }), '')
         r, outb, outs = result.wait()
+        return self.parse_smart_data(daemon_type, daemon_id, outb)
 
+    def parse_smart_data(self, daemon_type, daemon_id, outb):
         try:
             return json.loads(outb)
         except (IndexError, ValueError):
@@ -387,39 +500,36 @@ class Module(MgrModule):
                     daemon_type, daemon_id, outb))
 
     def put_device_metrics(self, ioctx, devid, data):
-        assert devid
+        self.put_device_metrics_batch(ioctx, [(devid, data)])
+
+    def put_device_metrics_batch(self, ioctx, metrics):
+        """
+        Store a sample for each ``(devid, data)`` in ``metrics``.  Keys are
+        timestamps, so the samples older than ``retention_period`` are
+        pruned as one key range by the same write, whatever their number.
+        The writes of all devices are issued at once.
+        """
         old_key = datetime.utcnow() - timedelta(
             seconds=int(self.retention_period))
         prune = old_key.strftime(TIME_FORMAT)
-        self.log.debug('put_device_metrics device %s prune %s' %
-                       (devid, prune))
-        erase = []
-        try:
-            with rados.ReadOpCtx() as op:
-                omap_iter, ret = ioctx.get_omap_keys(op, "", MAX_SAMPLES)  # fixme
-                assert ret == 0
-                ioctx.operate_read_op(op, devid)
-                for key, _ in list(omap_iter):
-                    if key >= prune:
-                        break
-                    erase.append(key)
-        except rados.ObjectNotFound:
-            # The object doesn't already exist, no problem.
-            pass
-        except rados.Error as e:
-            # Do not proceed with writes if something unexpected
-            # went wrong with the reads.
-            self.log.exception("Error reading OMAP: {0}".format(e))
-            return
-
         key = datetime.utcnow().strftime(TIME_FORMAT)
-        self.log.debug('put_device_metrics device %s key %s = %s, erase %s' %
-                       (devid, key, data, erase))
-        with rados.WriteOpCtx() as op:
-            ioctx.set_omap(op, (key,), (str(json.dumps(data)),))
-            if len(erase):
-                ioctx.remove_omap_keys(op, tuple(erase))
-            ioctx.operate_write_op(op, devid)
+        with contextlib.ExitStack() as stack:
+            writes = []
+            for devid, data in metrics:
+                assert devid
+                self.log.debug('put_device_metrics device %s key %s = %s, '
+                               'prune < %s' % (devid, key, data, prune))
+                op = stack.enter_context(rados.WriteOpCtx())
+                ioctx.set_omap(op, (key,), (str(json.dumps(data)),))
+                ioctx.remove_omap_range2(op, '', prune)
+                writes.append((devid, ioctx.operate_aio_write_op(op, devid)))
+
+            for devid, completion in writes:
+                completion.wait_for_complete()
+                ret = completion.get_return_value()
+                if ret < 0:
+                    self.log.error('Error writing OMAP of %s: %s' %
+                                   (devid, os.strerror(-ret)))
 
     def _get_device_metrics(self, devid, sample=None, min_sample=None):
         res = {}
@@ -643,5 +753,14 @@ class Module(MgrModule):
     def get_recent_device_metrics(self, devid, min_sample):
         return self._get_device_metrics(devid, min_sample=min_sample)
 
+    def get_device_metrics_for_days(self, devid, days):
+        """
+        Read only the samples of the last ``days`` days, starting the omap
+        listing at the first key in that window.
+        """
+        min_sample = datetime.utcnow() - timedelta(days=days)
+        return self._get_device_metrics(
+            devid, min_sample=min_sample.strftime(TIME_FORMAT))
+
     def get_time_format(self):
         return TIME_FORMAT
@@ -4,7 +4,7 @@ diskprediction with local predictor
 import json
 import datetime
 import _strptime
-from threading import Event
+from threading import Event, Lock
 import time
 
 from mgr_module import MgrModule, CommandResult
@@ -21,6 +21,8 @@ import scipy
 TIME_FORMAT = '%Y%m%d-%H%M%S'
 TIME_DAYS = 24*60*60
 TIME_WEEK = TIME_DAYS * 7
+# the predictors look at up to 12 daily samples; leave room for missed scrapes
+PREDICTION_HISTORY_DAYS = 14
 
 
 class Module(MgrModule):
@@ -49,6 +51,9 @@ class Module(MgrModule):
         # other
         self._run = True
         self._event = Event()
+        # initialized predictors, by predictor_model
+        self._predictors = {}
+        self._predictors_lock = Lock()
 
     def config_notify(self):
         for opt in self.MODULE_OPTIONS:
@@ -134,40 +139,42 @@ class Module(MgrModule):
         return datetime.datetime.fromtimestamp(
             predicted_timestamp / (1000 ** 3) + life_expectancy_day).strftime('%Y-%m-%d')
 
-    def _predict_life_expentancy(self, devid):
-        predicted_result = ''
+    def _get_predictor(self):
+        """
+        The predictor for the configured model, with its models loaded
+        only once and shared by all predictions.
+        """
+        with self._predictors_lock:
+            if self.predictor_model in self._predictors:
+                return self._predictors[self.predictor_model]
+
+            # initialize appropriate disk failure predictor model
+            from .predictor import get_diskfailurepredictor_path
+            if self.predictor_model == 'prophetstor':
+                from .predictor import PSDiskFailurePredictor
+                obj_predictor = PSDiskFailurePredictor()
+            elif self.predictor_model == 'redhat':
+                from .predictor import RHDiskFailurePredictor
+                obj_predictor = RHDiskFailurePredictor()
+            else:
+                self.log.error('invalid value received for MODULE_OPTIONS.predictor_model')
+                return None
+            ret = obj_predictor.initialize("{}/models/{}".format(get_diskfailurepredictor_path(), self.predictor_model))
+            if ret is not None:
+                self.log.error('Error initializing predictor')
+                return None
+            self._predictors[self.predictor_model] = obj_predictor
+            return obj_predictor
+
+    def _get_predict_datas(self, devid):
         health_data = {}
         predict_datas = []
         try:
-            r, outb, outs = self.remote('devicehealth', 'show_device_metrics', devid=devid, sample='')
-            if r != 0:
-                self.log.error('failed to get device %s health', devid)
-                health_data = {}
-            else:
-                health_data = json.loads(outb)
+            health_data = self.remote('devicehealth', 'get_device_metrics_for_days',
+                                      devid, PREDICTION_HISTORY_DAYS)
         except Exception as e:
             self.log.error('failed to get device %s health data due to %s', devid, str(e))
 
-        # initialize appropriate disk failure predictor model
-        from .predictor import get_diskfailurepredictor_path
-        if self.predictor_model == 'prophetstor':
-            from .predictor import PSDiskFailurePredictor
-            obj_predictor = PSDiskFailurePredictor()
-            ret = obj_predictor.initialize("{}/models/{}".format(get_diskfailurepredictor_path(), self.predictor_model))
-            if ret is not None:
-                self.log.error('Error initializing predictor')
-                return predicted_result
-        elif self.predictor_model == 'redhat':
-            from .predictor import RHDiskFailurePredictor
-            obj_predictor = RHDiskFailurePredictor()
-            ret = obj_predictor.initialize("{}/models/{}".format(get_diskfailurepredictor_path(), self.predictor_model))
-            if ret is not None:
-                self.log.error('Error initializing predictor')
-                return predicted_result
-        else:
-            self.log.error('invalid value received for MODULE_OPTIONS.predictor_model')
-            return predicted_result
-
         if len(health_data) >= 6:
             o_keys = sorted(health_data.keys(), reverse=True)
             for o_key in o_keys:
@@ -217,10 +224,29 @@ class Module(MgrModule):
                     break
         else:
             self.log.error('unable to predict device due to health data records less than 6 days')
+        return predict_datas
+
+    def _predict_life_expentancies(self, devids):
+        """
+        :return: a dict of device id to predicted result, '' when a device
+            has too little health data or no predictor could be loaded
+        """
+        predicted_results = dict.fromkeys(devids, '')
+        obj_predictor = self._get_predictor()
+        if obj_predictor is None:
+            return predicted_results
+
+        disks = {}
+        for devid in devids:
+            predict_datas = self._get_predict_datas(devid)
+            if len(predict_datas) >= 6:
+                disks[devid] = predict_datas
+        if disks:
+            predicted_results.update(obj_predictor.predict_batch(disks))
+        return predicted_results
 
-        if len(predict_datas) >= 6:
-            predicted_result = obj_predictor.predict(predict_datas)
-        return predicted_result
+    def _predict_life_expentancy(self, devid):
+        return self._predict_life_expentancies([devid])[devid]
 
     def predict_life_expectancy(self, devid):
         result = self._predict_life_expentancy(devid)
@@ -269,14 +295,13 @@ class Module(MgrModule):
 
     def predict_all_devices(self):
         self.log.debug('predict_all_devices')
-        devices = self.get('devices').get('devices', [])
+        devices = [devInfo for devInfo in self.get('devices').get('devices', [])
+                   if devInfo.get('daemons') and devInfo.get('devid')]
+        results = self._predict_life_expentancies(
+            [devInfo['devid'] for devInfo in devices])
         for devInfo in devices:
-            if not devInfo.get('daemons'):
-                continue
-            if not devInfo.get('devid'):
-                continue
             self.log.debug('%s' % devInfo)
-            result = self._predict_life_expentancy(devInfo['devid'])
+            result = results[devInfo['devid']]
             if result == 'unknown':
                 self._reset_device_life_expectancy(devInfo['devid'])
                 continue
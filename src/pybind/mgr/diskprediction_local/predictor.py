@@ -36,6 +36,27 @@ def get_diskfailurepredictor_path():
     return dir_path
 
 
+def load_pickle(cache, path):
+    """Unpickle the model or scaler at path, once per cache
+
+    Arguments:
+        cache {dict} -- objects loaded so far, by path
+        path {str} -- path to the pickle file
+
+    Returns:
+        object -- the unpickled object
+    """
+    if path not in cache:
+        try:
+            with open(path, "rb") as f:
+                cache[path] = pickle.load(f)
+        except UnicodeDecodeError:
+            # Compatibility for python3
+            with open(path, "rb") as f:
+                cache[path] = pickle.load(f, encoding="latin1")
+    return cache[path]
+
+
 class RHDiskFailurePredictor(object):
     """Disk failure prediction module developed at Red Hat
 
@@ -67,6 +88,8 @@ class RHDiskFailurePredictor(object):
         """
         self.model_dirpath = ""
         self.model_context = {}
+        # unpickled models and scalers, by path
+        self.models = {}
 
     def initialize(self, model_dirpath):
         """Initialize all models. Save paths of all trained model files to list
@@ -98,7 +121,7 @@ class RHDiskFailurePredictor(object):
         self.model_dirpath = model_dirpath
 
     def __preprocess(self, disk_days, manufacturer):
-        """Scales and transforms input dataframe to feed it to prediction model
+        """Transforms input dataframe to feed it to prediction model
 
         Arguments:
             disk_days {list} -- list in which each element is a dictionary with key,val
@@ -108,7 +131,7 @@ class RHDiskFailurePredictor(object):
 
         Returns:
             numpy.ndarray -- (n, d) shaped array of n days worth of data and d
-                                features, scaled
+                                features, not scaled yet
         """
         # get the attributes that were used to train model for current manufacturer
         try:
@@ -121,22 +144,21 @@ class RHDiskFailurePredictor(object):
             )
             return None
 
-        # convert to structured array, keeping only the required features
+        # convert to a (days, features) matrix, keeping only the required features
         # assumes all data is in float64 dtype
         try:
-            struc_dtypes = [(attr, np.float64) for attr in model_smart_attr]
-            values = [tuple(day[attr] for attr in model_smart_attr) for day in disk_days]
-            disk_days_sa = np.array(values, dtype=struc_dtypes)
+            values = [[day[attr] for attr in model_smart_attr] for day in disk_days]
+            disk_days_arr = np.array(values, dtype=np.float64)
         except KeyError as e:
             RHDiskFailurePredictor.LOGGER.debug(
                 "Mismatch in SMART attributes used to train model and SMART attributes available"
             )
             return None
 
-        # view structured array as 2d array for applying rolling window transforms
-        # do not include capacity_bytes in this. only use smart_attrs
-        disk_days_attrs = disk_days_sa[[attr for attr in model_smart_attr if 'smart_' in attr]]\
-                            .view(np.float64).reshape(disk_days_sa.shape + (-1,))
+        # do not include capacity_bytes in the rolling window transforms.
+        # only use smart_attrs
+        smart_cols = [i for i, attr in enumerate(model_smart_attr) if 'smart_' in attr]
+        disk_days_attrs = disk_days_arr[:, smart_cols]
 
         # featurize n (6 to 12) days data - mean,std,coefficient of variation
         # current model is trained on 6 days of data because that is what will be
@@ -144,32 +166,26 @@ class RHDiskFailurePredictor(object):
 
         # rolling time window interval size in days
         roll_window_size = 6
+        num_windows = disk_days_attrs.shape[0] - roll_window_size + 1
 
-        # rolling means generator
-        gen = (disk_days_attrs[i: i + roll_window_size, ...].mean(axis=0) \
-                for i in range(0, disk_days_attrs.shape[0] - roll_window_size + 1))
-        means = np.vstack(gen)
-
-        # rolling stds generator
-        gen = (disk_days_attrs[i: i + roll_window_size, ...].std(axis=0, ddof=1) \
-                for i in range(0, disk_days_attrs.shape[0] - roll_window_size + 1))
-        stds = np.vstack(gen)
+        # (windows, days, attrs) view of all rolling windows at once
+        window_idx = np.arange(num_windows)[:, None] + np.arange(roll_window_size)
+        windows = disk_days_attrs[window_idx]
+        means = windows.mean(axis=1)
+        stds = windows.std(axis=1, ddof=1)
 
         # coefficient of variation
-        cvs = stds / means
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cvs = stds / means
         cvs[np.isnan(cvs)] = 0
+        capacity = disk_days_arr[:num_windows, model_smart_attr.index('user_capacity')]
         featurized = np.hstack((
                                 means,
                                 stds,
                                 cvs,
-                                disk_days_sa['user_capacity'][: disk_days_attrs.shape[0] - roll_window_size + 1].reshape(-1, 1)
+                                capacity.reshape(-1, 1)
                                 ))
 
-        # scale features
-        scaler_path = os.path.join(self.model_dirpath, manufacturer + "_scaler.pkl")
-        with open(scaler_path, 'rb') as f:
-            scaler = pickle.load(f)
-        featurized = scaler.transform(featurized)
         return featurized
 
     @staticmethod
@@ -190,7 +206,8 @@ class RHDiskFailurePredictor(object):
             "Could not infer manufacturer from model name {}".format(model_name)
         )
 
-    def predict(self, disk_days):
+    @staticmethod
+    def __get_disk_manufacturer(disk_days):
         # get manufacturer preferably as a smartctl attribute
         # if not available then infer using model name
         manufacturer = disk_days[0].get("vendor")
@@ -200,7 +217,9 @@ class RHDiskFailurePredictor(object):
             )
             manufacturer = RHDiskFailurePredictor.__get_manufacturer(
                 disk_days[0].get("model_name", "")
-            ).lower()
+            )
+            if manufacturer is not None:
+                manufacturer = manufacturer.lower()
 
         # print error message, return Unknown, and continue execution
         if manufacturer is None:
@@ -210,25 +229,56 @@ class RHDiskFailurePredictor(object):
                     or the model name is not according to the manufacturer's \
                         naming conventions known to DiskPredictor"
             )
-            return RHDiskFailurePredictor.PREDICTION_CLASSES[-1]
+        return manufacturer
 
-        # preprocess for feeding to model
-        preprocessed_data = self.__preprocess(disk_days, manufacturer)
-        if preprocessed_data is None:
-            return RHDiskFailurePredictor.PREDICTION_CLASSES[-1]
+    def predict(self, disk_days):
+        return self.predict_batch({None: disk_days})[None]
 
-        # get model for current manufacturer
-        model_path = os.path.join(
-            self.model_dirpath, manufacturer + "_predictor.pkl"
-        )
-        with open(model_path, 'rb') as f:
-            model = pickle.load(f)
+    def predict_batch(self, disks):
+        """Predict the health of many hard drives at once
+
+        The featurized days of all drives of a manufacturer are stacked
+        into one matrix, which is scaled and fed to the model in one go.
+
+        Arguments:
+            disks {dict} -- disk_days of each drive, by device id
 
-        # use prediction for most recent day
-        # TODO: ensure that most recent day is last element and most previous day
-        # is first element in input disk_days
-        pred_class_id = model.predict(preprocessed_data)[-1]
-        return RHDiskFailurePredictor.PREDICTION_CLASSES[pred_class_id]
+        Returns:
+            dict -- prediction class of each drive, by device id
+        """
+        result = {}
+        by_manufacturer = {}
+        for devid, disk_days in disks.items():
+            manufacturer = RHDiskFailurePredictor.__get_disk_manufacturer(disk_days)
+            if manufacturer is None:
+                result[devid] = RHDiskFailurePredictor.PREDICTION_CLASSES[-1]
+                continue
+            # preprocess for feeding to model
+            preprocessed_data = self.__preprocess(disk_days, manufacturer)
+            if preprocessed_data is None:
+                result[devid] = RHDiskFailurePredictor.PREDICTION_CLASSES[-1]
+                continue
+            by_manufacturer.setdefault(manufacturer, []).append(
+                (devid, preprocessed_data))
+
+        for manufacturer, featurized in by_manufacturer.items():
+            # scale features
+            scaler = load_pickle(self.models, os.path.join(
+                self.model_dirpath, manufacturer + "_scaler.pkl"))
+            # get model for current manufacturer
+            model = load_pickle(self.models, os.path.join(
+                self.model_dirpath, manufacturer + "_predictor.pkl"))
+            data = scaler.transform(np.vstack([f for _, f in featurized]))
+            pred_class_ids = model.predict(data)
+
+            # use prediction for most recent day of each drive
+            # TODO: ensure that most recent day is last element and most previous day
+            # is first element in input disk_days
+            ends = np.cumsum([f.shape[0] for _, f in featurized]) - 1
+            for (devid, _), end in zip(featurized, ends):
+                result[devid] = RHDiskFailurePredictor.PREDICTION_CLASSES[
+                    pred_class_ids[end]]
+        return result
 
 
 class PSDiskFailurePredictor(object):
@@ -247,6 +297,8 @@ class PSDiskFailurePredictor(object):
 
         self.model_dirpath = ""
         self.model_context = {}
+        # unpickled models, by path
+        self.models = {}
 
     def initialize(self, model_dirpath):
         """
@@ -431,36 +483,58 @@ class PSDiskFailurePredictor(object):
             Pickle exceptions
         """
 
-        all_pred = []
-
-        proc_disk_days = self.__preprocess(disk_days)
-        attr_list, diff_data = PSDiskFailurePredictor.__get_diff_attrs(proc_disk_days)
-        modellist = self.__get_best_models(attr_list)
-        if modellist is None:
-            return "Unknown"
-
-        for modelpath in modellist:
-            model_attrlist = modellist[modelpath]
-            ordered_data = PSDiskFailurePredictor.__get_ordered_attrs(
-                diff_data, model_attrlist
-            )
-
-            try:
-                with open(modelpath, "rb") as f_model:
-                    clf = pickle.load(f_model)
+        return self.predict_batch({None: disk_days})[None]
 
-            except UnicodeDecodeError:
-                # Compatibility for python3
-                with open(modelpath, "rb") as f_model:
-                    clf = pickle.load(f_model, encoding="latin1")
+    def predict_batch(self, disks):
+        """
+        Predict the health of many disks at once. The differential days
+        of all disks that share a model are fed to it in one go.
 
-            pred = clf.predict(ordered_data)
+        Args:
+            disks: disk_days of each disk (refer to predict(...)), by
+                   device id.
+        Returns:
+            The prediction result of each disk, by device id.
 
-            all_pred.append(1 if any(pred) else 0)
+        Raises:
+            Pickle exceptions
+        """
 
-        score = 2 ** sum(all_pred) - len(modellist)
-        if score > 10:
-            return "Bad"
-        if score > 4:
-            return "Warning"
-        return "Good"
+        result = {}
+        all_pred = {}
+        # model path -> [(devid, ordered_data), ...]
+        by_model = {}
+        for devid, disk_days in disks.items():
+            proc_disk_days = self.__preprocess(disk_days)
+            attr_list, diff_data = PSDiskFailurePredictor.__get_diff_attrs(proc_disk_days)
+            modellist = self.__get_best_models(attr_list)
+            if modellist is None:
+                result[devid] = "Unknown"
+                continue
+
+            all_pred[devid] = []
+            for modelpath in modellist:
+                model_attrlist = modellist[modelpath]
+                ordered_data = PSDiskFailurePredictor.__get_ordered_attrs(
+                    diff_data, model_attrlist
+                )
+                by_model.setdefault(modelpath, []).append((devid, ordered_data))
+
+        for modelpath, model_data in by_model.items():
+            clf = load_pickle(self.models, modelpath)
+            pred = clf.predict(np.vstack([data for _, data in model_data]))
+            start = 0
+            for devid, data in model_data:
+                end = start + len(data)
+                all_pred[devid].append(1 if any(pred[start:end]) else 0)
+                start = end
+
+        for devid, preds in all_pred.items():
+            score = 2 ** sum(preds) - len(preds)
+            if score > 10:
+                result[devid] = "Bad"
+            elif score > 4:
+                result[devid] = "Warning"
+            else:
+                result[devid] = "Good"
+        return result
@@ -1068,6 +1068,22 @@ class MgrModule(ceph_module.BaseMgrModule, MgrModuleLoggingMixin):
         """
         return self._ceph_get_latest_counter(svc_type, svc_name, path)
 
+    def get_latest_perf_counters(self, svc_type, svc_name, prio_limit=0):
+        """
+        Called by the plugin to fetch the schema and the newest value of
+        all perf counters of one or more services in a single call.
+        svc_name can be empty, as can svc_type, in which case they are
+        wildcards.
+
+        :param str svc_type:
+        :param str svc_name:
+        :param int prio_limit: skip counters with a lower priority
+        :return: a dict mapping service names (like "osd.123") to dicts
+            mapping counter paths to their schema, plus a "value" member
+            (and a "count" member for long running averages).
+        """
+        return self._ceph_get_latest_perf_counters(svc_type, svc_name, prio_limit)
+
     def list_servers(self):
         """
         Like ``get_server``, but gives information about all servers (i.e. all
@@ -1422,51 +1438,11 @@ class MgrModule(ceph_module.BaseMgrModule, MgrModuleLoggingMixin):
 
         result = defaultdict(dict)  # type: Dict[str, dict]
 
-        for server in self.list_servers():
-            for service in server['services']:
-                if service['type'] not in services:
-                    continue
-
-                schema = self.get_perf_schema(service['type'], service['id'])
-                if not schema:
-                    self.log.warning("No perf counter schema for {0}.{1}".format(
-                        service['type'], service['id']
-                    ))
-                    continue
-
-                # Value is returned in a potentially-multi-service format,
-                # get just the service we're asking about
-                svc_full_name = "{0}.{1}".format(
-                    service['type'], service['id'])
-                schema = schema[svc_full_name]
-
-                # Populate latest values
-                for counter_path, counter_schema in schema.items():
-                    # self.log.debug("{0}: {1}".format(
-                    #     counter_path, json.dumps(counter_schema)
-                    # ))
-                    if counter_schema['priority'] < prio_limit:
-                        continue
-
-                    counter_info = dict(counter_schema)
-
-                    # Also populate count for the long running avgs
-                    if counter_schema['type'] & self.PERFCOUNTER_LONGRUNAVG:
-                        v, c = self.get_latest_avg(
-                            service['type'],
-                            service['id'],
-                            counter_path
-                        )
-                        counter_info['value'], counter_info['count'] = v, c
-                        result[svc_full_name][counter_path] = counter_info
-                    else:
-                        counter_info['value'] = self.get_latest(
-                            service['type'],
-                            service['id'],
-                            counter_path
-                        )
-
-                    result[svc_full_name][counter_path] = counter_info
+        for service_type in services:
+            counters = self.get_latest_perf_counters(service_type, '', prio_limit)
+            for svc_full_name, svc_counters in counters.items():
+                if svc_counters:
+                    result[svc_full_name] = svc_counters
 
         self.log.debug("returning {0} counter".format(len(result)))
 
@@ -7,6 +7,7 @@ import cephfs
 import contextlib
 import datetime
 import errno
+import re
 import socket
 import time
 import logging
@@ -20,7 +21,7 @@ else:
     from threading import _Timer as Timer
 
 try:
-    from typing import Tuple, Any, Callable
+    from typing import Tuple, Any, Callable, List
 except ImportError:
     TYPE_CHECKING = False  # just for type checking
 
@@ -672,3 +673,195 @@ def profile_method(skip_attribute=False):
             return result
         return wrapper
     return outer
+
+
+class GaneshaConfParser(object):
+    """
+    Parser and serializer of NFS-Ganesha configuration, as stored in the
+    RADOS objects of a Ganesha cluster. The configuration is split into
+    tokens in one pass and parsed from the token list, so that the time
+    taken is linear in the size of the configuration.
+
+    Blocks are returned as dicts holding the upper case `block_name`, the
+    lower case parameter names and the nested blocks as a list under
+    `_blocks_`. ``%url`` lines are returned as blocks named ``%url``.
+
+    >>> GaneshaConfParser('EXPORT { Protocols = 3, 4; FSAL { Name = "CEPH"; } }').parse()
+    [{'block_name': 'EXPORT', 'protocols': [3, 4], '_blocks_': [{'block_name': 'FSAL', 'name': 'CEPH'}]}]
+    >>> GaneshaConfParser('%url "rados://nfs/ns/export-1"').parse()
+    [{'block_name': '%url', 'value': 'rados://nfs/ns/export-1'}]
+    """
+    TOKEN_RE = re.compile(r"""
+        (?P<ws>\s+)
+        |(?P<comment>\#[^\n]*)
+        |(?P<url>%url[ \t]+[^\n]*)
+        |(?P<string>"(?:[^"\\]|\\.)*")
+        |(?P<symbol>[{};=,])
+        |(?P<word>[^\s{};=,"#]+)
+        """, re.VERBOSE)
+
+    def __init__(self, raw_config):
+        self.tokens = self.tokenize(raw_config)
+        self.pos = 0
+
+    @classmethod
+    def tokenize(cls, raw_config):
+        tokens = []
+        pos = 0
+        end = len(raw_config)
+        while pos < end:
+            match = cls.TOKEN_RE.match(raw_config, pos)
+            if not match:
+                raise Exception("Malformed configuration at offset {}: {}".format(
+                    pos, raw_config[pos:pos + 20]))
+            kind = match.lastgroup
+            if kind not in ('ws', 'comment'):
+                tokens.append((kind, match.group()))
+            pos = match.end()
+        return tokens
+
+    def peek(self, offset=0):
+        idx = self.pos + offset
+        if idx < len(self.tokens):
+            return self.tokens[idx]
+        return (None, None)
+
+    def next_token(self):
+        token = self.peek()
+        if token[0] is None:
+            raise Exception("Unexpected end of configuration")
+        self.pos += 1
+        return token
+
+    def parse_block_or_section(self):
+        kind, value = self.next_token()
+        if kind == 'url':
+            value = value[len('%url'):].strip().replace('"', '')
+            return {'block_name': '%url', 'value': value}
+        if kind != 'word' or self.peek() != ('symbol', '{'):
+            raise Exception("Cannot find block name")
+        self.pos += 1
+        block_dict = {'block_name': value.upper()}
+        self.parse_block_body(block_dict)
+        if self.next_token() != ('symbol', '}'):
+            raise Exception("No closing bracket '}' found at the end of block")
+        return block_dict
+
+    @staticmethod
+    def parse_parameter_value(tokens):
+        if len(tokens) == 1 and tokens[0][0] == 'string':
+            return tokens[0][1][1:-1]
+        raw_value = ''.join(value for _, value in tokens)
+        try:
+            return int(raw_value)
+        except ValueError:
+            if raw_value == "true":
+                return True
+            if raw_value == "false":
+                return False
+            if raw_value.find('"') == 0:
+                return raw_value[1:-1]
+            return raw_value
+
+    def parse_stanza(self, block_dict):
+        _, parameter_name = self.next_token()
+        if self.next_token() != ('symbol', '='):
+            raise Exception("Malformed stanza: no equal symbol found.")
+        values = [[]]  # type: List[List[Tuple[str, str]]]
+        while True:
+            token = self.peek()
+            if token[0] is None:
+                raise Exception("Malformed stanza: no semicolon found.")
+            self.pos += 1
+            if token == ('symbol', ';'):
+                break
+            if token == ('symbol', ','):
+                values.append([])
+            elif token[0] == 'symbol':
+                raise Exception("Malformed stanza: unexpected '{}'".format(token[1]))
+            else:
+                values[-1].append(token)
+        if len(values) == 1:
+            value = self.parse_parameter_value(values[0])
+        else:
+            value = [self.parse_parameter_value(v) for v in values]
+        block_dict[parameter_name.lower()] = value
+
+    def parse_block_body(self, block_dict):
+        while True:
+            kind, value = self.peek()
+            if (kind, value) == ('symbol', '}'):
+                # block end
+                return
+            if kind == 'word' and self.peek(1) == ('symbol', '='):
+                self.parse_stanza(block_dict)
+            elif kind == 'url' or (kind == 'word' and self.peek(1) == ('symbol', '{')):
+                block_dict.setdefault('_blocks_', []).append(self.parse_block_or_section())
+            elif kind is None:
+                raise Exception("No closing bracket '}' found at the end of block")
+            else:
+                raise Exception("Malformed stanza: unexpected '{}'".format(value))
+
+    def parse(self):
+        blocks = []
+        while self.pos < len(self.tokens):
+            blocks.append(self.parse_block_or_section())
+        return blocks
+
+    @staticmethod
+    def _indentation(depth, size=4):
+        return " " * (depth * size)
+
+    @staticmethod
+    def _format_value(block, key, val):
+        if isinstance(val, list):
+            return ', '.join([GaneshaConfParser._format_value(block, key, v) for v in val])
+        if isinstance(val, bool):
+            return str(val).lower()
+        if isinstance(val, int) or (block['block_name'] == 'CLIENT'
+                                    and key == 'clients'):
+            return '{}'.format(val)
+        return '"{}"'.format(val)
+
+    @staticmethod
+    def _write_block_body(block, depth, out):
+        for key, val in block.items():
+            if key == 'block_name':
+                continue
+            elif key == '_blocks_':
+                for blo in val:
+                    GaneshaConfParser._write_block(blo, depth, out)
+            elif val:
+                out.append('{}{} = {};\n'.format(GaneshaConfParser._indentation(depth), key,
+                                                  GaneshaConfParser._format_value(block, key, val)))
+
+    @staticmethod
+    def _write_block(block, depth, out):
+        if block['block_name'] == "%url":
+            out.append('%url "{}"\n\n'.format(block['value']))
+            return
+        indent = GaneshaConfParser._indentation(depth)
+        out.append('{}{} {{\n'.format(indent, block['block_name']))
+        GaneshaConfParser._write_block_body(block, depth + 1, out)
+        out.append('{}}}\n\n'.format(indent))
+
+    @staticmethod
+    def write_block_body(block, depth=0):
+        out = []  # type: List[str]
+        GaneshaConfParser._write_block_body(block, depth, out)
+        return ''.join(out)
+
+    @staticmethod
+    def write_block(block, depth=0):
+        out = []  # type: List[str]
+        GaneshaConfParser._write_block(block, depth, out)
+        return ''.join(out)
+
+    @staticmethod
+    def write_conf(blocks):
+        if not isinstance(blocks, list):
+            blocks = [blocks]
+        out = []  # type: List[str]
+        for block in blocks:
+            GaneshaConfParser._write_block(block, 0, out)
+        return ''.join(out)
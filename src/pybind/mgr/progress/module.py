@@ -1,5 +1,5 @@
 try:
-    from typing import List, Dict, Union, Any, Optional
+    from typing import List, Dict, Union, Any, Optional, Set
     from typing import TYPE_CHECKING
 except ImportError:
     TYPE_CHECKING = False
@@ -226,13 +226,14 @@ class PgRecoveryEvent(Event):
         # type: (str, List[Any], List[PgId], List[str], int) -> None
         super(PgRecoveryEvent, self).__init__(message, refs)
 
-        self._pgs = which_pgs
+        # pgids of the PGs still to recover
+        self._pgs = set(str(pg) for pg in which_pgs)  # type: Set[str]
 
         self._which_osds = which_osds
 
         self._original_pg_count = len(self._pgs)
 
-        self._original_bytes_recovered = None  # type: Optional[Dict[PgId, float]]
+        self._original_bytes_recovered = None  # type: Optional[Dict[str, float]]
 
         self._progress = 0.0
 
@@ -246,21 +247,26 @@ class PgRecoveryEvent(Event):
     def which_osds(self):
         return self. _which_osds
 
-    def pg_update(self, raw_pg_stats, pg_ready, log):
-        # type: (Dict, bool, Any) -> None
-        # FIXME: O(pg_num) in python
-        # FIXME: far more fields getting pythonized than we really care about
+    @property
+    def which_pgs(self):
+        # type: () -> Set[str]
+        return self._pgs
+
+    def pg_update(self, pg_to_state, pg_ready, log):
+        # type: (Dict[str, Any], bool, Any) -> None
+        """
+        :param pg_to_state: the stats of (at least) the PGs of this event,
+            by pgid, as returned by index_pg_stats()
+        """
         # Sanity check to see if there are any missing PGs and to assign
         # empty array and dictionary if there hasn't been any recovery
-        pg_to_state = dict([(p['pgid'], p) for p in raw_pg_stats['pg_stats']]) # type: Dict[str, Any]
         if self._original_bytes_recovered is None:
             self._original_bytes_recovered = {}
             missing_pgs = []
             for pg in self._pgs:
-                pg_str = str(pg)
-                if pg_str in pg_to_state:
+                if pg in pg_to_state:
                     self._original_bytes_recovered[pg] = \
-                        pg_to_state[pg_str]['stat_sum']['num_bytes_recovered']
+                        pg_to_state[pg]['stat_sum']['num_bytes_recovered']
                 else:
                     missing_pgs.append(pg)
             if pg_ready:
@@ -279,9 +285,8 @@ class PgRecoveryEvent(Event):
 
         complete = set()
         for pg in self._pgs:
-            pg_str = str(pg)
             try:
-                info = pg_to_state[pg_str]
+                info = pg_to_state[pg]
             except KeyError:
                 # The PG is gone!  Probably a pool was deleted. Drop it.
                 complete.add(pg)
@@ -320,7 +325,7 @@ class PgRecoveryEvent(Event):
                         ratio = 0.5
                     complete_accumulate += ratio
 
-        self._pgs = list(set(self._pgs) ^ complete)
+        self._pgs -= complete
         completed_pgs = self._original_pg_count - len(self._pgs)
         self._progress = (completed_pgs + complete_accumulate)\
             / self._original_pg_count
@@ -334,6 +339,14 @@ class PgRecoveryEvent(Event):
         return self._progress
 
 
+def index_pg_stats(raw_pg_stats, pgids):
+    # type: (Dict, Set[str]) -> Dict[str, Any]
+    """
+    Index the stats of the PGs in ``pgids`` by pgid, skipping all others.
+    """
+    return {p['pgid']: p for p in raw_pg_stats['pg_stats'] if p['pgid'] in pgids}
+
+
 class PgId(object):
     def __init__(self, pool_id, ps):
         # type: (str, int) -> None
@@ -490,7 +503,8 @@ class Module(MgrModule):
                     which_osds=[osd_id],
                     start_epoch=self.get_osdmap().get_epoch()
                     )
-            r_ev.pg_update(self.get("pg_stats"), self.get("pg_ready"), self.log)
+            r_ev.pg_update(index_pg_stats(self.get("pg_stats"), r_ev.which_pgs),
+                           self.get("pg_ready"), self.log)
             self._events[r_ev.id] = r_ev
 
     def _osdmap_changed(self, old_osdmap, new_osdmap):
@@ -534,13 +548,19 @@ class Module(MgrModule):
             # expensive get calls
             if len(self._events) == 0:
                 return
-            data = self.get("pg_stats")
+            events = [ev for ev in self._events.values()
+                      if isinstance(ev, PgRecoveryEvent)]
+            if not events:
+                return
+            # one index of the PGs we are watching, shared by all events
+            watched = set()  # type: Set[str]
+            for ev in events:
+                watched |= ev.which_pgs
+            data = index_pg_stats(self.get("pg_stats"), watched)
             ready = self.get("pg_ready")
-            for ev_id in list(self._events):
-                ev = self._events[ev_id]
-                if isinstance(ev, PgRecoveryEvent):
-                    ev.pg_update(data, ready, self.log)
-                    self.maybe_complete(ev)
+            for ev in events:
+                ev.pg_update(data, ready, self.log)
+                self.maybe_complete(ev)
 
     def maybe_complete(self, event):
         # type: (Event) -> None
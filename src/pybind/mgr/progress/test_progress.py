@@ -13,7 +13,7 @@ from progress import module
 class TestPgRecoveryEvent(object):
     # Testing PgRecoveryEvent class
 
-    def setup(self):
+    def setup_method(self):
         # Creating the class and Mocking 
         # a bunch of attributes for testing
         module._module = mock.Mock() # just so Event._refresh() works
@@ -77,8 +77,40 @@ class TestPgRecoveryEvent(object):
         ]
         }
 
-        self.test_event.pg_update(pg_stats, True, mock.Mock())
+        self.test_event.pg_update(
+            module.index_pg_stats(pg_stats, self.test_event.which_pgs), True, mock.Mock())
         assert self.test_event._progress == 1.0
+
+    def test_pg_update_partial(self):
+        pg_stats = {
+            "pg_stats": [
+                {
+                    "state": "active+clean",
+                    "stat_sum": {"num_bytes": 10, "num_bytes_recovered": 10},
+                    "pgid": "1.0",
+                    "reported_epoch": "30"
+                },
+                {
+                    "state": "active+remapped+backfilling",
+                    "stat_sum": {"num_bytes": 10, "num_bytes_recovered": 0},
+                    "pgid": "1.1",
+                    "reported_epoch": "30"
+                },
+                {
+                    "state": "active+clean",
+                    "stat_sum": {"num_bytes": 10, "num_bytes_recovered": 0},
+                    "pgid": "2.0",
+                    "reported_epoch": "30"
+                },
+            ]
+        }
+        pg_to_state = module.index_pg_stats(pg_stats, self.test_event.which_pgs)
+        assert sorted(pg_to_state) == ["1.0", "1.1"]
+
+        # 1.2 is gone, 1.0 is done
+        self.test_event.pg_update(pg_to_state, True, mock.Mock())
+        assert self.test_event.which_pgs == {"1.1"}
+        assert self.test_event._progress == 2.0 / 3
        
 class OSDMap: 
     
@@ -121,7 +153,7 @@ class OSDMap:
 class TestModule(object):
     # Testing Module Class
     
-    def setup(self):
+    def setup_method(self):
         # Creating the class and Mocking a
         # bunch of attributes for testing
 
@@ -129,7 +161,7 @@ class TestModule(object):
         module.Module._ceph_get_option = mock.Mock()  # .__init__
         module.Module._configure_logging = lambda *args: ...  # .__init__
         self.test_module = module.Module('module_name', 0, 0)  # so we can see if an event gets created
-        self.test_module.get = mock.Mock() # so we can call pg_update
+        self.test_module.get = mock.Mock(return_value={'pg_stats': []}) # so we can call pg_update
         self.test_module._complete = mock.Mock() # we want just to see if this event gets called
         self.test_module.get_osdmap = mock.Mock() # so that self.get_osdmap().get_epoch() works
         module._module = mock.Mock() # so that Event.refresh() works
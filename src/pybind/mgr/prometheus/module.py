@@ -2,6 +2,7 @@ import cherrypy
 from distutils.version import StrictVersion
 import json
 import errno
+import gzip
 import math
 import os
 import re
@@ -12,7 +13,7 @@ from mgr_module import MgrModule, MgrStandbyModule, CommandResult, PG_STATES
 from mgr_util import get_default_addr, profile_method
 from rbd import RBD
 try:
-    from typing import Optional, Dict, Any, Set
+    from typing import Optional, Dict, Any, Set, Tuple
 except:
     pass
 
@@ -22,6 +23,10 @@ except:
 
 DEFAULT_PORT = 9283
 
+# Speed matters more than size here: level 1 already shrinks the
+# exposition format by about 90%.
+GZIP_COMPRESSLEVEL = 1
+
 # When the CherryPy server in 3.2.2 (and later) starts it attempts to verify
 # that the ports its listening on are in fact bound. When using the any address
 # "::" it tries both ipv4 and ipv6, and in some environments (e.g. kubernetes)
@@ -108,6 +113,31 @@ DISK_OCCUPATION = ('ceph_daemon', 'device', 'db_device',
 NUM_OBJECTS = ['degraded', 'misplaced', 'unfound']
 
 
+def promethize(path):
+    ''' replace illegal metric name characters '''
+    result = re.sub(r'[./\s]|::', '_', path).replace('+', '_plus')
+
+    # Hyphens usually turn into underscores, unless they are
+    # trailing
+    if result.endswith("-"):
+        result = result[0:-1] + "_minus"
+    else:
+        result = result.replace("-", "_")
+
+    return "ceph_{0}".format(result)
+
+
+def floatstr(value):
+    ''' represent as Go-compatible float '''
+    if value == float('inf'):
+        return '+Inf'
+    if value == float('-inf'):
+        return '-Inf'
+    if math.isnan(value):
+        return 'NaN'
+    return repr(float(value))
+
+
 class Metric(object):
     def __init__(self, mtype, name, desc, labels=None):
         self.mtype = mtype
@@ -116,6 +146,21 @@ class Metric(object):
         self.labelnames = labels    # tuple if present
         self.value = {}             # indexed by label values
 
+        # Rendering is cached across collections: the header and the
+        # series prefix of every label set are rendered once, and the
+        # whole family is only rendered again if its values changed.
+        self._name = promethize(name)
+        self._header = '''
+# HELP {name} {desc}
+# TYPE {name} {mtype}'''.format(
+            name=self._name,
+            desc=desc,
+            mtype=mtype,
+        )
+        self._series = {}           # type: Dict[Tuple[str, ...], str]
+        self._rendered = None       # type: Optional[str]
+        self._rendered_value = {}   # type: Dict[Tuple[str, ...], Any]
+
     def clear(self):
         self.value = {}
 
@@ -125,55 +170,33 @@ class Metric(object):
         self.value[labelvalues] = value
 
     def str_expfmt(self):
+        if self._rendered is not None and self.value == self._rendered_value:
+            return self._rendered
 
-        def promethize(path):
-            ''' replace illegal metric name characters '''
-            result = re.sub(r'[./\s]|::', '_', path).replace('+', '_plus')
-
-            # Hyphens usually turn into underscores, unless they are
-            # trailing
-            if result.endswith("-"):
-                result = result[0:-1] + "_minus"
-            else:
-                result = result.replace("-", "_")
-
-            return "ceph_{0}".format(result)
-
-        def floatstr(value):
-            ''' represent as Go-compatible float '''
-            if value == float('inf'):
-                return '+Inf'
-            if value == float('-inf'):
-                return '-Inf'
-            if math.isnan(value):
-                return 'NaN'
-            return repr(float(value))
-
-        name = promethize(self.name)
-        expfmt = '''
-# HELP {name} {desc}
-# TYPE {name} {mtype}'''.format(
-            name=name,
-            desc=self.desc,
-            mtype=self.mtype,
-        )
-
+        name = self._name
+        expfmt = [self._header]
+        series = {}
         for labelvalues, value in self.value.items():
-            if self.labelnames:
-                labels_list = zip(self.labelnames, labelvalues)
-                labels = ','.join('%s="%s"' % (k, v) for k, v in labels_list)
-            else:
-                labels = ''
-            if labels:
-                fmtstr = '\n{name}{{{labels}}} {value}'
-            else:
-                fmtstr = '\n{name} {value}'
-            expfmt += fmtstr.format(
-                name=name,
-                labels=labels,
-                value=floatstr(value),
-            )
-        return expfmt
+            prefix = self._series.get(labelvalues)
+            if prefix is None:
+                if self.labelnames:
+                    labels_list = zip(self.labelnames, labelvalues)
+                    labels = ','.join('%s="%s"' % (k, v) for k, v in labels_list)
+                else:
+                    labels = ''
+                if labels:
+                    prefix = '\n{name}{{{labels}}} '.format(name=name, labels=labels)
+                else:
+                    prefix = '\n{name} '.format(name=name)
+            series[labelvalues] = prefix
+            expfmt.append(prefix)
+            expfmt.append(floatstr(value))
+
+        # forget label sets that are gone
+        self._series = series
+        self._rendered = ''.join(expfmt)
+        self._rendered_value = dict(self.value)
+        return self._rendered
 
 
 class MetricCollectionThread(threading.Thread):
@@ -209,6 +232,7 @@ class MetricCollectionThread(threading.Thread):
 
                 with self.mod.collect_lock:
                     self.mod.collect_cache = data
+                    self.mod.collect_cache_gzip = None
                     self.mod.collect_time = duration
 
                 time.sleep(sleep_time)
@@ -246,7 +270,13 @@ class Module(MgrModule):
         self.collect_time = 0.0
         self.scrape_interval = 15.0
         self.stale_cache_strategy = self.STALE_CACHE_FAIL
-        self.collect_cache = None
+        self.collect_cache = None  # type: Optional[str]
+        # compressed collect_cache, created on the first scrape asking for it
+        self.collect_cache_gzip = None  # type: Optional[bytes]
+        # OSD device classes and metadata by OSD id, see get_osd_indexes()
+        self.osd_index_epoch = None  # type: Optional[int]
+        self.osd_dev_class = {}  # type: Dict[int, str]
+        self.osd_metadata = {}  # type: Dict[int, Dict[str, str]]
         self.rbd_stats = {
             'pools': {},
             'pools_refresh_time': 0,
@@ -604,6 +634,30 @@ class Module(MgrModule):
                 ret.update({(service['id'], service['type']): (host, version)})
         return ret
 
+    def get_osd_indexes(self, osd_map):
+        # type: (Dict[str, Any]) -> None
+        """
+        Index the CRUSH device class and the metadata of all OSDs by id.
+
+        The indexes are kept until the OSDMap epoch changes. An OSD (re)start
+        or a device class change always comes with a new epoch. The metadata
+        of a booting OSD may arrive after its epoch though, so we look again
+        as long as the metadata of an up OSD is missing.
+        """
+        if self.osd_index_epoch == osd_map['epoch'] and \
+                all(osd['osd'] in self.osd_metadata
+                    for osd in osd_map['osds'] if osd['up']):
+            return
+
+        self.osd_dev_class = {
+            device['id']: device.get('class', '')
+            for device in self.get('osd_map_crush')['devices']
+        }
+        self.osd_metadata = {
+            int(id_): metadata for id_, metadata in self.get('osd_metadata').items()
+        }
+        self.osd_index_epoch = osd_map['epoch']
+
     @profile_method()
     def get_metadata_and_osd_status(self):
         osd_map = self.get('osd_map')
@@ -613,7 +667,7 @@ class Module(MgrModule):
                 int(flag in osd_flags)
             )
 
-        osd_devices = self.get('osd_map_crush')['devices']
+        self.get_osd_indexes(osd_map)
         servers = self.get_service_list()
         for osd in osd_map['osds']:
             # id can be used to link osd metrics and metadata
@@ -628,12 +682,7 @@ class Module(MgrModule):
                 )
                 continue
 
-            dev_class = None
-            for osd_device in osd_devices:
-                if osd_device['id'] == id_:
-                    dev_class = osd_device.get('class', '')
-                    break
-
+            dev_class = self.osd_dev_class.get(id_)
             if dev_class is None:
                 self.log.info("OSD {0} is missing from CRUSH map, "
                               "skipping output".format(id_))
@@ -642,7 +691,7 @@ class Module(MgrModule):
             host_version = servers.get((str(id_), 'osd'), ('', ''))
 
             # collect disk occupation metadata
-            osd_metadata = self.get_metadata("osd", str(id_))
+            osd_metadata = self.osd_metadata.get(id_)
             if osd_metadata is None:
                 continue
 
@@ -1003,8 +1052,13 @@ class Module(MgrModule):
             match = re.search('^data-sync-from-(.*)\.', metric_path)
             if match:
                 new_path = re.sub('from-([^.]*)', 'from-zone', metric_path)
+                if new_path == metric_path:
+                    # a fixed name metric of an earlier collection
+                    continue
                 if new_path not in new_metrics:
-                    new_metrics[new_path] = Metric(
+                    # keep the metric of the earlier collection (and its
+                    # rendering cache) if there is one
+                    new_metrics[new_path] = self.metrics.get(new_path) or Metric(
                         self.metrics[metric_path].mtype,
                         new_path,
                         self.metrics[metric_path].desc,
@@ -1083,10 +1137,11 @@ class Module(MgrModule):
 
         # Return formatted metrics and clear no longer used data
         _metrics = [m.str_expfmt() for m in self.metrics.values()]
+        _metrics.append('\n')
         for k in self.metrics.keys():
             self.metrics[k].clear()
 
-        return ''.join(_metrics) + '\n'
+        return ''.join(_metrics)
 
     def get_file_sd_config(self):
         servers = self.list_servers()
@@ -1138,6 +1193,12 @@ class Module(MgrModule):
 
     def serve(self):
 
+        def accepts_gzip():
+            for encoding in cherrypy.request.headers.elements('Accept-Encoding'):
+                if encoding.value in ('gzip', '*') and encoding.qvalue > 0:
+                    return True
+            return False
+
         class Root(object):
 
             # collapse everything to '/'
@@ -1172,8 +1233,19 @@ class Module(MgrModule):
 
                 def respond():
                     assert isinstance(instance, Module)
+                    # called with collect_lock held
+                    cache = instance.collect_cache
+                    assert cache is not None
                     cherrypy.response.headers['Content-Type'] = 'text/plain'
-                    return instance.collect_cache
+                    if not accepts_gzip():
+                        return cache
+                    compressed = instance.collect_cache_gzip
+                    if compressed is None:
+                        compressed = gzip.compress(cache.encode('utf-8'), GZIP_COMPRESSLEVEL)
+                        instance.collect_cache_gzip = compressed
+                    cherrypy.response.headers['Content-Encoding'] = 'gzip'
+                    cherrypy.response.headers['Vary'] = 'Accept-Encoding'
+                    return compressed
 
                 if instance.collect_time < instance.scrape_interval:
                     # Respond if cache isn't stale
@@ -1,10 +1,12 @@
 import errno
+import heapq
 import json
 import rados
 import rbd
 import re
 import traceback
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from threading import Condition, Lock, Thread
 
@@ -146,6 +148,9 @@ class Watchers:
 
 class MirrorSnapshotScheduleHandler:
     MODULE_OPTION_NAME = "mirror_snapshot_schedule"
+    MODULE_OPTION_NAME_MAX_CONCURRENT_SNAP_CREATE = "max_concurrent_snap_create"
+    MODULE_OPTION_NAME_MAX_CONCURRENT_SNAP_CREATE_PER_POOL = \
+        "max_concurrent_snap_create_per_pool"
     SCHEDULE_OID = "rbd_mirror_snapshot_schedule"
 
     lock = Lock()
@@ -157,6 +162,17 @@ class MirrorSnapshotScheduleHandler:
         self.log = module.log
         self.last_refresh_images = datetime(1970, 1, 1)
 
+        self.max_concurrent_snap_create = 0
+        self.max_concurrent_snap_create_per_pool = 0
+        self.executor = None
+        self.executor_size = 0
+        self.refresh_config()
+        # pool_id -> number of snapshots being created
+        self.in_flight = {}
+        # images with a snapshot being created, they are queued again
+        # once it is done
+        self.in_flight_images = set()
+
         self.init_schedule_queue()
 
         self.thread = Thread(target=self.run)
@@ -165,25 +181,75 @@ class MirrorSnapshotScheduleHandler:
     def _cleanup(self):
         self.watchers.unregister_all()
 
+    def refresh_config(self):
+        """
+        Pick up changes of the max_concurrent_snap_create* options. Only
+        called by the scheduler thread, which is the one submitting to the
+        executor.
+        """
+        max_concurrent = int(self.module.get_module_option(
+            self.MODULE_OPTION_NAME_MAX_CONCURRENT_SNAP_CREATE))
+        max_concurrent_per_pool = int(self.module.get_module_option(
+            self.MODULE_OPTION_NAME_MAX_CONCURRENT_SNAP_CREATE_PER_POOL))
+        if max_concurrent > self.executor_size:
+            # snapshots being created by the old executor complete there
+            if self.executor:
+                self.executor.shutdown(wait=False)
+            self.executor = ThreadPoolExecutor(max_workers=max_concurrent)
+            self.executor_size = max_concurrent
+        with self.lock:
+            if (max_concurrent, max_concurrent_per_pool) != \
+                    (self.max_concurrent_snap_create,
+                     self.max_concurrent_snap_create_per_pool):
+                self.log.info(
+                    "MirrorSnapshotScheduleHandler: creating up to {} snapshots "
+                    "at once, {} per pool".format(max_concurrent,
+                                                  max_concurrent_per_pool))
+            # lower limits are enforced by dequeue(), the extra workers
+            # of the executor stay idle
+            self.max_concurrent_snap_create = max_concurrent
+            self.max_concurrent_snap_create_per_pool = max_concurrent_per_pool
+
+    def config_notify(self):
+        # let the scheduler thread pick up the new options
+        with self.lock:
+            self.condition.notify()
+
     def run(self):
         try:
             self.log.info("MirrorSnapshotScheduleHandler: starting")
             while True:
+                self.refresh_config()
                 self.refresh_images()
                 with self.lock:
                     (image_spec, wait_time) = self.dequeue()
                     if not image_spec:
                         self.condition.wait(min(wait_time, 60))
                         continue
-                pool_id, namespace, image_id = image_spec
-                self.create_snapshot(pool_id, namespace, image_id)
-                with self.lock:
-                    self.enqueue(datetime.now(), pool_id, namespace, image_id)
+                    pool_id = image_spec[0]
+                    self.in_flight[pool_id] = self.in_flight.get(pool_id, 0) + 1
+                    self.in_flight_images.add(image_spec)
+                self.executor.submit(self.run_create_snapshot, *image_spec)
 
         except Exception as ex:
             self.log.fatal("Fatal runtime error: {}\n{}".format(
                 ex, traceback.format_exc()))
 
+    def run_create_snapshot(self, pool_id, namespace, image_id):
+        try:
+            self.create_snapshot(pool_id, namespace, image_id)
+        finally:
+            with self.lock:
+                self.in_flight[pool_id] -= 1
+                if not self.in_flight[pool_id]:
+                    del self.in_flight[pool_id]
+                self.in_flight_images.discard((pool_id, namespace, image_id))
+                # the image could have been removed while the snapshot
+                # was being created
+                if image_id in self.images.get(pool_id, {}).get(namespace, {}):
+                    self.enqueue(datetime.now(), pool_id, namespace, image_id)
+                self.condition.notify()
+
     def create_snapshot(self, pool_id, namespace, image_id):
         try:
             with self.module.rados.open_ioctx2(int(pool_id)) as ioctx:
@@ -208,7 +274,11 @@ class MirrorSnapshotScheduleHandler:
 
 
     def init_schedule_queue(self):
-        self.queue = {}
+        # heap of (schedule_time, image_spec); an entry is stale unless
+        # self.queued still maps its image_spec to its schedule_time
+        self.queue = []
+        # image_spec -> schedule_time
+        self.queued = {}
         self.images = {}
         self.watchers = Watchers(self)
         self.refresh_images()
@@ -234,7 +304,8 @@ class MirrorSnapshotScheduleHandler:
             if not self.schedules:
                 self.watchers.unregister_all()
                 self.images = {}
-                self.queue = {}
+                self.queue = []
+                self.queued = {}
                 self.last_refresh_images = datetime.now()
                 return
 
@@ -312,18 +383,17 @@ class MirrorSnapshotScheduleHandler:
             # don't remove from queue "due" images
             now_string = datetime.strftime(now, "%Y-%m-%d %H:%M:00")
 
-            for schedule_time in list(self.queue):
+            for image_spec, schedule_time in list(self.queued.items()):
                 if schedule_time > now_string:
-                    del self.queue[schedule_time]
-
-            if not self.schedules:
-                return
+                    del self.queued[image_spec]
 
-            for pool_id in self.images:
-                for namespace in self.images[pool_id]:
-                    for image_id in self.images[pool_id][namespace]:
-                        self.enqueue(now, pool_id, namespace, image_id)
+            if self.schedules:
+                for pool_id in self.images:
+                    for namespace in self.images[pool_id]:
+                        for image_id in self.images[pool_id][namespace]:
+                            self.enqueue(now, pool_id, namespace, image_id)
 
+            self.compact_queue()
             self.condition.notify()
 
     def refresh_queue(self, current_images):
@@ -353,42 +423,83 @@ class MirrorSnapshotScheduleHandler:
         if not schedule:
             return
 
+        image_spec = (pool_id, namespace, image_id)
+        if image_spec in self.in_flight_images:
+            # queued once its snapshot is created
+            return
+
         schedule_time = schedule.next_run(now)
-        if schedule_time not in self.queue:
-            self.queue[schedule_time] = []
+        queued_time = self.queued.get(image_spec)
+        if queued_time is not None and queued_time <= schedule_time:
+            return
         self.log.debug("schedule image {}/{}/{} at {}".format(
             pool_id, namespace, image_id, schedule_time))
-        image_spec = (pool_id, namespace, image_id)
-        if image_spec not in self.queue[schedule_time]:
-            self.queue[schedule_time].append((pool_id, namespace, image_id))
+        self.queued[image_spec] = schedule_time
+        heapq.heappush(self.queue, (schedule_time, image_spec))
 
     def dequeue(self):
-        if not self.queue:
+        if sum(self.in_flight.values()) >= self.max_concurrent_snap_create:
+            # woken up when a snapshot is created
             return None, 1000
 
         now = datetime.now()
-        schedule_time = sorted(self.queue)[0]
-
-        if datetime.strftime(now, "%Y-%m-%d %H:%M:%S") < schedule_time:
-            wait_time = (datetime.strptime(schedule_time,
-                                           "%Y-%m-%d %H:%M:%S") - now)
-            return None, wait_time.total_seconds()
+        now_string = datetime.strftime(now, "%Y-%m-%d %H:%M:%S")
+        result = None, 1000
+        busy = []
+        while self.queue:
+            schedule_time, image_spec = self.queue[0]
+            if self.queued.get(image_spec) != schedule_time:
+                heapq.heappop(self.queue)
+                continue
+            if now_string < schedule_time:
+                wait_time = (datetime.strptime(schedule_time,
+                                               "%Y-%m-%d %H:%M:%S") - now)
+                result = None, wait_time.total_seconds()
+                break
+            heapq.heappop(self.queue)
+            if image_spec in self.in_flight_images:
+                # queued again once its snapshot is created
+                del self.queued[image_spec]
+                continue
+            if self.in_flight.get(image_spec[0], 0) >= \
+                    self.max_concurrent_snap_create_per_pool:
+                # the pool is busy, try the next due image
+                busy.append((schedule_time, image_spec))
+                continue
+            del self.queued[image_spec]
+            result = image_spec, 0
+            break
 
-        images = self.queue[schedule_time]
-        image = images.pop(0)
-        if not images:
-            del self.queue[schedule_time]
-        return image, 0
+        for item in busy:
+            heapq.heappush(self.queue, item)
+        return result
 
     def remove_from_queue(self, pool_id, namespace, image_id):
-        empty_slots = []
-        for schedule_time, images in self.queue.items():
-            if (pool_id, namespace, image_id) in images:
-                images.remove((pool_id, namespace, image_id))
-                if not images:
-                    empty_slots.append(schedule_time)
-        for schedule_time in empty_slots:
-            del self.queue[schedule_time]
+        self.queued.pop((pool_id, namespace, image_id), None)
+        if len(self.queue) > 2 * len(self.queued) + 1024:
+            self.compact_queue()
+
+    def compact_queue(self):
+        self.queue = [(schedule_time, image_spec)
+                      for image_spec, schedule_time in self.queued.items()]
+        heapq.heapify(self.queue)
+
+    def get_lag(self, now, level_spec):
+        """
+        How far behind schedule, in seconds, the longest overdue image
+        matching level_spec is.
+        """
+        now_string = datetime.strftime(now, "%Y-%m-%d %H:%M:%S")
+        oldest = min((schedule_time
+                      for (pool_id, namespace, image_id), schedule_time
+                      in self.queued.items()
+                      if schedule_time <= now_string and
+                      level_spec.matches(pool_id, namespace, image_id)),
+                     default=None)
+        if oldest is None:
+            return 0
+        return int((now - datetime.strptime(
+            oldest, "%Y-%m-%d %H:%M:%S")).total_seconds())
 
     def add_schedule(self, level_spec, interval, start_time):
         self.log.debug(
@@ -427,16 +538,19 @@ class MirrorSnapshotScheduleHandler:
 
         scheduled_images = []
         with self.lock:
-            for schedule_time in sorted(self.queue):
-                for pool_id, namespace, image_id in self.queue[schedule_time]:
-                    if not level_spec.matches(pool_id, namespace, image_id):
-                        continue
-                    image_name = self.images[pool_id][namespace][image_id]
-                    scheduled_images.append({
-                        'schedule_time' : schedule_time,
-                        'image' : image_name
-                    })
-        return 0, json.dumps({'scheduled_images' : scheduled_images},
+            for image_spec, schedule_time in sorted(
+                    self.queued.items(), key=lambda x: (x[1], x[0])):
+                pool_id, namespace, image_id = image_spec
+                if not level_spec.matches(pool_id, namespace, image_id):
+                    continue
+                image_name = self.images[pool_id][namespace][image_id]
+                scheduled_images.append({
+                    'schedule_time' : schedule_time,
+                    'image' : image_name
+                })
+            lag = self.get_lag(datetime.now(), level_spec)
+        return 0, json.dumps({'scheduled_images' : scheduled_images,
+                              'schedule_lag' : lag},
                              indent=4, sort_keys=True), ""
 
     def handle_command(self, inbuf, prefix, cmd):
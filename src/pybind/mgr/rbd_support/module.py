@@ -145,7 +145,27 @@ class Module(MgrModule):
     ]
     MODULE_OPTIONS = [
         {'name': MirrorSnapshotScheduleHandler.MODULE_OPTION_NAME},
+        {'name': MirrorSnapshotScheduleHandler.MODULE_OPTION_NAME_MAX_CONCURRENT_SNAP_CREATE,
+         'type': 'int',
+         'min': 1,
+         'default': 10,
+         'desc': 'maximum number of mirror snapshots created at once'},
+        {'name': MirrorSnapshotScheduleHandler.MODULE_OPTION_NAME_MAX_CONCURRENT_SNAP_CREATE_PER_POOL,
+         'type': 'int',
+         'min': 1,
+         'default': 4,
+         'desc': 'maximum number of mirror snapshots created at once in a pool'},
         {'name': TrashPurgeScheduleHandler.MODULE_OPTION_NAME},
+        {'name': 'max_concurrent_tasks',
+         'type': 'int',
+         'min': 1,
+         'default': 4,
+         'desc': 'maximum number of background tasks run at once'},
+        {'name': 'max_concurrent_tasks_per_pool',
+         'type': 'int',
+         'min': 1,
+         'default': 2,
+         'desc': 'maximum number of background tasks run at once in a pool'},
     ]
 
     mirror_snapshot_schedule = None
@@ -161,6 +181,12 @@ class Module(MgrModule):
         self.task = TaskHandler(self)
         self.trash_purge_schedule = TrashPurgeScheduleHandler(self)
 
+    def config_notify(self):
+        if self.mirror_snapshot_schedule:
+            self.mirror_snapshot_schedule.config_notify()
+        if self.task:
+            self.task.config_notify()
+
     def handle_command(self, inbuf, cmd):
         # ensure we have latest pools available
         self.rados.wait_for_latest_osdmap()
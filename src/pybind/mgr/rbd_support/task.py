@@ -6,9 +6,10 @@ import re
 import traceback
 import uuid
 
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from datetime import datetime, timedelta
-from functools import partial, wraps
+from functools import partial
 from threading import Condition, Lock, Thread
 
 from .common import (authorize_request, extract_pool_key, get_rbd_pools,
@@ -25,6 +26,8 @@ TASK_RETRY_TIME = "retry_time"
 TASK_IN_PROGRESS = "in_progress"
 TASK_PROGRESS = "progress"
 TASK_CANCELED = "canceled"
+TASK_OBJECTS_PER_SEC = "objects_per_sec"
+TASK_BYTES_PER_SEC = "bytes_per_sec"
 
 TASK_REF_POOL_NAME = "pool_name"
 TASK_REF_POOL_NAMESPACE = "pool_namespace"
@@ -47,24 +50,10 @@ VALID_TASK_ACTIONS = [TASK_REF_ACTION_FLATTEN,
                       TASK_REF_ACTION_MIGRATION_ABORT]
 
 TASK_RETRY_INTERVAL = timedelta(seconds=30)
+TASK_PROGRESS_UPDATE_INTERVAL = timedelta(seconds=1)
 MAX_COMPLETED_TASKS = 50
 
 
-class Throttle:
-    def __init__(self, throttle_period):
-        self.throttle_period = throttle_period
-        self.time_of_last_call = datetime.min
-
-    def __call__(self, fn):
-        @wraps(fn)
-        def wrapper(*args, **kwargs):
-            now = datetime.now()
-            if self.time_of_last_call + self.throttle_period <= now:
-                self.time_of_last_call = now
-                return fn(*args, **kwargs)
-        return wrapper
-
-
 class Task:
     def __init__(self, sequence, task_id, message, refs):
         self.sequence = sequence
@@ -77,6 +66,12 @@ class Task:
         self.canceled = False
         self.failed = False
 
+        # throughput of the current attempt
+        self.start_time = None
+        self.objects_done = 0
+        self.object_size = None
+        self.last_progress_update = datetime.min
+
     def __str__(self):
         return self.to_json()
 
@@ -92,6 +87,18 @@ class Task:
         self.failed = True
         self.failure_message = message
 
+    def start(self, object_size):
+        self.in_progress = True
+        self.start_time = datetime.now()
+        self.objects_done = 0
+        self.object_size = object_size
+
+    def objects_per_sec(self):
+        elapsed = (datetime.now() - self.start_time).total_seconds()
+        if elapsed <= 0:
+            return 0.0
+        return self.objects_done / elapsed
+
     def to_dict(self):
         d = {TASK_SEQUENCE: self.sequence,
              TASK_ID: self.task_id,
@@ -103,6 +110,11 @@ class Task:
         if self.in_progress:
             d[TASK_IN_PROGRESS] = True
             d[TASK_PROGRESS] = self.progress
+            if self.start_time:
+                objects_per_sec = self.objects_per_sec()
+                d[TASK_OBJECTS_PER_SEC] = round(objects_per_sec, 2)
+                if self.object_size:
+                    d[TASK_BYTES_PER_SEC] = int(objects_per_sec * self.object_size)
         if self.canceled:
             d[TASK_CANCELED] = True
         return d
@@ -130,24 +142,63 @@ class TaskHandler:
     condition = Condition(lock)
     thread = None
 
-    in_progress_task = None
+    # task_id -> task, for the tasks handed to the executor
+    in_progress_tasks = dict()
     tasks_by_sequence = dict()
     tasks_by_id = dict()
 
     completed_tasks = []
 
     sequence = 0
+    last_action = None
 
     def __init__(self, module):
         self.module = module
         self.log = module.log
 
+        self.max_concurrent_tasks = 0
+        self.max_concurrent_tasks_per_pool = 0
+        self.executor = None
+        self.executor_size = 0
+
         with self.lock:
+            self.refresh_config()
             self.init_task_queue()
 
         self.thread = Thread(target=self.run)
         self.thread.start()
 
+    def refresh_config(self):
+        """
+        Pick up changes of the max_concurrent_tasks* options. Must be
+        called with the lock held, tasks are submitted under it.
+        """
+        max_concurrent = int(self.module.get_module_option(
+            'max_concurrent_tasks'))
+        max_concurrent_per_pool = int(self.module.get_module_option(
+            'max_concurrent_tasks_per_pool'))
+        if max_concurrent > self.executor_size:
+            # tasks running in the old executor complete there
+            if self.executor:
+                self.executor.shutdown(wait=False)
+            self.executor = ThreadPoolExecutor(max_workers=max_concurrent)
+            self.executor_size = max_concurrent
+        if (max_concurrent, max_concurrent_per_pool) != \
+                (self.max_concurrent_tasks,
+                 self.max_concurrent_tasks_per_pool):
+            self.log.info(
+                "TaskHandler: running up to {} tasks at once, {} per "
+                "pool".format(max_concurrent, max_concurrent_per_pool))
+        # lower limits are enforced by dispatch_tasks(), the extra workers
+        # of the executor stay idle
+        self.max_concurrent_tasks = max_concurrent
+        self.max_concurrent_tasks_per_pool = max_concurrent_per_pool
+
+    def config_notify(self):
+        # let the task thread pick up the new options
+        with self.lock:
+            self.condition.notify()
+
     @property
     def default_pool_name(self):
         return self.module.get_ceph_option("rbd_default_pool")
@@ -171,11 +222,8 @@ class TaskHandler:
             self.log.info("TaskHandler: starting")
             while True:
                 with self.lock:
-                    now = datetime.now()
-                    for sequence in sorted([sequence for sequence, task
-                                            in self.tasks_by_sequence.items()
-                                            if not task.retry_time or task.retry_time <= now]):
-                        self.execute_task(sequence)
+                    self.refresh_config()
+                    self.dispatch_tasks()
 
                     self.condition.wait(5)
                     self.log.debug("TaskHandler: tick")
@@ -184,6 +232,88 @@ class TaskHandler:
             self.log.fatal("Fatal runtime error: {}\n{}".format(
                 ex, traceback.format_exc()))
 
+    def dispatch_tasks(self):
+        now = datetime.now()
+        waiting = [task for sequence, task
+                   in sorted(self.tasks_by_sequence.items())
+                   if task.task_id not in self.in_progress_tasks and
+                   (not task.retry_time or task.retry_time <= now)]
+        while waiting and \
+                len(self.in_progress_tasks) < self.max_concurrent_tasks:
+            task = self.pick_task(waiting)
+            if not task:
+                break
+            waiting.remove(task)
+            self.last_action = task.refs[TASK_REF_ACTION]
+            self.in_progress_tasks[task.task_id] = task
+            self.executor.submit(self.run_task, task)
+
+    def pick_task(self, waiting):
+        """
+        Pick the next task to run: the oldest one of the next action type
+        in turn that is below its share of the workers, and whose pool is
+        below its limit.  Action types take turns, and none of them gets
+        more than its share while another one could use the worker.  The
+        tasks of an image are run one after the other, in order.
+        """
+        running_by_pool = {}
+        running_by_action = {}
+        busy_images = set()
+        for task in self.in_progress_tasks.values():
+            pool_name = task.refs[TASK_REF_POOL_NAME]
+            action = task.refs[TASK_REF_ACTION]
+            running_by_pool[pool_name] = running_by_pool.get(pool_name, 0) + 1
+            running_by_action[action] = running_by_action.get(action, 0) + 1
+            busy_images.update(self.image_keys(task.refs))
+
+        # only the oldest waiting task of an image can run
+        runnable = []
+        for task in waiting:
+            keys = self.image_keys(task.refs)
+            if not busy_images.intersection(keys):
+                runnable.append(task)
+            busy_images.update(keys)
+
+        waiting_actions = set(task.refs[TASK_REF_ACTION] for task in waiting)
+        active_actions = waiting_actions | set(running_by_action)
+        share = max(1, self.max_concurrent_tasks // len(active_actions))
+
+        # round robin over the action types, starting after the last one
+        actions = [action for action in VALID_TASK_ACTIONS
+                   if action in waiting_actions]
+        if self.last_action in VALID_TASK_ACTIONS:
+            last = VALID_TASK_ACTIONS.index(self.last_action)
+            actions.sort(key=lambda action:
+                         (VALID_TASK_ACTIONS.index(action) - last - 1) %
+                         len(VALID_TASK_ACTIONS))
+
+        # only let an action type go over its share if no other one can
+        # use the worker
+        for limit in (share, self.max_concurrent_tasks):
+            for action in actions:
+                if running_by_action.get(action, 0) >= limit:
+                    continue
+                for task in runnable:
+                    if task.refs[TASK_REF_ACTION] != action:
+                        continue
+                    if running_by_pool.get(task.refs[TASK_REF_POOL_NAME], 0) < \
+                            self.max_concurrent_tasks_per_pool:
+                        return task
+        return None
+
+    def run_task(self, task):
+        try:
+            with self.lock:
+                if self.tasks_by_sequence.get(task.sequence) is task:
+                    self.execute_task(task)
+        except Exception as ex:
+            self.log.error("Failed to run task {}: {}\n{}".format(
+                str(task), ex, traceback.format_exc()))
+        finally:
+            with self.lock:
+                self.in_progress_tasks.pop(task.task_id, None)
+                self.condition.notify()
+
     @contextmanager
     def open_ioctx(self, spec):
         try:
@@ -268,6 +398,17 @@ class TaskHandler:
         self.tasks_by_sequence[task.sequence] = task
         self.tasks_by_id[task.task_id] = task
 
+    @staticmethod
+    def image_keys(refs):
+        # a task refers to its image by name, id or both
+        image = (refs[TASK_REF_POOL_NAME], refs[TASK_REF_POOL_NAMESPACE])
+        keys = []
+        if TASK_REF_IMAGE_NAME in refs:
+            keys.append(image + ('name', refs[TASK_REF_IMAGE_NAME]))
+        if TASK_REF_IMAGE_ID in refs:
+            keys.append(image + ('id', refs[TASK_REF_IMAGE_ID]))
+        return keys
+
     def task_refs_match(self, task_refs, refs):
         if TASK_REF_IMAGE_ID not in refs and TASK_REF_IMAGE_ID in task_refs:
             task_refs = task_refs.copy()
@@ -341,8 +482,17 @@ class TaskHandler:
             except KeyError:
                 pass
 
-    def execute_task(self, sequence):
-        task = self.tasks_by_sequence[sequence]
+    def get_object_size(self, ioctx, task):
+        image_id = task.refs.get(TASK_REF_IMAGE_ID)
+        if not image_id:
+            return None
+        try:
+            with rbd.Image(ioctx, image_id=image_id, read_only=True) as image:
+                return image.stat()['obj_size']
+        except rbd.Error:
+            return None
+
+    def execute_task(self, task):
         self.log.info("execute_task: task={}".format(str(task)))
 
         pool_valid = False
@@ -362,12 +512,14 @@ class TaskHandler:
                 if not execute_fn:
                     self.log.error("Invalid task action: {}".format(action))
                 else:
-                    task.in_progress = True
-                    self.in_progress_task = task
                     self.update_progress(task, 0)
 
                     self.lock.release()
                     try:
+                        task.start(self.get_object_size(ioctx, task))
+                        if task.canceled:
+                            raise rbd.OperationCanceled(
+                                "Operation canceled before it started")
                         execute_fn(ioctx, task)
 
                     except rbd.OperationCanceled:
@@ -378,7 +530,6 @@ class TaskHandler:
                         self.lock.acquire()
 
                         task.in_progress = False
-                        self.in_progress_task = None
 
                     self.complete_progress(task)
                     self.remove_task(ioctx, task)
@@ -410,9 +561,10 @@ class TaskHandler:
             return 0
 
         try:
-            if not self.in_progress_task or self.in_progress_task.canceled:
+            if task.task_id not in self.in_progress_tasks or task.canceled:
                 return -rbd.ECANCELED
-            self.in_progress_task.progress = progress
+            task.progress = progress
+            task.objects_done = current
         finally:
             self.lock.release()
 
@@ -515,9 +667,11 @@ class TaskHandler:
             # progress module is disabled
             pass
 
-    @Throttle(timedelta(seconds=1))
     def throttled_update_progress(self, task, progress):
-        self.update_progress(task, progress)
+        now = datetime.now()
+        if task.last_progress_update + TASK_PROGRESS_UPDATE_INTERVAL <= now:
+            task.last_progress_update = now
+            self.update_progress(task, progress)
 
     def queue_flatten(self, image_spec):
         image_spec = self.extract_image_spec(image_spec)
@@ -742,8 +896,8 @@ class TaskHandler:
         task.cancel()
 
         remove_in_memory = True
-        if self.in_progress_task and self.in_progress_task.task_id == task_id:
-            self.log.info("Attempting to cancel in-progress task: {}".format(str(self.in_progress_task)))
+        if task_id in self.in_progress_tasks:
+            self.log.info("Attempting to cancel in-progress task: {}".format(str(task)))
             remove_in_memory = False
 
         # complete any associated event in the progress module
@@ -356,8 +356,8 @@ class Module(MgrModule):
     def _self_test_perf_counters(self):
         self.get_perf_schema("osd", "0")
         self.get_counter("osd", "0", "osd.op")
-        #get_counter
-        #get_all_perf_coutners
+        self.get_latest_perf_counters("osd", "0", self.PRIO_USEFUL)
+        self.get_all_perf_counters()
 
     def _self_test_misc(self):
         self.set_uri("http://this.is.a.test.com")
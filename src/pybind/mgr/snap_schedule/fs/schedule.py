@@ -292,7 +292,6 @@ class Schedule(object):
                 res = db.execute(meta_delete + ';', delete_param).rowcount
                 if res < 1:
                     raise ValueError(f'No schedule found for {repeat} {start}')
-                db.execute('COMMIT;')
                 # now check if we have schedules in meta left, if not delete
                 # the schedule as well
                 meta_count = db.execute(
@@ -10,10 +10,14 @@ from contextlib import contextmanager
 from mgr_util import CephfsClient, CephfsConnectionException, \
         open_filesystem
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+import heapq
+import json
 import logging
-from threading import Timer
+from threading import Condition, Lock, RLock, Thread
 import sqlite3
+import time as _time
 from .schedule import Schedule, parse_retention
 import traceback
 
@@ -24,6 +28,12 @@ SNAP_DB_PREFIX = 'snap_db'
 # increment this every time the db schema changes and provide upgrade code
 SNAP_DB_VERSION = '0'
 SNAP_DB_OBJECT_NAME = f'{SNAP_DB_PREFIX}_v{SNAP_DB_VERSION}'
+# changes to the db are appended as omap entries of the db object...
+SNAP_DB_JOURNAL_PREFIX = 'journal.'
+# ...and folded into its data once there are that many
+SNAP_DB_JOURNAL_MAX = 1000
+# number of threads creating and pruning snapshots
+SNAP_SCHEDULE_WORKERS = 4
 SNAPSHOT_TS_FORMAT = '%Y-%m-%d-%H_%M_%S'
 SNAPSHOT_PREFIX = 'scheduled'
 
@@ -96,74 +106,228 @@ def get_prune_set(candidates, retention):
     return candidates - set(keep)
 
 
+class JournaledDB(object):
+    '''
+    Wraps the sqlite connection of a schedule db. Statements modifying the db
+    are collected while a transaction (`with db:`) is open and handed to
+    `append` before it commits, so that only the change gets persisted.
+    `compact` is called with a dump of the db once `append` has been called
+    SNAP_DB_JOURNAL_MAX times since the last compaction.
+    '''
+    def __init__(self, con, append, compact, journal_len=0):
+        self.con = con
+        self.append = append
+        self.compact = compact
+        self.journal_len = journal_len
+        self.lock = RLock()
+        self.depth = 0
+        self.pending = []
+
+    @property
+    def row_factory(self):
+        return self.con.row_factory
+
+    def __enter__(self):
+        self.lock.acquire()
+        self.depth += 1
+        self.con.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.depth -= 1
+            if self.depth == 0 and exc_type is None and self.pending:
+                try:
+                    self._flush()
+                except Exception as e:
+                    # roll back what could not be persisted
+                    self.con.__exit__(type(e), e, e.__traceback__)
+                    raise
+            self.con.__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            if self.depth == 0:
+                self.pending = []
+            self.lock.release()
+        if self.depth == 0 and self.journal_len >= SNAP_DB_JOURNAL_MAX:
+            with self.lock:
+                self.compact('\n'.join(self.con.iterdump()))
+                self.journal_len = 0
+        return False
+
+    def _flush(self):
+        pending, self.pending = self.pending, []
+        self.append(pending)
+        self.journal_len += 1
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            cur = self.con.execute(sql, params)
+            if not sql.lstrip().upper().startswith(('SELECT', 'PRAGMA')):
+                self.pending.append((sql, list(params)))
+                if not self.depth:
+                    self._flush()
+            return cur
+
+    def iterdump(self):
+        return self.con.iterdump()
+
+
 class SnapSchedClient(CephfsClient):
 
     def __init__(self, mgr):
         super(SnapSchedClient, self).__init__(mgr)
         # TODO maybe iterate over all fs instance in fsmap and load snap dbs?
         self.sqlite_connections = {}
-        self.active_timers = {}
+        # fs -> sequence number of the last journal entry
+        self.journal_seq = {}
+        self.db_lock = Lock()
+        # heap of (due time, seq, fs, path) -- only the entry referenced from
+        # self.scheduled is valid, refreshing a path invalidates the old one
+        self.queue = []
+        self.scheduled = {}
+        self.seq = 0
+        self.cv = Condition(Lock())
+        self.executor = ThreadPoolExecutor(max_workers=SNAP_SCHEDULE_WORKERS)
+        self.scheduler = Thread(target=self.run_scheduler, name='snap_schedule.scheduler')
+        self.scheduler.daemon = True
+        self.scheduler.start()
+
+    def shutdown(self):
+        log.info("shutting down")
+        self.stopping.set()
+        with self.cv:
+            self.cv.notify()
+        self.scheduler.join()
+        self.executor.shutdown(wait=True)
+        super(SnapSchedClient, self).shutdown()
 
     def get_schedule_db(self, fs):
-        if fs not in self.sqlite_connections:
-            self.sqlite_connections[fs] = sqlite3.connect(
-                ':memory:',
-                check_same_thread=False)
-            with self.sqlite_connections[fs] as con:
-                con.row_factory = sqlite3.Row
-                con.execute("PRAGMA FOREIGN_KEYS = 1")
-                pool = self.get_metadata_pool(fs)
-                with open_ioctx(self, pool) as ioctx:
-                    try:
-                        size, _mtime = ioctx.stat(SNAP_DB_OBJECT_NAME)
-                        db = ioctx.read(SNAP_DB_OBJECT_NAME,
-                                        size).decode('utf-8')
-                        con.executescript(db)
-                    except rados.ObjectNotFound:
-                        log.debug(f'No schedule DB found in {fs}, creating one.')
-                        con.executescript(Schedule.CREATE_TABLES)
+        with self.db_lock:
+            if fs not in self.sqlite_connections:
+                self.sqlite_connections[fs] = self.load_schedule_db(fs)
+                loaded = True
+            else:
+                loaded = False
+        if loaded:
+            for path in self.sqlite_connections[fs].execute(
+                    'SELECT path FROM schedules').fetchall():
+                self.refresh_snap_timers(fs, path[0])
         return self.sqlite_connections[fs]
 
-    def store_schedule_db(self, fs):
-        # only store db is it exists, otherwise nothing to do
+    def load_schedule_db(self, fs):
+        con = sqlite3.connect(':memory:', check_same_thread=False)
+        journal_len = 0
+        with con:
+            con.row_factory = sqlite3.Row
+            con.execute("PRAGMA FOREIGN_KEYS = 1")
+            pool = self.get_metadata_pool(fs)
+            with open_ioctx(self, pool) as ioctx:
+                try:
+                    size, _mtime = ioctx.stat(SNAP_DB_OBJECT_NAME)
+                except rados.ObjectNotFound:
+                    size = None
+                if size:
+                    db = ioctx.read(SNAP_DB_OBJECT_NAME,
+                                    size).decode('utf-8')
+                    con.executescript(db)
+                else:
+                    # the journal only applies on top of the tables, they
+                    # have to be persisted before anything is appended.
+                    # An empty object was created by appending to the
+                    # journal of a db that had never been stored.
+                    log.debug(f'No schedule DB found in {fs}, creating one.')
+                    con.executescript(Schedule.CREATE_TABLES)
+                    ioctx.write_full(SNAP_DB_OBJECT_NAME,
+                                     Schedule.CREATE_TABLES.encode('utf-8'))
+                seq = 0
+                if size is not None:
+                    for key, statements in self._read_journal(ioctx):
+                        for sql, params in json.loads(statements):
+                            con.execute(sql, params)
+                        seq = int(key[len(SNAP_DB_JOURNAL_PREFIX):])
+                        journal_len += 1
+                self.journal_seq[fs] = seq
+        log.debug(f'loaded schedule DB of {fs}, {journal_len} journal entries')
+        return JournaledDB(con,
+                           lambda statements: self.append_schedule_db(fs, statements),
+                           lambda dump: self.store_schedule_db(fs, dump),
+                           journal_len)
+
+    def _read_journal(self, ioctx):
+        start_after = ''
+        while True:
+            with rados.ReadOpCtx() as op:
+                it, ret = ioctx.get_omap_vals(op, start_after,
+                                              SNAP_DB_JOURNAL_PREFIX, 1024)
+                ioctx.operate_read_op(op, SNAP_DB_OBJECT_NAME)
+                entries = [(k, v.decode('utf-8')) for k, v in it]
+            if not entries:
+                return
+            yield from entries
+            start_after = entries[-1][0]
+
+    def _get_ioctx(self, fs):
         metadata_pool = self.get_metadata_pool(fs)
         if not metadata_pool:
             raise CephfsConnectionException(
                 -errno.ENOENT, "Filesystem {} does not exist".format(fs))
-        if fs in self.sqlite_connections:
-            db_content = []
-            db = self.sqlite_connections[fs]
-            with db:
-                for row in db.iterdump():
-                    db_content.append(row)
-        with open_ioctx(self, metadata_pool) as ioctx:
-            ioctx.write_full(SNAP_DB_OBJECT_NAME,
-                             '\n'.join(db_content).encode('utf-8'))
+        return open_ioctx(self, metadata_pool)
+
+    def append_schedule_db(self, fs, statements):
+        seq = self.journal_seq[fs] + 1
+        with self._get_ioctx(fs) as ioctx:
+            with rados.WriteOpCtx() as op:
+                ioctx.set_omap(op, (f'{SNAP_DB_JOURNAL_PREFIX}{seq:016d}',),
+                               (json.dumps(statements).encode('utf-8'),))
+                ioctx.operate_write_op(op, SNAP_DB_OBJECT_NAME)
+        self.journal_seq[fs] = seq
+
+    def store_schedule_db(self, fs, dump):
+        # replace the db object data by a dump and drop the journal
+        with self._get_ioctx(fs) as ioctx:
+            with rados.WriteOpCtx() as op:
+                op.write_full(dump.encode('utf-8'))
+                ioctx.clear_omap(op)
+                ioctx.operate_write_op(op, SNAP_DB_OBJECT_NAME)
 
     def refresh_snap_timers(self, fs, path):
         try:
-            log.debug(f'SnapDB on {fs} changed for {path}, updating next Timer')
+            log.debug(f'SnapDB on {fs} changed for {path}, updating next snapshot')
             db = self.get_schedule_db(fs)
             rows = []
             with db:
                 cur = db.execute(Schedule.EXEC_QUERY, (path,))
                 rows = cur.fetchmany(1)
-            timers = self.active_timers.get((fs, path), [])
-            for timer in timers:
-                timer.cancel()
-            timers = []
-            for row in rows:
-                log.debug(f'Creating new snapshot timer for {path}')
-                t = Timer(row[1],
-                          self.create_scheduled_snapshot,
-                          args=[fs, path, row[0], row[2], row[3]])
-                t.start()
-                timers.append(t)
-                log.debug(f'Will snapshot {path} in fs {fs} in {row[1]}s')
-            self.active_timers[(fs, path)] = timers
+            with self.cv:
+                self.scheduled.pop((fs, path), None)
+                for row in rows:
+                    self.seq += 1
+                    self.scheduled[(fs, path)] = (self.seq, [fs, path, row[0], row[2], row[3]])
+                    heapq.heappush(self.queue, (_time.monotonic() + row[1], self.seq, fs, path))
+                    log.debug(f'Will snapshot {path} in fs {fs} in {row[1]}s')
+                self.cv.notify()
         except Exception:
             self._log_exception('refresh_snap_timers')
 
+    def run_scheduler(self):
+        with self.cv:
+            while not self.stopping.is_set():
+                if not self.queue:
+                    self.cv.wait()
+                    continue
+                due, seq, fs, path = self.queue[0]
+                now = _time.monotonic()
+                if due > now:
+                    self.cv.wait(due - now)
+                    continue
+                heapq.heappop(self.queue)
+                entry = self.scheduled.get((fs, path))
+                if not entry or entry[0] != seq:
+                    # superseded by a later refresh
+                    continue
+                del self.scheduled[(fs, path)]
+                self.executor.submit(self.create_scheduled_snapshot, *entry[1])
+
     def _log_exception(self, fct):
         log.error(f'{fct} raised an exception:')
         log.error(traceback.format_exc())
@@ -241,7 +405,6 @@ class SnapSchedClient(CephfsClient):
         log.debug(f'attempting to add schedule {sched}')
         db = self.get_schedule_db(fs)
         sched.store_schedule(db)
-        self.store_schedule_db(sched.fs)
 
     @updates_schedule_db
     def rm_snap_schedule(self, fs, path, repeat, start):
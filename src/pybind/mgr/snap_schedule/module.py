@@ -42,6 +42,9 @@ class Module(MgrModule):
     def serve(self):
         self._initialized.set()
 
+    def shutdown(self):
+        self.client.shutdown()
+
     def handle_command(self, inbuf, cmd):
         self._initialized.wait()
         return -errno.EINVAL, "", "Unknown command"
@@ -1,7 +1,13 @@
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+import json
+import sqlite3
 from unittest.mock import MagicMock
 import pytest
-from ...fs.schedule_client import get_prune_set, SNAPSHOT_TS_FORMAT
+from ...fs import schedule_client
+from ...fs.schedule import Schedule
+from ...fs.schedule_client import get_prune_set, JournaledDB, SnapSchedClient, \
+    SNAP_DB_JOURNAL_PREFIX, SNAPSHOT_TS_FORMAT
 
 
 class TestScheduleClient(object):
@@ -18,3 +24,112 @@ class TestScheduleClient(object):
         prune_set = get_prune_set(candidates, ret)
         assert prune_set == set(), 'candidates are pruned despite empty retention'
 
+
+
+class TestJournaledDB(object):
+
+    def _journaled(self, db, journal, dumps):
+        return JournaledDB(db, journal.append, dumps.append)
+
+    def test_replay_journal(self, db, simple_schedules):
+        journal = []
+        jdb = self._journaled(db, journal, [])
+        for s in simple_schedules:
+            s.store_schedule(jdb)
+        simple_schedules[0].rm_schedule(jdb, '/foo', '6h', None)
+        assert journal, 'no changes were journaled'
+
+        replayed = sqlite3.connect(':memory:')
+        replayed.executescript(Schedule.CREATE_TABLES)
+        for statements in journal:
+            for sql, params in json.loads(json.dumps(statements)):
+                replayed.execute(sql, params)
+        assert list(replayed.iterdump()) == list(db.iterdump())
+
+    def test_failed_append_rolls_back_rm(self, db, simple_schedules):
+        for s in simple_schedules[:2]:
+            s.store_schedule(db)
+        dump = list(db.iterdump())
+
+        def fail(statements):
+            raise IOError('write failed')
+        jdb = JournaledDB(db, fail, lambda dump: None)
+        with pytest.raises(IOError):
+            simple_schedules[0].rm_schedule(jdb, '/foo', '6h', None)
+        assert list(db.iterdump()) == dump
+
+    def test_failed_append_rolls_back(self, db, simple_schedule):
+        def fail(statements):
+            raise IOError('write failed')
+        jdb = JournaledDB(db, fail, lambda dump: None)
+        with pytest.raises(IOError):
+            simple_schedule.store_schedule(jdb)
+        assert db.execute('SELECT COUNT(*) FROM schedules').fetchone()[0] == 0
+
+    def test_compaction(self, db, simple_schedules, monkeypatch):
+        monkeypatch.setattr(schedule_client, 'SNAP_DB_JOURNAL_MAX', 2)
+        journal = []
+        dumps = []
+        jdb = self._journaled(db, journal, dumps)
+        for s in simple_schedules[:2]:
+            s.store_schedule(jdb)
+        assert len(journal) == 2
+        assert dumps == ['\n'.join(db.iterdump())]
+        assert jdb.journal_len == 0
+
+
+class FakeIoctx(object):
+
+    def __init__(self, data=None, journal=()):
+        # data is None as long as the object does not exist
+        self.data = data
+        self.omap = {f'{SNAP_DB_JOURNAL_PREFIX}{seq:016d}': json.dumps(statements)
+                     for seq, statements in enumerate(journal, 1)}
+
+    def stat(self, name):
+        if self.data is None:
+            raise ObjectNotFound(name)
+        return len(self.data), None
+
+    def read(self, name, length):
+        return self.data[:length]
+
+    def write_full(self, name, data):
+        self.data = data
+
+
+class ObjectNotFound(Exception):
+    pass
+
+
+class TestLoadScheduleDB(object):
+
+    def _load(self, ioctx, monkeypatch):
+        @contextmanager
+        def open_ioctx(client, pool):
+            yield ioctx
+        monkeypatch.setattr(schedule_client, 'open_ioctx', open_ioctx)
+        monkeypatch.setattr(schedule_client.rados, 'ObjectNotFound', ObjectNotFound)
+        client = MagicMock(journal_seq={})
+        client._read_journal.side_effect = lambda ioctx: sorted(ioctx.omap.items())
+        jdb = SnapSchedClient.load_schedule_db(client, 'fs_name')
+        return client, jdb
+
+    def test_create(self, monkeypatch):
+        ioctx = FakeIoctx()
+        client, jdb = self._load(ioctx, monkeypatch)
+        assert ioctx.data.decode('utf-8') == Schedule.CREATE_TABLES
+        assert client.journal_seq['fs_name'] == 0
+        assert jdb.execute('SELECT COUNT(*) FROM schedules').fetchone()[0] == 0
+
+    def test_replay_into_empty_object(self, db, simple_schedules, monkeypatch):
+        journal = []
+        jdb = JournaledDB(db, journal.append, lambda dump: None)
+        for s in simple_schedules:
+            s.store_schedule(jdb)
+
+        ioctx = FakeIoctx(b'', journal)
+        client, loaded = self._load(ioctx, monkeypatch)
+        assert ioctx.data.decode('utf-8') == Schedule.CREATE_TABLES
+        assert client.journal_seq['fs_name'] == len(journal)
+        assert list(loaded.iterdump()) == list(db.iterdump())
@@ -3,7 +3,10 @@ import stat
 import time
 import errno
 import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from contextlib import contextmanager
+from typing import Dict, List, Set, Tuple
 
 import cephfs
 
@@ -14,6 +17,7 @@ from .operations.versions.op_sm import SubvolumeOpSm
 from .operations.versions.subvolume_attrs import SubvolumeTypes, SubvolumeStates, SubvolumeActions
 from .operations.resolver import resolve
 from .operations.volume import open_volume, open_volume_lockless
+from .operations.lock import lock_paths, subvolume_lock
 from .operations.group import open_group
 from .operations.subvolume import open_subvol
 from .operations.clone_index import open_clone_index
@@ -21,6 +25,11 @@ from .operations.template import SubvolumeOpType
 
 log = logging.getLogger(__name__)
 
+# number of files copied concurrently by a clone
+CLONE_COPY_WORKERS = 8
+# interval (in seconds) between persisting the progress of a clone
+CLONE_CHECKPOINT_INTERVAL = 30
+
 # helper for fetching a clone entry for a given volume
 def get_next_clone_entry(volume_client, volname, running_jobs):
     log.debug("fetching clone entry for volume '{0}'".format(volname))
@@ -41,7 +50,7 @@ def get_next_clone_entry(volume_client, volname, running_jobs):
 
 @contextmanager
 def open_at_volume(volume_client, volname, groupname, subvolname, op_type):
-    with open_volume(volume_client, volname) as fs_handle:
+    with open_volume(volume_client, volname, [subvolume_lock(groupname, subvolname)]) as fs_handle:
         with open_group(fs_handle, volume_client.volspec, groupname) as group:
             with open_subvol(fs_handle, volume_client.volspec, group, subvolname, op_type) as subvolume:
                 yield subvolume
@@ -64,15 +73,19 @@ def open_at_group_unique(volume_client, fs_handle, s_groupname, s_subvolname, c_
 
 
 @contextmanager
-def open_clone_subvolume_pair(volume_client, fs_handle, volname, groupname, subvolname):
+def open_clone_subvolume_pair(volume_client, fs_handle, volname, groupname, subvolname, lock_source=False):
     with open_at_group(volume_client, fs_handle, groupname, subvolname, SubvolumeOpType.CLONE_INTERNAL) as clone_subvolume:
         s_volname, s_groupname, s_subvolname, s_snapname = get_clone_source(clone_subvolume)
         if groupname == s_groupname and subvolname == s_subvolname:
             # use the same subvolume to avoid metadata overwrites
             yield (clone_subvolume, clone_subvolume, s_snapname)
         else:
-            with open_at_group(volume_client, fs_handle, s_groupname, s_subvolname, SubvolumeOpType.CLONE_SOURCE) as source_subvolume:
-                yield (clone_subvolume, source_subvolume, s_snapname)
+            # the source is known only after opening the clone, so it gets locked
+            # (when modified) while holding the lock on the clone.
+            locks = [subvolume_lock(s_groupname, s_subvolname)] if lock_source else []
+            with lock_paths(volname, locks):
+                with open_at_group(volume_client, fs_handle, s_groupname, s_subvolname, SubvolumeOpType.CLONE_SOURCE) as source_subvolume:
+                    yield (clone_subvolume, source_subvolume, s_snapname)
 
 def get_clone_state(volume_client, volname, groupname, subvolname):
     with open_at_volume(volume_client, volname, groupname, subvolname, SubvolumeOpType.CLONE_INTERNAL) as subvolume:
@@ -121,74 +134,197 @@ def sync_attrs(fs_handle, target_path, source_statx):
         log.warning("error synchronizing attrs for {0} ({1})".format(target_path, e))
         raise e
 
-def bulk_copy(fs_handle, source_path, dst_path, should_cancel):
+class CloneProgress(object):
+    """
+    Progress of a clone. Non-directory entries of the source are numbered in
+    (sorted) traversal order -- as the source is a snapshot, the order stays
+    the same across runs. Only entries that have been copied along with all
+    the ones before them are accounted for, so that a restarted clone can
+    skip them.
+    """
+    def __init__(self, saved=None, files_total=0, bytes_total=0):
+        self.files_cloned = saved['files_cloned'] if saved else 0
+        self.bytes_cloned = saved['bytes_cloned'] if saved else 0
+        self.files_total = files_total
+        self.bytes_total = bytes_total
+        # index -> bytes, for entries copied ahead of the ones before them
+        self.done = {} # type: Dict[int, int]
+        self.lock = threading.Lock()
+
+    def skip(self, index):
+        return index <= self.files_cloned
+
+    def complete(self, index, nbytes):
+        with self.lock:
+            self.done[index] = nbytes
+            while self.files_cloned + 1 in self.done:
+                self.files_cloned += 1
+                self.bytes_cloned += self.done.pop(self.files_cloned)
+
+    def dump(self):
+        with self.lock:
+            return {
+                'files_cloned': self.files_cloned,
+                'bytes_cloned': self.bytes_cloned,
+                'files_total': self.files_total,
+                'bytes_total': self.bytes_total,
+            }
+
+def get_tree_totals(fs_handle, path):
+    """
+    number of files and bytes under @path, from the recursive stats of the directory.
+    """
+    try:
+        return (int(fs_handle.getxattr(path, 'ceph.dir.rfiles')),
+                int(fs_handle.getxattr(path, 'ceph.dir.rbytes')))
+    except (cephfs.Error, ValueError) as e:
+        log.warning("error fetching recursive stats of {0} ({1})".format(path, e))
+        return 0, 0
+
+def bulk_copy(fs_handle, source_path, dst_path, should_cancel, progress=None, checkpoint=None):
     """
     bulk copy data from source to destination -- only directories, symlinks
-    and regular files are synced.
+    and regular files are synced. regular files are copied concurrently by a
+    pool of CLONE_COPY_WORKERS threads and synced in bulk (sync_fs()) rather
+    than one by one. entries already copied according to @progress are
+    skipped. @checkpoint, when given, is periodically invoked with the dumped
+    progress once the data accounted for in it has been synced.
     """
     log.info("copying data from {0} to {1}".format(source_path, dst_path))
+    if progress is None:
+        progress = CloneProgress()
+    failed = threading.Event()
+    def cancel_check():
+        return failed.is_set() or should_cancel()
+
+    index = 0
+    inflight = set() # type: Set[Future]
+    # directories get their attributes synced once all their entries are copied
+    dirs = [] # type: List[Tuple[bytes, Dict]]
+    last_checkpoint = time.monotonic()
+
+    def copy_reg(d_full_src, d_full_dst, stx, idx):
+        mo = stx["mode"] & ~stat.S_IFMT(stx["mode"])
+        nbytes = copy_file(fs_handle, d_full_src, d_full_dst, mo, cancel_check=cancel_check, sync=False)
+        sync_attrs(fs_handle, d_full_dst, stx)
+        progress.complete(idx, nbytes)
+
+    def reap(max_inflight):
+        nonlocal last_checkpoint
+        while len(inflight) > max_inflight:
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for f in done:
+                inflight.remove(f)
+                try:
+                    f.result()
+                except Exception:
+                    failed.set()
+                    wait(inflight)
+                    raise
+        if checkpoint and time.monotonic() - last_checkpoint >= CLONE_CHECKPOINT_INTERVAL:
+            last_checkpoint = time.monotonic()
+            current = progress.dump()
+            fs_handle.sync_fs()
+            checkpoint(current)
+
     def cptree(src_root_path, dst_root_path):
+        nonlocal index
         log.debug("cptree: {0} -> {1}".format(src_root_path, dst_root_path))
         try:
+            entries = []
             with fs_handle.opendir(src_root_path) as dir_handle:
                 d = fs_handle.readdir(dir_handle)
-                while d and not should_cancel():
+                while d and not cancel_check():
                     if d.d_name not in (b".", b".."):
-                        log.debug("d={0}".format(d))
-                        d_full_src = os.path.join(src_root_path, d.d_name)
-                        d_full_dst = os.path.join(dst_root_path, d.d_name)
-                        stx = fs_handle.statx(d_full_src, cephfs.CEPH_STATX_MODE  |
-                                                          cephfs.CEPH_STATX_UID   |
-                                                          cephfs.CEPH_STATX_GID   |
-                                                          cephfs.CEPH_STATX_ATIME |
-                                                          cephfs.CEPH_STATX_MTIME |
-                                                          cephfs.CEPH_STATX_SIZE,
-                                                          cephfs.AT_SYMLINK_NOFOLLOW)
-                        handled = True
-                        mo = stx["mode"] & ~stat.S_IFMT(stx["mode"])
-                        if stat.S_ISDIR(stx["mode"]):
-                            log.debug("cptree: (DIR) {0}".format(d_full_src))
-                            try:
-                                fs_handle.mkdir(d_full_dst, mo)
-                            except cephfs.Error as e:
-                                if not e.args[0] == errno.EEXIST:
-                                    raise
-                            cptree(d_full_src, d_full_dst)
-                        elif stat.S_ISLNK(stx["mode"]):
-                            log.debug("cptree: (SYMLINK) {0}".format(d_full_src))
-                            target = fs_handle.readlink(d_full_src, 4096)
-                            try:
-                                fs_handle.symlink(target[:stx["size"]], d_full_dst)
-                            except cephfs.Error as e:
-                                if not e.args[0] == errno.EEXIST:
-                                    raise
-                        elif stat.S_ISREG(stx["mode"]):
-                            log.debug("cptree: (REG) {0}".format(d_full_src))
-                            copy_file(fs_handle, d_full_src, d_full_dst, mo, cancel_check=should_cancel)
-                        else:
-                            handled = False
-                            log.warning("cptree: (IGNORE) {0}".format(d_full_src))
-                        if handled:
-                            sync_attrs(fs_handle, d_full_dst, stx)
+                        entries.append((d.d_name, d.is_dir()))
                     d = fs_handle.readdir(dir_handle)
-                stx_root = fs_handle.statx(src_root_path, cephfs.CEPH_STATX_ATIME |
-                                                          cephfs.CEPH_STATX_MTIME,
-                                                          cephfs.AT_SYMLINK_NOFOLLOW)
-                fs_handle.lutimes(dst_root_path, (time.mktime(stx_root["atime"].timetuple()),
-                                                  time.mktime(stx_root["mtime"].timetuple())))
+            entries.sort()
+            for d_name, is_dir in entries:
+                if cancel_check():
+                    break
+                d_full_src = os.path.join(src_root_path, d_name)
+                d_full_dst = os.path.join(dst_root_path, d_name)
+                if not is_dir:
+                    index += 1
+                    if progress.skip(index):
+                        continue
+                stx = fs_handle.statx(d_full_src, cephfs.CEPH_STATX_MODE  |
+                                                  cephfs.CEPH_STATX_UID   |
+                                                  cephfs.CEPH_STATX_GID   |
+                                                  cephfs.CEPH_STATX_ATIME |
+                                                  cephfs.CEPH_STATX_MTIME |
+                                                  cephfs.CEPH_STATX_SIZE,
+                                                  cephfs.AT_SYMLINK_NOFOLLOW)
+                mo = stx["mode"] & ~stat.S_IFMT(stx["mode"])
+                if stat.S_ISDIR(stx["mode"]):
+                    log.debug("cptree: (DIR) {0}".format(d_full_src))
+                    try:
+                        fs_handle.mkdir(d_full_dst, mo)
+                    except cephfs.Error as e:
+                        if not e.args[0] == errno.EEXIST:
+                            raise
+                    cptree(d_full_src, d_full_dst)
+                    dirs.append((d_full_dst, stx))
+                elif stat.S_ISLNK(stx["mode"]):
+                    log.debug("cptree: (SYMLINK) {0}".format(d_full_src))
+                    target = fs_handle.readlink(d_full_src, 4096)
+                    try:
+                        fs_handle.symlink(target[:stx["size"]], d_full_dst)
+                    except cephfs.Error as e:
+                        if not e.args[0] == errno.EEXIST:
+                            raise
+                    sync_attrs(fs_handle, d_full_dst, stx)
+                    progress.complete(index, 0)
+                elif stat.S_ISREG(stx["mode"]):
+                    log.debug("cptree: (REG) {0}".format(d_full_src))
+                    inflight.add(executor.submit(copy_reg, d_full_src, d_full_dst, stx, index))
+                    reap(2 * CLONE_COPY_WORKERS)
+                else:
+                    log.warning("cptree: (IGNORE) {0}".format(d_full_src))
+                    progress.complete(index, 0)
         except cephfs.Error as e:
             if not e.args[0] == errno.ENOENT:
                 raise VolumeException(-e.args[0], e.args[1])
-    cptree(source_path, dst_path)
+
+    with ThreadPoolExecutor(max_workers=CLONE_COPY_WORKERS) as executor:
+        try:
+            cptree(source_path, dst_path)
+        except Exception:
+            failed.set()
+            wait(inflight)
+            raise
+        reap(0)
     if should_cancel():
         raise VolumeException(-errno.EINTR, "clone operation interrupted")
+    try:
+        for d_full_dst, stx in dirs:
+            sync_attrs(fs_handle, d_full_dst, stx)
+        stx_root = fs_handle.statx(source_path, cephfs.CEPH_STATX_ATIME |
+                                                cephfs.CEPH_STATX_MTIME,
+                                                cephfs.AT_SYMLINK_NOFOLLOW)
+        fs_handle.lutimes(dst_path, (time.mktime(stx_root["atime"].timetuple()),
+                                     time.mktime(stx_root["mtime"].timetuple())))
+        fs_handle.sync_fs()
+    except cephfs.Error as e:
+        raise VolumeException(-e.args[0], e.args[1])
+    if checkpoint:
+        checkpoint(progress.dump())
+
+def set_clone_progress(volume_client, volname, groupname, subvolname, progress):
+    with open_at_volume(volume_client, volname, groupname, subvolname, SubvolumeOpType.CLONE_INTERNAL) as subvolume:
+        subvolume.set_clone_progress(progress, flush=True)
 
 def do_clone(volume_client, volname, groupname, subvolname, should_cancel):
     with open_volume_lockless(volume_client, volname) as fs_handle:
         with open_clone_subvolume_pair(volume_client, fs_handle, volname, groupname, subvolname) as clone_volumes:
             src_path = clone_volumes[1].snapshot_data_path(clone_volumes[2])
             dst_path = clone_volumes[0].path
-            bulk_copy(fs_handle, src_path, dst_path, should_cancel)
+            files_total, bytes_total = get_tree_totals(fs_handle, src_path)
+            progress = CloneProgress(clone_volumes[0].get_clone_progress(), files_total, bytes_total)
+            if progress.files_cloned:
+                log.info("resuming clone of {0} after {1} files".format(src_path, progress.files_cloned))
+            bulk_copy(fs_handle, src_path, dst_path, should_cancel, progress,
+                      lambda p: set_clone_progress(volume_client, volname, groupname, subvolname, p))
 
 def handle_clone_in_progress(volume_client, volname, index, groupname, subvolname, should_cancel):
     try:
@@ -204,9 +340,10 @@ def handle_clone_in_progress(volume_client, volname, index, groupname, subvolnam
 
 def handle_clone_failed(volume_client, volname, index, groupname, subvolname, should_cancel):
     try:
-        with open_volume(volume_client, volname) as fs_handle:
+        with open_volume(volume_client, volname, [subvolume_lock(groupname, subvolname)]) as fs_handle:
             # detach source but leave the clone section intact for later inspection
-            with open_clone_subvolume_pair(volume_client, fs_handle, volname, groupname, subvolname) as clone_volumes:
+            with open_clone_subvolume_pair(volume_client, fs_handle, volname, groupname, subvolname,
+                                           lock_source=True) as clone_volumes:
                 clone_volumes[1].detach_snapshot(clone_volumes[2], index)
     except (MetadataMgrException, VolumeException) as e:
         log.error("failed to detach clone from snapshot: {0}".format(e))
@@ -214,9 +351,11 @@ def handle_clone_failed(volume_client, volname, index, groupname, subvolname, sh
 
 def handle_clone_complete(volume_client, volname, index, groupname, subvolname, should_cancel):
     try:
-        with open_volume(volume_client, volname) as fs_handle:
-            with open_clone_subvolume_pair(volume_client, fs_handle, volname, groupname, subvolname) as clone_volumes:
+        with open_volume(volume_client, volname, [subvolume_lock(groupname, subvolname)]) as fs_handle:
+            with open_clone_subvolume_pair(volume_client, fs_handle, volname, groupname, subvolname,
+                                           lock_source=True) as clone_volumes:
                 clone_volumes[1].detach_snapshot(clone_volumes[2], index)
+                clone_volumes[0].remove_clone_progress()
                 clone_volumes[0].remove_clone_source(flush=True)
     except (MetadataMgrException, VolumeException) as e:
         log.error("failed to detach clone from snapshot: {0}".format(e))
@@ -281,7 +420,7 @@ class Cloner(AsyncJobs):
         with open_clone_index(fs_handle, self.vc.volspec) as index:
             return index.find_clone_entry_index(clone_subvolume.base_path)
 
-    def _cancel_pending_clone(self, fs_handle, clone_subvolume, clone_subvolname, clone_groupname, status, track_idx):
+    def _cancel_pending_clone(self, fs_handle, volname, clone_subvolume, clone_subvolname, clone_groupname, status, track_idx):
         clone_state = SubvolumeStates.from_value(status['state'])
         assert self.is_clone_cancelable(clone_state)
 
@@ -289,7 +428,11 @@ class Cloner(AsyncJobs):
         s_subvolname = status['source']['subvolume']
         s_snapname = status['source']['snapshot']
 
-        with open_at_group_unique(self.vc, fs_handle, s_groupname, s_subvolname, clone_subvolume, clone_groupname,
+        locks = []
+        if not (s_groupname == clone_groupname and s_subvolname == clone_subvolname):
+            locks.append(subvolume_lock(s_groupname, s_subvolname))
+        with lock_paths(volname, locks), \
+             open_at_group_unique(self.vc, fs_handle, s_groupname, s_subvolname, clone_subvolume, clone_groupname,
                                   clone_subvolname, SubvolumeOpType.CLONE_SOURCE) as s_subvolume:
             next_state = SubvolumeOpSm.transition(SubvolumeTypes.TYPE_CLONE,
                                                   clone_state,
@@ -306,7 +449,7 @@ class Cloner(AsyncJobs):
         track_idx = None
 
         try:
-            with open_volume(self.vc, volname) as fs_handle:
+            with open_volume(self.vc, volname, [subvolume_lock(groupname, clonename)]) as fs_handle:
                 with open_group(fs_handle, self.vc.volspec, groupname) as group:
                     with open_subvol(fs_handle, self.vc.volspec, group, clonename, SubvolumeOpType.CLONE_CANCEL) as clone_subvolume:
                         status = clone_subvolume.status
@@ -319,11 +462,11 @@ class Cloner(AsyncJobs):
                             raise VolumeException(-errno.EINVAL, "error canceling clone")
                         if SubvolumeOpSm.is_init_state(SubvolumeTypes.TYPE_CLONE, clone_state):
                             # clone has not started yet -- cancel right away.
-                            self._cancel_pending_clone(fs_handle, clone_subvolume, clonename, groupname, status, track_idx)
+                            self._cancel_pending_clone(fs_handle, volname, clone_subvolume, clonename, groupname, status, track_idx)
                             return
             # cancelling an on-going clone would persist "canceled" state in subvolume metadata.
-            # to persist the new state, async cloner accesses the volume in exclusive mode.
-            # accessing the volume in exclusive mode here would lead to deadlock.
+            # to persist the new state, async cloner locks the clone subvolume exclusively.
+            # locking the clone subvolume here would lead to deadlock.
             assert track_idx is not None
             with self.lock:
                 with open_volume_lockless(self.vc, volname) as fs_handle:
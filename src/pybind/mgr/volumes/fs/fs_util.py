@@ -89,9 +89,17 @@ def list_one_entry_at_a_time(fs, dirpath):
     except cephfs.Error as e:
         raise VolumeException(-e.args[0], e.args[1])
 
-def copy_file(fs, src, dst, mode, cancel_check=None):
+def _is_zero(data, start, length):
+    end = min(start + length, len(data))
+    return data.count(0, start, end) == end - start
+
+def copy_file(fs, src, dst, mode, cancel_check=None, sync=True):
     """
     Copy a regular file from @src to @dst. @dst is overwritten if it exists.
+    Blocks of zeros are not written, leaving holes in @dst. With @sync unset
+    the caller is responsible for syncing @dst (e.g. via sync_fs()).
+
+    :return: number of bytes copied
     """
     src_fd = dst_fd = None
     try:
@@ -105,22 +113,37 @@ def copy_file(fs, src, dst, mode, cancel_check=None):
         raise VolumeException(-e.args[0], e.args[1])
 
     IO_SIZE = 8 * 1024 * 1024
+    HOLE_SIZE = 1024 * 1024
+    offset = 0
     try:
         while True:
             if cancel_check and cancel_check():
                 raise VolumeException(-errno.EINTR, "copy operation interrupted")
-            data = fs.read(src_fd, -1, IO_SIZE)
+            data = fs.read(src_fd, offset, IO_SIZE)
             if not len(data):
                 break
-            written = 0
-            while written < len(data):
-                written += fs.write(dst_fd, data[written:], -1)
-        fs.fsync(dst_fd, 0)
+            # write out runs of non-zero blocks, skipping the all-zero ones
+            start = 0
+            while start < len(data):
+                end = start
+                while end < len(data) and not _is_zero(data, end, HOLE_SIZE):
+                    end += HOLE_SIZE
+                end = min(end, len(data))
+                while start < end:
+                    start += fs.write(dst_fd, data[start:end], offset + start)
+                while start < len(data) and _is_zero(data, start, HOLE_SIZE):
+                    start += HOLE_SIZE
+            offset += len(data)
+        # extend the file over a trailing hole
+        fs.ftruncate(dst_fd, offset)
+        if sync:
+            fs.fsync(dst_fd, 0)
     except cephfs.Error as e:
         raise VolumeException(-e.args[0], e.args[1])
     finally:
         fs.close(src_fd)
         fs.close(dst_fd)
+    return offset
 
 def get_ancestor_xattr(fs, path, attr):
     """
@@ -86,7 +86,10 @@ def create_clone_index(fs, vol_spec):
     try:
         fs.mkdirs(clone_index.path, 0o700)
     except cephfs.Error as e:
-        raise IndexException(-e.args[0], e.args[1])
+        # the index is shared by the clones, it might have just been
+        # created by a concurrent clone
+        if e.args[0] != errno.EEXIST:
+            raise IndexException(-e.args[0], e.args[1])
 
 @contextmanager
 def open_clone_index(fs, vol_spec):
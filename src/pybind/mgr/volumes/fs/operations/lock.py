@@ -1,43 +1,195 @@
 from contextlib import contextmanager
 import logging
-from threading import Lock
-from typing import Dict
+import time
+from threading import Condition, Lock, get_ident
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from .group import Group
 
 log = logging.getLogger(__name__)
 
-# singleton design pattern taken from http://www.aleax.it/5ep.html
 
-class GlobalLock(object):
+class PathLock(object):
     """
-    Global lock to serialize operations in mgr/volumes. This lock
-    is currently held when accessing (opening) a volume to perform
-    group/subvolume operations. Since this is a big lock, it's rather
-    inefficient -- but right now it's ok since mgr/volumes does not
-    expect concurrent operations via its APIs.
-
-    As and when features get added (such as clone, where mgr/volumes
-    would maintain subvolume states in the filesystem), there might
-    be a need to allow concurrent operations. In that case it would
-    be nice to implement an efficient path based locking mechanism.
-
-    See: https://people.eecs.berkeley.edu/~kubitron/courses/cs262a-F14/projects/reports/project6_report.pdf
+    Hierarchical path based reader/writer lock for mgr/volumes. A lock
+    is taken on a path -- (volume,), (volume, group) or (volume, group,
+    subvolume) -- in shared or exclusive mode. Two locks conflict when
+    one path is a prefix of (or equal to) the other and at least one of
+    them is exclusive, so an exclusive group lock waits for every
+    subvolume lock in that group, while operations on independent
+    subvolumes proceed in parallel.
+
+    All the paths required by an operation are acquired at once (see
+    `lock_op()`). Waiting requests are served in order, except for
+    nested requests (made while holding a lock), which have to be
+    ordered consistently by their callers -- a clone is locked before
+    its source.
+
+    See: https://people.eecs.berkeley.edu/~kubitron/courses/cs262a-F14/
+         projects/reports/project6_report.pdf
     """
-    _shared_state = {
-        'lock' : Lock(),
-        'init' : False
-    } # type: Dict
-
-    def __init__(self):
-        with self._shared_state['lock']:
-            if not self._shared_state['init']:
-                self._shared_state['init'] = True
-        # share this state among all instances
-        self.__dict__ = self._shared_state
+    # the state is kept in the class so that it is shared by all instances
+    cond = Condition(Lock())
+    # path -> [number of shared holders, exclusively held]
+    held = {}  # type: Dict[Tuple[str, ...], List[Any]]
+    # requests waiting for their paths, in arrival order
+    waiters = []  # type: List[List[Tuple[Tuple[str, ...], bool]]]
+    # thread -> number of lock_op()s it is within
+    owners = {}  # type: Dict[int, int]
+    stats = {
+        'acquired': 0,
+        'contended': 0,
+        'waiting': 0,
+        'wait_time_total': 0.0,
+        'wait_time_max': 0.0,
+    }  # type: Dict[str, Any]
+
+    @staticmethod
+    def _overlaps(p1, p2):
+        n = min(len(p1), len(p2))
+        return p1[:n] == p2[:n]
+
+    def _can_lock(self, path, exclusive):
+        for held_path, (readers, writer) in self.held.items():
+            if not self._overlaps(path, held_path):
+                continue
+            if writer or (exclusive and readers):
+                return False
+        return True
+
+    def _conflicts(self, paths1, paths2):
+        for p1, x1 in paths1:
+            for p2, x2 in paths2:
+                if (x1 or x2) and self._overlaps(p1, p2):
+                    return True
+        return False
+
+    def _can_acquire(self, paths, nested):
+        if not all(self._can_lock(p, x) for p, x in paths):
+            return False
+        if nested:
+            # the waiters might be waiting for paths held by this thread
+            return True
+        # do not overtake conflicting requests that have been waiting
+        # longer, so that a stream of shared requests cannot starve an
+        # exclusive one.
+        for waiter in self.waiters:
+            if waiter is paths:
+                break
+            if self._conflicts(paths, waiter):
+                return False
+        return True
+
+    @staticmethod
+    def _merge(paths):
+        # type: (Iterable[Tuple[Tuple[str, ...], bool]]) -> List[Tuple[Tuple[str, ...], bool]]
+        # a path requested both shared and exclusive is locked exclusively
+        merged = {}  # type: Dict[Tuple[str, ...], bool]
+        for path, exclusive in paths:
+            merged[path] = merged.get(path, False) or exclusive
+        return list(merged.items())
+
+    def _acquire(self, paths):
+        # type: (List[Tuple[Tuple[str, ...], bool]]) -> None
+        with self.cond:
+            start = None
+            nested = get_ident() in self.owners
+            while not self._can_acquire(paths, nested):
+                if start is None:
+                    start = time.monotonic()
+                    self.waiters.append(paths)
+                    self.stats['contended'] += 1
+                    self.stats['waiting'] += 1
+                self.cond.wait()
+            if start is not None:
+                waited = time.monotonic() - start
+                self.waiters[:] = [w for w in self.waiters if w is not paths]
+                self.cond.notify_all()
+                self.stats['waiting'] -= 1
+                self.stats['wait_time_total'] += waited
+                self.stats['wait_time_max'] = max(self.stats['wait_time_max'], waited)
+                log.debug("waited {0:.3f}s for path lock(s) {1}".format(waited, paths))
+            self.stats['acquired'] += 1
+            self.owners[get_ident()] = self.owners.get(get_ident(), 0) + 1
+            for path, exclusive in paths:
+                entry = self.held.setdefault(path, [0, False])
+                if exclusive:
+                    entry[1] = True
+                else:
+                    entry[0] += 1
+
+    def _release(self, paths):
+        # type: (List[Tuple[Tuple[str, ...], bool]]) -> None
+        with self.cond:
+            for path, exclusive in paths:
+                entry = self.held[path]
+                if exclusive:
+                    entry[1] = False
+                else:
+                    entry[0] -= 1
+                if not entry[0] and not entry[1]:
+                    del self.held[path]
+            self.owners[get_ident()] -= 1
+            if not self.owners[get_ident()]:
+                del self.owners[get_ident()]
+            self.cond.notify_all()
 
     @contextmanager
-    def lock_op(self):
-        log.debug("entering global lock")
-        with self._shared_state['lock']:
-            log.debug("acquired global lock")
+    def lock_op(self, paths):
+        # type: (Iterable[Tuple[Tuple[str, ...], bool]]) -> Iterator[None]
+        """
+        lock a set of paths for the duration of an operation. Paths
+        locked by an enclosing `lock_op()` of the same thread must not be
+        locked again.
+
+        :param paths: iterable of (path tuple, exclusive) pairs
+        """
+        merged = self._merge(paths)
+        if not merged:
+            yield
+            return
+        log.debug("entering path lock {0}".format(merged))
+        self._acquire(merged)
+        try:
+            log.debug("acquired path lock {0}".format(merged))
             yield
-        log.debug("exited global lock")
+        finally:
+            self._release(merged)
+        log.debug("exited path lock {0}".format(merged))
+
+    def dump_stats(self):
+        """
+        return lock contention counters along with the currently held paths.
+        """
+        with self.cond:
+            stats = dict(self.stats)
+            stats['held'] = [{'path': '/'.join(path), 'readers': readers, 'exclusive': writer}
+                             for path, (readers, writer) in sorted(self.held.items())]
+        return stats
+
+
+def volume_lock(exclusive=True):
+    return ((), exclusive)
+
+
+def group_lock(groupname, exclusive=True):
+    return ((groupname if groupname else Group.NO_GROUP_NAME,), exclusive)
+
+
+def subvolume_lock(groupname, subvolname):
+    # always exclusive -- opening a subvolume might upgrade its metadata
+    return ((groupname if groupname else Group.NO_GROUP_NAME, subvolname), True)
+
+
+@contextmanager
+def lock_paths(volname, paths):
+    """
+    lock paths (as returned by `volume_lock()`, `group_lock()` and
+    `subvolume_lock()`) of a volume. This API is to be used as a
+    context manager.
+
+    :param volname: volume name
+    :param paths: list of paths relative to the volume
+    """
+    with PathLock().lock_op([((volname,) + path, exclusive) for path, exclusive in paths]):
+        yield
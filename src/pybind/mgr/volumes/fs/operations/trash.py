@@ -1,16 +1,203 @@
 import os
+import errno
+import time
 import uuid
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from typing import Optional
 
 import cephfs
 
 from .template import GroupTemplate
-from ..fs_util import listdir
 from ..exception import VolumeException
 
 log = logging.getLogger(__name__)
 
+
+class RateLimiter(object):
+    """
+    Space out requests (to the MDS) from any number of threads so that at
+    most `rate` of them are issued per second. A rate of 0 disables the
+    limit.
+    """
+    def __init__(self, rate=0):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.next_time = 0.0
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate
+
+    def acquire(self):
+        with self.lock:
+            if not self.rate:
+                return
+            now = time.monotonic()
+            slot = max(self.next_time, now)
+            self.next_time = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class PurgeProgress(object):
+    """
+    Number of entries (files and directories) removed from a trash entry.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries_total = 0
+        self.entries_removed = 0
+        self.start_time = time.time()
+
+    def removed(self, count=1):
+        with self.lock:
+            self.entries_removed += count
+
+    def dump(self):
+        with self.lock:
+            progress = {
+                'entries_removed': self.entries_removed,
+                'entries_total': self.entries_total,
+                'started': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.start_time)),
+            }
+            if self.entries_total:
+                progress['percentage_removed'] = '{0:.2f}%'.format(
+                    min(100.0, 100.0 * self.entries_removed / self.entries_total))
+        return progress
+
+
+class _PurgeDir(object):
+    __slots__ = ('path', 'parent', 'pending')
+
+    def __init__(self, path, parent):
+        self.path = path
+        self.parent = parent
+        # listing of the directory + unfinished subdirectories and unlink batches
+        self.pending = 1
+
+
+class TreePurger(object):
+    """
+    Remove a directory tree with a pool of threads. Directories are listed by
+    the workers, with their subdirectories and batches of their files handed
+    out as separate work items -- a directory is removed once all the items
+    spawned from it are done.
+    """
+    UNLINK_BATCH = 1024
+
+    def __init__(self, fs, should_cancel, workers, throttle, progress):
+        self.fs = fs
+        self.should_cancel = should_cancel
+        self.workers = workers
+        self.throttle = throttle if throttle else RateLimiter()
+        self.progress = progress if progress else PurgeProgress()
+        self.lock = threading.Lock()
+        self.cv = threading.Condition(self.lock)
+        self.outstanding = 0
+        self.error: Optional[Exception] = None
+
+    def _stopped(self):
+        return self.error is not None or self.should_cancel()
+
+    def _submit(self, fn, *args):
+        with self.lock:
+            self.outstanding += 1
+        self.executor.submit(self._run, fn, *args)
+
+    def _run(self, fn, *args):
+        try:
+            if not self._stopped():
+                fn(*args)
+        except Exception as e:
+            with self.lock:
+                if self.error is None:
+                    self.error = e
+        finally:
+            with self.lock:
+                self.outstanding -= 1
+                self.cv.notify_all()
+
+    def _finish(self, node):
+        # walk up the tree removing directories which have nothing pending
+        while node:
+            with self.lock:
+                node.pending -= 1
+                if node.pending:
+                    return
+            # remove the directory only if we were not asked to cancel
+            # (else we would fail to remove this anyway)
+            if self._stopped():
+                return
+            self.throttle.acquire()
+            try:
+                self.fs.rmdir(node.path)
+            except cephfs.ObjectNotFound:
+                pass
+            self.progress.removed()
+            node = node.parent
+
+    def _unlink(self, node, names):
+        for name in names:
+            if self._stopped():
+                return
+            self.throttle.acquire()
+            try:
+                self.fs.unlink(os.path.join(node.path, name))
+            except cephfs.ObjectNotFound:
+                pass
+            self.progress.removed()
+        self._finish(node)
+
+    def _add_pending(self, node):
+        with self.lock:
+            node.pending += 1
+
+    def _purge_dir(self, node):
+        log.debug("purging directory {0}".format(node.path))
+        names = []
+        try:
+            # readdir replies are batched; count the listing as one request
+            self.throttle.acquire()
+            with self.fs.opendir(node.path) as dir_handle:
+                d = self.fs.readdir(dir_handle)
+                while d and not self._stopped():
+                    if d.d_name not in (b".", b".."):
+                        if d.is_dir():
+                            self._add_pending(node)
+                            self._submit(self._purge_dir,
+                                         _PurgeDir(os.path.join(node.path, d.d_name), node))
+                        else:
+                            names.append(d.d_name)
+                            if len(names) == TreePurger.UNLINK_BATCH:
+                                self._add_pending(node)
+                                self._submit(self._unlink, node, names)
+                                names = []
+                    d = self.fs.readdir(dir_handle)
+        except cephfs.ObjectNotFound:
+            pass
+        # the remaining files are unlinked by this worker
+        self._add_pending(node)
+        self._unlink(node, names)
+        self._finish(node)
+
+    def purge(self, root_path):
+        try:
+            self.progress.entries_total = int(self.fs.getxattr(root_path, 'ceph.dir.rentries'))
+        except (cephfs.Error, ValueError):
+            pass
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        with self.executor:
+            self._submit(self._purge_dir, _PurgeDir(root_path, None))
+            with self.lock:
+                while self.outstanding:
+                    self.cv.wait()
+        if self.error is not None:
+            raise self.error
+
+
 class Trash(GroupTemplate):
     GROUP_NAME = "_deleting"
 
@@ -52,39 +239,20 @@ class Trash(GroupTemplate):
         """
         return self._get_single_dir_entry(exclude_list)
 
-    def purge(self, trashpath, should_cancel):
+    def purge(self, trashpath, should_cancel, workers=1, throttle=None, progress=None):
         """
         purge a trash entry.
 
         :praram trash_entry: the trash entry to purge
         :praram should_cancel: callback to check if the purge should be aborted
+        :praram workers: number of threads removing the tree
+        :praram throttle: RateLimiter for the (MDS) requests issued
+        :praram progress: PurgeProgress to track the number of removed entries
         :return: None
         """
-        def rmtree(root_path):
-            log.debug("rmtree {0}".format(root_path))
-            try:
-                with self.fs.opendir(root_path) as dir_handle:
-                    d = self.fs.readdir(dir_handle)
-                    while d and not should_cancel():
-                        if d.d_name not in (b".", b".."):
-                            d_full = os.path.join(root_path, d.d_name)
-                            if d.is_dir():
-                                rmtree(d_full)
-                            else:
-                                self.fs.unlink(d_full)
-                        d = self.fs.readdir(dir_handle)
-            except cephfs.ObjectNotFound:
-                return
-            except cephfs.Error as e:
-                raise VolumeException(-e.args[0], e.args[1])
-            # remove the directory only if we were not asked to cancel
-            # (else we would fail to remove this anyway)
-            if not should_cancel():
-                self.fs.rmdir(root_path)
-
         # catch any unlink errors
         try:
-            rmtree(trashpath)
+            TreePurger(self.fs, should_cancel, workers, throttle, progress).purge(trashpath)
         except cephfs.Error as e:
             raise VolumeException(-e.args[0], e.args[1])
 
@@ -114,6 +282,7 @@ class Trash(GroupTemplate):
         except cephfs.Error as e:
             raise VolumeException(-e.args[0], e.args[1])
 
+
 def create_trashcan(fs, vol_spec):
     """
     create a trash can.
@@ -126,7 +295,11 @@ def create_trashcan(fs, vol_spec):
     try:
         fs.mkdirs(trashcan.path, 0o700)
     except cephfs.Error as e:
-        raise VolumeException(-e.args[0], e.args[1])
+        # the trash can is shared by the subvolumes, it might have just
+        # been created by a concurrent removal
+        if e.args[0] != errno.EEXIST:
+            raise VolumeException(-e.args[0], e.args[1])
+
 
 @contextmanager
 def open_trashcan(fs, vol_spec):
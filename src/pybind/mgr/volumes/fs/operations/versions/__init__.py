@@ -79,7 +79,10 @@ class SubvolumeLoader(object):
         try:
             fs.mkdirs(subvolume.legacy_dir, 0o700)
         except cephfs.Error as e:
-            raise VolumeException(-e.args[0], "error accessing subvolume")
+            # shared by the legacy subvolumes, which might be upgraded
+            # concurrently
+            if e.args[0] != errno.EEXIST:
+                raise VolumeException(-e.args[0], "error accessing subvolume")
         subvolume_type = SubvolumeTypes.TYPE_NORMAL
         try:
             initial_state = SubvolumeOpSm.get_init_state(subvolume_type)
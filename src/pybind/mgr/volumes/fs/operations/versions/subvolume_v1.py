@@ -130,6 +130,27 @@ class SubvolumeV1(SubvolumeBase, SubvolumeTemplate):
         if flush:
             self.metadata_mgr.flush()
 
+    def set_clone_progress(self, progress, flush=False):
+        self.metadata_mgr.add_section("progress")
+        self.metadata_mgr.update_section_multi("progress", progress)
+        if flush:
+            self.metadata_mgr.flush()
+
+    def get_clone_progress(self):
+        """ return the last persisted clone progress, or None """
+        try:
+            return {key: int(self.metadata_mgr.get_option("progress", key))
+                    for key in ('files_cloned', 'bytes_cloned', 'files_total', 'bytes_total')}
+        except MetadataMgrException as me:
+            if me.errno == -errno.ENOENT:
+                return None
+            raise VolumeException(-errno.EINVAL, "error fetching clone progress")
+
+    def remove_clone_progress(self, flush=False):
+        self.metadata_mgr.remove_section("progress")
+        if flush:
+            self.metadata_mgr.flush()
+
     def create_clone(self, pool, source_volname, source_subvolume, snapname):
         subvolume_type = SubvolumeTypes.TYPE_CLONE
         try:
@@ -257,6 +278,16 @@ class SubvolumeV1(SubvolumeBase, SubvolumeTemplate):
         }
         if not SubvolumeOpSm.is_complete_state(state) and subvolume_type == SubvolumeTypes.TYPE_CLONE:
             subvolume_status["source"] = self._get_clone_source()
+            progress = self.get_clone_progress()
+            if state == SubvolumeStates.STATE_INPROGRESS and progress:
+                bytes_total = max(progress['bytes_total'], 1)
+                subvolume_status["progress"] = {
+                    'percentage_cloned': '{0:.2f}%'.format(min(100.0, 100.0 * progress['bytes_cloned'] / bytes_total)),
+                    'bytes_cloned': progress['bytes_cloned'],
+                    'bytes_total': progress['bytes_total'],
+                    'files_cloned': progress['files_cloned'],
+                    'files_total': progress['files_total'],
+                }
         return subvolume_status
 
     @property
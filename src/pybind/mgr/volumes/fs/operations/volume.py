@@ -8,7 +8,7 @@ from contextlib import contextmanager
 
 import orchestrator
 
-from .lock import GlobalLock
+from .lock import lock_paths, volume_lock
 from ..exception import VolumeException
 from ..fs_util import create_pool, remove_pool, create_filesystem, \
     remove_filesystem, create_mds, volume_exists
@@ -122,17 +122,20 @@ def list_volumes(mgr):
 
 
 @contextmanager
-def open_volume(vc, volname):
+def open_volume(vc, volname, locks=None):
     """
-    open a volume for exclusive access. This API is to be used as a contextr
-    manager.
+    open a volume for exclusive access to the given paths. This API is
+    to be used as a context manager.
 
     :param vc: volume client instance
     :param volname: volume name
+    :param locks: list of paths to lock (see `group_lock()` and
+                  `subvolume_lock()`), defaults to the entire volume
     :return: yields a volume handle (ceph filesystem handle)
     """
-    g_lock = GlobalLock()
-    with g_lock.lock_op():
+    if locks is None:
+        locks = [volume_lock()]
+    with lock_paths(volname, locks):
         try:
             with open_filesystem(vc, volname) as fs_handle:
                 yield fs_handle
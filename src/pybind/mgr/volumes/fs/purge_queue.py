@@ -2,6 +2,7 @@ import errno
 import logging
 import os
 import stat
+from typing import Dict, Tuple
 
 import cephfs
 
@@ -12,10 +13,12 @@ from .operations.template import SubvolumeOpType
 from .operations.group import open_group
 from .operations.subvolume import open_subvol
 from .operations.volume import open_volume, open_volume_lockless
-from .operations.trash import open_trashcan
+from .operations.lock import subvolume_lock
+from .operations.trash import open_trashcan, PurgeProgress, RateLimiter
 
 log = logging.getLogger(__name__)
 
+
 # helper for fetching a trash entry for a given volume
 def get_trash_entry_for_volume(volume_client, volname, running_jobs):
     log.debug("fetching trash entry for volume '{0}'".format(volname))
@@ -34,27 +37,35 @@ def get_trash_entry_for_volume(volume_client, volname, running_jobs):
         log.error("error fetching trash entry for volume '{0}' ({1})".format(volname, ve))
         return ve.errno, None
 
-def subvolume_purge(volume_client, volname, trashcan, subvolume_trash_entry, should_cancel):
-    groupname, subvolname = resolve_trash(volume_client.volspec, subvolume_trash_entry.decode('utf-8'))
+
+def subvolume_purge(volume_client, volname, trashcan, subvolume_trash_entry, should_cancel,
+                    throttle=None):
+    groupname, subvolname = resolve_trash(volume_client.volspec,
+                                          subvolume_trash_entry.decode('utf-8'))
     log.debug("subvolume resolved to {0}/{1}".format(groupname, subvolname))
 
     try:
-        with open_volume(volume_client, volname) as fs_handle:
+        lock = subvolume_lock(groupname, subvolname)
+        with open_volume(volume_client, volname, [lock]) as fs_handle:
             with open_group(fs_handle, volume_client.volspec, groupname) as group:
-                with open_subvol(fs_handle, volume_client.volspec, group, subvolname, SubvolumeOpType.REMOVE) as subvolume:
-                    log.debug("subvolume.path={0}, purgeable={1}".format(subvolume.path, subvolume.purgeable))
+                with open_subvol(fs_handle, volume_client.volspec, group, subvolname,
+                                 SubvolumeOpType.REMOVE) as subvolume:
+                    log.debug("subvolume.path={0}, purgeable={1}".format(
+                        subvolume.path, subvolume.purgeable))
                     if not subvolume.purgeable:
                         return
-                    # this is fine under the global lock -- there are just a handful
+                    # this is fine under the subvolume lock -- there are just a handful
                     # of entries in the subvolume to purge. moreover, the purge needs
                     # to be guarded since a create request might sneak in.
-                    trashcan.purge(subvolume.base_path, should_cancel)
+                    trashcan.purge(subvolume.base_path, should_cancel, throttle=throttle)
     except VolumeException as ve:
         if not ve.errno == -errno.ENOENT:
             raise
 
+
 # helper for starting a purge operation on a trash entry
-def purge_trash_entry_for_volume(volume_client, volname, purge_entry, should_cancel):
+def purge_trash_entry_for_volume(volume_client, volname, purge_entry, should_cancel, workers=1,
+                                 throttle=None, progress=None):
     log.debug("purging trash entry '{0}' for volume '{1}'".format(purge_entry, volname))
 
     ret = 0
@@ -71,25 +82,27 @@ def purge_trash_entry_for_volume(volume_client, volname, purge_entry, should_can
                         log.debug("purging entry pointing to subvolume trash: {0}".format(tgt))
                         delink = True
                         try:
-                            trashcan.purge(tgt, should_cancel)
+                            trashcan.purge(tgt, should_cancel, workers, throttle, progress)
                         except VolumeException as ve:
                             if not ve.errno == -errno.ENOENT:
                                 delink = False
                                 return ve.errno
                         finally:
                             if delink:
-                                subvolume_purge(volume_client, volname, trashcan, tgt, should_cancel)
+                                subvolume_purge(volume_client, volname, trashcan, tgt,
+                                                should_cancel, throttle)
                                 log.debug("purging trash link: {0}".format(purge_entry))
                                 trashcan.delink(purge_entry)
                     else:
                         log.debug("purging entry pointing to trash: {0}".format(pth))
-                        trashcan.purge(pth, should_cancel)
+                        trashcan.purge(pth, should_cancel, workers, throttle, progress)
                 except cephfs.Error as e:
                     log.warn("failed to remove trash entry: {0}".format(e))
     except VolumeException as ve:
         ret = ve.errno
     return ret
 
+
 class ThreadPoolPurgeQueueMixin(AsyncJobs):
     """
     Purge queue mixin class maintaining a pool of threads for purging trash entries.
@@ -100,10 +113,33 @@ class ThreadPoolPurgeQueueMixin(AsyncJobs):
     """
     def __init__(self, volume_client, tp_size):
         self.vc = volume_client
+        # threads removing the tree of a single trash entry
+        self.purge_concurrency = 1
+        # shared by all purges
+        self.throttle = RateLimiter()
+        # (volume, trash entry) => PurgeProgress
+        self.progress: Dict[Tuple[str, bytes], PurgeProgress] = {}
         super(ThreadPoolPurgeQueueMixin, self).__init__(volume_client, "puregejob", tp_size)
 
+    def configure(self, purge_concurrency, mds_ops_per_sec):
+        self.purge_concurrency = max(1, purge_concurrency)
+        self.throttle.set_rate(max(0, mds_ops_per_sec))
+
+    def get_progress(self, volname):
+        with self.lock:
+            progress = [(entry, p) for (v, entry), p in self.progress.items() if v == volname]
+        return {entry.decode('utf-8'): p.dump() for entry, p in progress}
+
     def get_next_job(self, volname, running_jobs):
         return get_trash_entry_for_volume(self.vc, volname, running_jobs)
 
     def execute_job(self, volname, job, should_cancel):
-        purge_trash_entry_for_volume(self.vc, volname, job, should_cancel)
+        progress = PurgeProgress()
+        with self.lock:
+            self.progress[(volname, job)] = progress
+        try:
+            purge_trash_entry_for_volume(self.vc, volname, job, should_cancel,
+                                         self.purge_concurrency, self.throttle, progress)
+        finally:
+            with self.lock:
+                del self.progress[(volname, job)]
@@ -10,6 +10,7 @@ from .fs_util import listdir
 
 from .operations.volume import create_volume, \
     delete_volume, list_volumes, open_volume, get_pool_names
+from .operations.lock import PathLock, volume_lock, group_lock, subvolume_lock
 from .operations.group import open_group, create_group, remove_group, open_group_unique
 from .operations.subvolume import open_subvol, create_subvol, remove_subvol, \
     create_clone
@@ -124,6 +125,13 @@ class VolumeClient(CephfsClient):
         volumes = list_volumes(self.mgr)
         return 0, json.dumps(volumes, indent=4, sort_keys=True), ""
 
+    def purge_status(self, **kwargs):
+        volname = kwargs['vol_name']
+        return 0, json.dumps(self.purge_queue.get_progress(volname), indent=4, sort_keys=True), ""
+
+    def volume_lock_stats(self):
+        return 0, json.dumps(PathLock().dump_stats(), indent=4, sort_keys=True), ""
+
     ### subvolume operations
 
     def _create_subvolume(self, fs_handle, volname, group, subvolname, **kwargs):
@@ -156,7 +164,7 @@ class VolumeClient(CephfsClient):
         isolate_nspace = kwargs['namespace_isolated']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [subvolume_lock(groupname, subvolname)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     try:
                         with open_subvol(fs_handle, self.volspec, group, subvolname, SubvolumeOpType.CREATE) as subvolume:
@@ -188,7 +196,7 @@ class VolumeClient(CephfsClient):
         retainsnaps = kwargs['retain_snapshots']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [subvolume_lock(groupname, subvolname)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     remove_subvol(fs_handle, self.volspec, group, subvolname, force, retainsnaps)
                     # kick the purge threads for async removal -- note that this
@@ -213,7 +221,7 @@ class VolumeClient(CephfsClient):
         groupname  = kwargs['group_name']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [subvolume_lock(groupname, subvolname)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     with open_subvol(fs_handle, self.volspec, group, subvolname, SubvolumeOpType.RESIZE) as subvolume:
                         nsize, usedbytes = subvolume.resize(newsize, noshrink)
@@ -234,7 +242,7 @@ class VolumeClient(CephfsClient):
         groupname   = kwargs['group_name']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [subvolume_lock(groupname, subvolname)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     with open_subvol(fs_handle, self.volspec, group, subvolname, SubvolumeOpType.PIN) as subvolume:
                         subvolume.pin(pin_type, pin_setting)
@@ -250,7 +258,7 @@ class VolumeClient(CephfsClient):
         groupname  = kwargs['group_name']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [subvolume_lock(groupname, subvolname)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     with open_subvol(fs_handle, self.volspec, group, subvolname, SubvolumeOpType.GETPATH) as subvolume:
                         subvolpath = subvolume.path
@@ -266,7 +274,7 @@ class VolumeClient(CephfsClient):
         groupname  = kwargs['group_name']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [subvolume_lock(groupname, subvolname)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     with open_subvol(fs_handle, self.volspec, group, subvolname, SubvolumeOpType.INFO) as subvolume:
                         mon_addr_lst = []
@@ -288,7 +296,7 @@ class VolumeClient(CephfsClient):
         groupname  = kwargs['group_name']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [group_lock(groupname, exclusive=False)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     subvolumes = group.list_subvolumes()
                     ret = 0, name_to_json(subvolumes), ""
@@ -306,7 +314,7 @@ class VolumeClient(CephfsClient):
         groupname  = kwargs['group_name']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [subvolume_lock(groupname, subvolname)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     with open_subvol(fs_handle, self.volspec, group, subvolname, SubvolumeOpType.SNAP_CREATE) as subvolume:
                         subvolume.create_snapshot(snapname)
@@ -323,7 +331,7 @@ class VolumeClient(CephfsClient):
         force      = kwargs['force']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [subvolume_lock(groupname, subvolname)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     with open_subvol(fs_handle, self.volspec, group, subvolname, SubvolumeOpType.SNAP_REMOVE) as subvolume:
                         subvolume.remove_snapshot(snapname)
@@ -344,7 +352,7 @@ class VolumeClient(CephfsClient):
         groupname  = kwargs['group_name']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [subvolume_lock(groupname, subvolname)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     with open_subvol(fs_handle, self.volspec, group, subvolname, SubvolumeOpType.SNAP_INFO) as subvolume:
                         snap_info_dict = subvolume.snapshot_info(snapname)
@@ -360,7 +368,7 @@ class VolumeClient(CephfsClient):
         groupname  = kwargs['group_name']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [subvolume_lock(groupname, subvolname)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     with open_subvol(fs_handle, self.volspec, group, subvolname, SubvolumeOpType.SNAP_LIST) as subvolume:
                         snapshots = subvolume.list_snapshots()
@@ -376,7 +384,7 @@ class VolumeClient(CephfsClient):
         groupname  = kwargs['group_name']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [subvolume_lock(groupname, subvolname)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     with open_subvol(fs_handle, self.volspec, group, subvolname, SubvolumeOpType.SNAP_PROTECT) as subvolume:
                         log.warning("snapshot protect call is deprecated and will be removed in a future release")
@@ -391,7 +399,7 @@ class VolumeClient(CephfsClient):
         groupname  = kwargs['group_name']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [subvolume_lock(groupname, subvolname)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     with open_subvol(fs_handle, self.volspec, group, subvolname, SubvolumeOpType.SNAP_UNPROTECT) as subvolume:
                         log.warning("snapshot unprotect call is deprecated and will be removed in a future release")
@@ -446,9 +454,13 @@ class VolumeClient(CephfsClient):
         volname    = kwargs['vol_name']
         s_subvolname = kwargs['sub_name']
         s_groupname  = kwargs['group_name']
+        t_subvolname = kwargs['target_sub_name']
+        t_groupname  = kwargs['target_group_name']
 
+        # the source is updated too, as the snapshot gets attached to the clone
+        locks = [subvolume_lock(s_groupname, s_subvolname), subvolume_lock(t_groupname, t_subvolname)]
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, locks) as fs_handle:
                 with open_group(fs_handle, self.volspec, s_groupname) as s_group:
                     with open_subvol(fs_handle, self.volspec, s_group, s_subvolname, SubvolumeOpType.CLONE_SOURCE) as s_subvolume:
                         self._clone_subvolume_snapshot(fs_handle, volname, s_group, s_subvolume, **kwargs)
@@ -463,7 +475,7 @@ class VolumeClient(CephfsClient):
         groupname = kwargs['group_name']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [subvolume_lock(groupname, clonename)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     with open_subvol(fs_handle, self.volspec, group, clonename, SubvolumeOpType.CLONE_STATUS) as subvolume:
                         ret = 0, json.dumps({'status' : subvolume.status}, indent=2), ""
@@ -495,7 +507,7 @@ class VolumeClient(CephfsClient):
         mode      = kwargs['mode']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [group_lock(groupname)]) as fs_handle:
                 try:
                     with open_group(fs_handle, self.volspec, groupname):
                         # idempotent creation -- valid.
@@ -518,7 +530,7 @@ class VolumeClient(CephfsClient):
         force     = kwargs['force']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [group_lock(groupname)]) as fs_handle:
                 remove_group(fs_handle, self.volspec, groupname)
         except VolumeException as ve:
             if not (ve.errno == -errno.ENOENT and force):
@@ -530,7 +542,7 @@ class VolumeClient(CephfsClient):
         groupname  = kwargs['group_name']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [group_lock(groupname, exclusive=False)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     return 0, group.path.decode('utf-8'), ""
         except VolumeException as ve:
@@ -541,7 +553,7 @@ class VolumeClient(CephfsClient):
         ret     = 0, '[]', ""
         volume_exists = False
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [volume_lock(exclusive=False)]) as fs_handle:
                 volume_exists = True
                 groups = listdir(fs_handle, self.volspec.base_dir)
                 ret = 0, name_to_json(groups), ""
@@ -558,7 +570,7 @@ class VolumeClient(CephfsClient):
         pin_setting   = kwargs['pin_setting']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [group_lock(groupname)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     group.pin(pin_type, pin_setting)
                     ret = 0, json.dumps({}), ""
@@ -575,7 +587,7 @@ class VolumeClient(CephfsClient):
         # snapname  = kwargs['snap_name']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [group_lock(groupname)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     # as subvolumes are marked with the vxattr ceph.dir.subvolume deny snapshots
                     # at the subvolume group (see: https://tracker.ceph.com/issues/46074)
@@ -593,7 +605,7 @@ class VolumeClient(CephfsClient):
         force     = kwargs['force']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [group_lock(groupname)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     group.remove_snapshot(snapname)
         except VolumeException as ve:
@@ -607,7 +619,7 @@ class VolumeClient(CephfsClient):
         groupname = kwargs['group_name']
 
         try:
-            with open_volume(self, volname) as fs_handle:
+            with open_volume(self, volname, [group_lock(groupname, exclusive=False)]) as fs_handle:
                 with open_group(fs_handle, self.volspec, groupname) as group:
                     snapshots = group.list_snapshots()
                     ret = 0, name_to_json(snapshots), ""
@@ -42,6 +42,17 @@ class Module(orchestrator.OrchestratorClientMixin, MgrModule):
             'desc': "List volumes",
             'perm': 'r'
         },
+        {
+            'cmd': 'fs volume purge status '
+                   'name=vol_name,type=CephString ',
+            'desc': "Show the progress of trash entries being purged",
+            'perm': 'r'
+        },
+        {
+            'cmd': 'fs volume lock stats',
+            'desc': "Show lock contention statistics of volume operations",
+            'perm': 'r'
+        },
         {
             'cmd': 'fs volume create '
                    f'name=name,type=CephString,goodchars={goodchars} '
@@ -375,11 +386,31 @@ class Module(orchestrator.OrchestratorClientMixin, MgrModule):
         # volume in the lifetime of this module instance.
     ]
 
+    MODULE_OPTIONS = [
+        {
+            'name': 'purge_concurrency',
+            'type': 'int',
+            'default': 8,
+            'desc': 'number of threads removing the directory tree of a trash entry',
+        },
+        {
+            'name': 'purge_mds_ops_per_sec',
+            'type': 'int',
+            'default': 0,
+            'desc': 'maximum rate of MDS requests issued by purges (0 for no limit)',
+        },
+    ]
+
     def __init__(self, *args, **kwargs):
         super(Module, self).__init__(*args, **kwargs)
         self.vc = VolumeClient(self)
         self.fs_export = FSExport(self)
         self.nfs = NFSCluster(self)
+        self.config_notify()
+
+    def config_notify(self):
+        self.vc.purge_queue.configure(self.get_module_option('purge_concurrency'),
+                                      self.get_module_option('purge_mds_ops_per_sec'))
 
     def __del__(self):
         self.vc.shutdown()
@@ -412,6 +443,14 @@ class Module(orchestrator.OrchestratorClientMixin, MgrModule):
     def _cmd_fs_volume_ls(self, inbuf, cmd):
         return self.vc.list_fs_volumes()
 
+    @mgr_cmd_wrap
+    def _cmd_fs_volume_purge_status(self, inbuf, cmd):
+        return self.vc.purge_status(vol_name=cmd['vol_name'])
+
+    @mgr_cmd_wrap
+    def _cmd_fs_volume_lock_stats(self, inbuf, cmd):
+        return self.vc.volume_lock_stats()
+
     @mgr_cmd_wrap
     def _cmd_fs_subvolumegroup_create(self, inbuf, cmd):
         """
@@ -0,0 +1,25 @@
+from tests import mock
+
+import pytest
+
+from .fake_fs import Error, NoData, ObjectExists, ObjectNotFound, FakeFS
+
+
+@pytest.fixture
+def cephfs_errors():
+    """
+    the cephfs binding is mocked in unit tests, give it exceptions (and
+    statx flags) that can be raised and combined.
+    """
+    with mock.patch.multiple('cephfs', Error=Error, ObjectNotFound=ObjectNotFound,
+                             ObjectExists=ObjectExists, NoData=NoData,
+                             CEPH_STATX_MODE=0x1, CEPH_STATX_UID=0x8,
+                             CEPH_STATX_GID=0x10, CEPH_STATX_ATIME=0x20,
+                             CEPH_STATX_MTIME=0x40, CEPH_STATX_SIZE=0x200,
+                             AT_SYMLINK_NOFOLLOW=0x100):
+        yield
+
+
+@pytest.fixture
+def fs(cephfs_errors):
+    return FakeFS()
@@ -0,0 +1,274 @@
+"""
+In-memory stand-in for a libcephfs mount, implementing the calls made by
+mgr/volumes on the paths it manages.
+"""
+import errno
+import os
+import stat
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class Error(Exception):
+    pass
+
+
+class ObjectNotFound(Error):
+    pass
+
+
+class ObjectExists(Error):
+    pass
+
+
+class NoData(Error):
+    pass
+
+
+def _error(err, path):
+    cls = {errno.ENOENT: ObjectNotFound, errno.EEXIST: ObjectExists}.get(err, Error)
+    return cls(err, '{0}: {1}'.format(os.strerror(err), path))
+
+
+class Node(object):
+    def __init__(self, mode, target=b''):
+        self.mode = mode
+        self.data = bytearray()
+        self.children = {}  # type: dict
+        self.target = target
+        self.uid = self.gid = 0
+        self.atime = self.mtime = datetime(2020, 1, 1)
+
+
+class DirEntry(object):
+    def __init__(self, name, node):
+        self.d_name = name
+        self.node = node
+
+    def is_dir(self):
+        return stat.S_ISDIR(self.node.mode)
+
+
+class FakeFS(object):
+    """
+    all the calls are made under a single lock, so that the fake can be
+    used from several threads.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.root = Node(stat.S_IFDIR | 0o755)
+        self.fds = {}  # type: dict
+        self.next_fd = 3
+        # (path, offset, data) of every write
+        self.writes = []  # type: list
+        # number of calls, by name
+        self.calls = {}  # type: dict
+
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    @staticmethod
+    def _split(path):
+        return [c for c in path.split(b'/') if c]
+
+    def _lookup(self, path):
+        node = self.root
+        for name in self._split(path):
+            if not stat.S_ISDIR(node.mode) or name not in node.children:
+                raise _error(errno.ENOENT, path)
+            node = node.children[name]
+        return node
+
+    def _parent(self, path):
+        components = self._split(path)
+        parent = self._lookup(b'/' + b'/'.join(components[:-1]))
+        if not stat.S_ISDIR(parent.mode):
+            raise _error(errno.ENOTDIR, path)
+        return parent, components[-1]
+
+    def _add(self, path, node):
+        parent, name = self._parent(path)
+        if name in parent.children:
+            raise _error(errno.EEXIST, path)
+        parent.children[name] = node
+        return node
+
+    # helpers for setting up and checking a tree
+
+    def make_file(self, path, data=b'', mode=0o644):
+        with self.lock:
+            node = self._add(path, Node(stat.S_IFREG | mode))
+            node.data[:] = data
+            return node
+
+    def exists(self, path):
+        with self.lock:
+            try:
+                self._lookup(path)
+                return True
+            except ObjectNotFound:
+                return False
+
+    def content(self, path):
+        with self.lock:
+            return bytes(self._lookup(path).data)
+
+    def count_entries(self, path):
+        with self.lock:
+            def count(node):
+                return sum(1 + count(child) for child in node.children.values())
+            return count(self._lookup(path))
+
+    # libcephfs calls
+
+    def mkdir(self, path, mode):
+        with self.lock:
+            self._count('mkdir')
+            self._add(path, Node(stat.S_IFDIR | mode))
+
+    def mkdirs(self, path, mode):
+        with self.lock:
+            self._count('mkdirs')
+            components = self._split(path)
+            for i in range(1, len(components) + 1):
+                sub = b'/' + b'/'.join(components[:i])
+                try:
+                    self._add(sub, Node(stat.S_IFDIR | mode))
+                except ObjectExists:
+                    if i == len(components):
+                        raise
+
+    def symlink(self, target, path):
+        with self.lock:
+            self._add(path, Node(stat.S_IFLNK | 0o777, target))
+
+    def readlink(self, path, size):
+        with self.lock:
+            return self._lookup(path).target[:size]
+
+    def open(self, path, flags, mode=0o644):
+        with self.lock:
+            self._count('open')
+            try:
+                node = self._lookup(path)
+                if flags & os.O_TRUNC:
+                    node.data[:] = b''
+            except ObjectNotFound:
+                if not flags & os.O_CREAT:
+                    raise
+                node = self.make_file(path, mode=mode)
+            fd = self.next_fd
+            self.next_fd += 1
+            self.fds[fd] = (path, node)
+            return fd
+
+    def close(self, fd):
+        with self.lock:
+            del self.fds[fd]
+
+    def read(self, fd, offset, length):
+        with self.lock:
+            return bytes(self.fds[fd][1].data[offset:offset + length])
+
+    def write(self, fd, data, offset):
+        with self.lock:
+            path, node = self.fds[fd]
+            self.writes.append((path, offset, bytes(data)))
+            if len(node.data) < offset:
+                node.data.extend(bytes(offset - len(node.data)))
+            node.data[offset:offset + len(data)] = data
+            return len(data)
+
+    def ftruncate(self, fd, size):
+        with self.lock:
+            data = self.fds[fd][1].data
+            if len(data) < size:
+                data.extend(bytes(size - len(data)))
+            else:
+                del data[size:]
+
+    def fsync(self, fd, syncdataonly):
+        pass
+
+    def sync_fs(self):
+        with self.lock:
+            self._count('sync_fs')
+
+    def statx(self, path, mask, flag):
+        with self.lock:
+            node = self._lookup(path)
+            size = len(node.target) if stat.S_ISLNK(node.mode) else len(node.data)
+            return {'mode': node.mode, 'uid': node.uid, 'gid': node.gid,
+                    'atime': node.atime, 'mtime': node.mtime, 'size': size}
+
+    def lchown(self, path, uid, gid):
+        with self.lock:
+            node = self._lookup(path)
+            node.uid, node.gid = uid, gid
+
+    def lutimes(self, path, times):
+        with self.lock:
+            node = self._lookup(path)
+            node.atime, node.mtime = [datetime.fromtimestamp(t) for t in times]
+
+    def getxattr(self, path, name):
+        with self.lock:
+            node = self._lookup(path)
+
+            def walk(node):
+                yield node
+                for child in node.children.values():
+                    yield from walk(child)
+            nodes = list(walk(node))[1:]
+            if name == 'ceph.dir.rentries':
+                return str(len(nodes)).encode('utf-8')
+            if name == 'ceph.dir.rfiles':
+                return str(sum(1 for n in nodes if not stat.S_ISDIR(n.mode))).encode('utf-8')
+            if name == 'ceph.dir.rbytes':
+                return str(sum(len(n.data) for n in nodes)).encode('utf-8')
+            raise NoData(errno.ENODATA, name)
+
+    @contextmanager
+    def opendir(self, path):
+        with self.lock:
+            node = self._lookup(path)
+            if not stat.S_ISDIR(node.mode):
+                raise _error(errno.ENOTDIR, path)
+            entries = [DirEntry(b'.', node), DirEntry(b'..', node)]
+            entries += [DirEntry(name, child) for name, child in node.children.items()]
+        yield iter(entries)
+
+    def readdir(self, handle):
+        with self.lock:
+            self._count('readdir')
+            return next(handle, None)
+
+    def unlink(self, path):
+        with self.lock:
+            self._count('unlink')
+            parent, name = self._parent(path)
+            node = parent.children.get(name)
+            if node is None:
+                raise _error(errno.ENOENT, path)
+            if stat.S_ISDIR(node.mode):
+                raise _error(errno.EISDIR, path)
+            del parent.children[name]
+
+    def rmdir(self, path):
+        with self.lock:
+            self._count('rmdir')
+            parent, name = self._parent(path)
+            node = parent.children.get(name)
+            if node is None:
+                raise _error(errno.ENOENT, path)
+            if node.children:
+                raise _error(errno.ENOTEMPTY, path)
+            del parent.children[name]
+
+    def rename(self, src, dst):
+        with self.lock:
+            parent, name = self._parent(src)
+            if name not in parent.children:
+                raise _error(errno.ENOENT, src)
+            self._add(dst, parent.children.pop(name))
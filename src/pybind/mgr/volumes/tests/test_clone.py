@@ -0,0 +1,139 @@
+import stat
+
+from tests import mock
+
+import pytest
+
+from volumes.fs import async_cloner
+from volumes.fs.async_cloner import CloneProgress, bulk_copy
+from volumes.fs.exception import VolumeException
+from volumes.fs.fs_util import copy_file
+
+MB = 1024 * 1024
+
+
+def written(fs, path):
+    return [(offset, data) for p, offset, data in fs.writes if p == path]
+
+
+class TestCopyFile(object):
+
+    def test_copy(self, fs):
+        data = b'x' * (3 * MB + 5)
+        fs.make_file(b'/src', data)
+        assert copy_file(fs, b'/src', b'/dst', 0o600) == len(data)
+        assert fs.content(b'/dst') == data
+        assert not fs.fds
+
+    def test_holes_are_not_written(self, fs):
+        data = b'a' * MB + bytes(2 * MB) + b'b' * MB + bytes(9 * MB)
+        fs.make_file(b'/src', data)
+        assert copy_file(fs, b'/src', b'/dst', 0o600) == len(data)
+        writes = written(fs, b'/dst')
+        assert [(offset, len(chunk)) for offset, chunk in writes] == [(0, MB), (3 * MB, MB)]
+        for _, chunk in writes:
+            assert chunk.count(0) == 0
+        # the trailing hole is restored by the final truncate
+        assert fs.content(b'/dst') == data
+
+    def test_sparse_file(self, fs):
+        fs.make_file(b'/src', bytes(5 * MB + 3))
+        assert copy_file(fs, b'/src', b'/dst', 0o600) == 5 * MB + 3
+        assert written(fs, b'/dst') == []
+        assert fs.content(b'/dst') == bytes(5 * MB + 3)
+
+    def test_overwrite(self, fs):
+        fs.make_file(b'/src', b'new')
+        fs.make_file(b'/dst', b'x' * MB)
+        copy_file(fs, b'/src', b'/dst', 0o600)
+        assert fs.content(b'/dst') == b'new'
+
+    def test_cancel(self, fs):
+        fs.make_file(b'/src', b'x' * MB)
+        with pytest.raises(VolumeException):
+            copy_file(fs, b'/src', b'/dst', 0o600, cancel_check=lambda: True)
+        assert not fs.fds
+
+
+class TestCloneProgress(object):
+
+    def test_in_order(self):
+        progress = CloneProgress(files_total=4, bytes_total=10)
+        progress.complete(2, 3)
+        progress.complete(4, 4)
+        assert progress.dump()['files_cloned'] == 0
+        progress.complete(1, 1)
+        assert progress.dump() == {'files_cloned': 2, 'bytes_cloned': 4,
+                                   'files_total': 4, 'bytes_total': 10}
+        progress.complete(3, 2)
+        assert progress.dump()['files_cloned'] == 4
+        assert progress.dump()['bytes_cloned'] == 10
+
+    def test_skip(self):
+        progress = CloneProgress(saved={'files_cloned': 2, 'bytes_cloned': 7})
+        assert progress.skip(1)
+        assert progress.skip(2)
+        assert not progress.skip(3)
+        progress.complete(3, 1)
+        assert progress.dump()['bytes_cloned'] == 8
+
+
+@pytest.fixture
+def source(fs):
+    """
+    source tree, its files numbered in traversal order:
+    1 a, 2 b, 3 dir/c, 4 dir/link, 5 e
+    """
+    fs.mkdirs(b'/src/dir', 0o755)
+    fs.make_file(b'/src/a', b'a' * 10)
+    fs.make_file(b'/src/b', b'b' * 20)
+    fs.make_file(b'/src/dir/c', b'c' * 30)
+    fs.symlink(b'../a', b'/src/dir/link')
+    fs.make_file(b'/src/e', b'e' * 40)
+    fs.mkdir(b'/dst', 0o755)
+    return fs
+
+
+class TestBulkCopy(object):
+
+    def test_copy(self, source):
+        checkpoints = []
+        progress = CloneProgress(files_total=5, bytes_total=100)
+        bulk_copy(source, b'/src', b'/dst', lambda: False, progress, checkpoints.append)
+        for path in (b'a', b'b', b'dir/c', b'e'):
+            assert source.content(b'/dst/' + path) == source.content(b'/src/' + path)
+        assert source.readlink(b'/dst/dir/link', 4096) == b'../a'
+        assert stat.S_ISDIR(source.statx(b'/dst/dir', 0, 0)['mode'])
+        assert checkpoints[-1] == {'files_cloned': 5, 'bytes_cloned': 100,
+                                   'files_total': 5, 'bytes_total': 100}
+        assert source.calls['sync_fs'] >= 1
+
+    def test_resume(self, source):
+        progress = CloneProgress(saved={'files_cloned': 3, 'bytes_cloned': 60})
+        bulk_copy(source, b'/src', b'/dst', lambda: False, progress)
+        # a, b and dir/c were copied by the previous run
+        assert not source.exists(b'/dst/a')
+        assert not source.exists(b'/dst/b')
+        assert not source.exists(b'/dst/dir/c')
+        assert source.readlink(b'/dst/dir/link', 4096) == b'../a'
+        assert source.content(b'/dst/e') == b'e' * 40
+        assert progress.dump()['files_cloned'] == 5
+        assert progress.dump()['bytes_cloned'] == 100
+
+    def test_checkpoint_after_sync(self, source):
+        events = []
+        source.sync_fs = lambda: events.append('sync')
+        with mock.patch.object(async_cloner, 'CLONE_CHECKPOINT_INTERVAL', 0):
+            bulk_copy(source, b'/src', b'/dst', lambda: False, CloneProgress(),
+                      lambda progress: events.append(progress['files_cloned']))
+        # every checkpoint follows a sync of what it accounts for
+        assert events[0] == 'sync'
+        for i, event in enumerate(events):
+            if event != 'sync':
+                assert events[i - 1] == 'sync'
+        assert events[-1] == 5
+
+    def test_cancel(self, source):
+        with pytest.raises(VolumeException):
+            bulk_copy(source, b'/src', b'/dst', lambda: True)
+        assert not source.exists(b'/dst/a')
@@ -0,0 +1,194 @@
+import threading
+import time
+
+from tests import mock
+
+import pytest
+
+from volumes.fs.operations.lock import PathLock
+
+TIMEOUT = 5
+
+
+@pytest.fixture(autouse=True)
+def lock_state():
+    stats = {
+        'acquired': 0,
+        'contended': 0,
+        'waiting': 0,
+        'wait_time_total': 0.0,
+        'wait_time_max': 0.0,
+    }
+    with mock.patch.multiple(PathLock, held={}, waiters=[], owners={}, stats=stats):
+        yield
+
+
+def shared(*path):
+    return (path, False)
+
+
+def exclusive(*path):
+    return (path, True)
+
+
+class Holder(threading.Thread):
+    """
+    hold some paths in a separate thread until released.
+    """
+    def __init__(self, paths, order=None, name=None):
+        super(Holder, self).__init__()
+        self.daemon = True
+        self.paths = paths
+        self.order = order
+        self.name = name
+        self.acquired = threading.Event()
+        self.release = threading.Event()
+
+    def run(self):
+        with PathLock().lock_op(self.paths):
+            if self.order is not None:
+                self.order.append(self.name)
+            self.acquired.set()
+            self.release.wait(TIMEOUT)
+
+    def stop(self):
+        self.release.set()
+        self.join(TIMEOUT)
+        assert not self.is_alive()
+
+
+def wait_for_waiters(count):
+    deadline = time.monotonic() + TIMEOUT
+    while True:
+        with PathLock.cond:
+            if PathLock.stats['waiting'] == count:
+                return
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+class TestPathLock(object):
+
+    def test_independent_subvolumes(self):
+        first = Holder([exclusive('vol', 'grp', 'sub1')])
+        first.start()
+        assert first.acquired.wait(TIMEOUT)
+        second = Holder([exclusive('vol', 'grp', 'sub2'), exclusive('vol', 'other', 'sub1')])
+        second.start()
+        assert second.acquired.wait(TIMEOUT)
+        first.stop()
+        second.stop()
+        assert PathLock().dump_stats()['contended'] == 0
+
+    def test_shared_holders(self):
+        first = Holder([shared('vol', 'grp')])
+        first.start()
+        assert first.acquired.wait(TIMEOUT)
+        second = Holder([shared('vol', 'grp'), shared('vol')])
+        second.start()
+        assert second.acquired.wait(TIMEOUT)
+        assert PathLock.held[('vol', 'grp')] == [2, False]
+        first.stop()
+        second.stop()
+        assert PathLock.held == {}
+
+    @pytest.mark.parametrize("held,requested", [
+        (exclusive('vol', 'grp'), shared('vol', 'grp', 'sub')),
+        (shared('vol', 'grp', 'sub'), exclusive('vol', 'grp')),
+        (shared('vol'), exclusive('vol', 'grp', 'sub')),
+        (exclusive('vol', 'grp', 'sub'), exclusive('vol', 'grp', 'sub')),
+    ])
+    def test_conflicting_paths(self, held, requested):
+        first = Holder([held])
+        first.start()
+        assert first.acquired.wait(TIMEOUT)
+        second = Holder([requested])
+        second.start()
+        wait_for_waiters(1)
+        assert not second.acquired.is_set()
+        first.stop()
+        assert second.acquired.wait(TIMEOUT)
+        second.stop()
+
+    def test_exclusive_is_not_starved(self):
+        order = []  # type: list
+        reader = Holder([shared('vol', 'grp')], order, 'reader')
+        reader.start()
+        assert reader.acquired.wait(TIMEOUT)
+        writer = Holder([exclusive('vol', 'grp')], order, 'writer')
+        writer.start()
+        wait_for_waiters(1)
+        # would be compatible with the reader, but has to wait for the
+        # writer queued before it
+        late_reader = Holder([shared('vol', 'grp', 'sub')], order, 'late_reader')
+        late_reader.start()
+        wait_for_waiters(2)
+        assert order == ['reader']
+
+        reader.stop()
+        assert writer.acquired.wait(TIMEOUT)
+        assert not late_reader.acquired.is_set()
+        writer.stop()
+        assert late_reader.acquired.wait(TIMEOUT)
+        late_reader.stop()
+        assert order == ['reader', 'writer', 'late_reader']
+
+    def test_nested_overtakes_waiters(self):
+        outer_held = threading.Event()
+        proceed = threading.Event()
+        nested_done = threading.Event()
+
+        def nested():
+            lock = PathLock()
+            with lock.lock_op([shared('vol', 'grp', 'clone')]):
+                outer_held.set()
+                proceed.wait(TIMEOUT)
+                with lock.lock_op([shared('vol', 'grp', 'source')]):
+                    assert PathLock.owners[threading.get_ident()] == 2
+                    nested_done.set()
+        thread = threading.Thread(target=nested)
+        thread.daemon = True
+        thread.start()
+        assert outer_held.wait(TIMEOUT)
+
+        writer = Holder([exclusive('vol', 'grp')])
+        writer.start()
+        wait_for_waiters(1)
+        proceed.set()
+        # the nested request does not queue behind the writer, which
+        # waits for the outer lock
+        assert nested_done.wait(TIMEOUT)
+        thread.join(TIMEOUT)
+        assert writer.acquired.wait(TIMEOUT)
+        writer.stop()
+        assert PathLock.owners == {}
+
+    def test_merge(self):
+        with PathLock().lock_op([shared('vol', 'grp'), exclusive('vol', 'grp'),
+                                 shared('vol', 'grp')]):
+            assert PathLock.held == {('vol', 'grp'): [0, True]}
+        assert PathLock.held == {}
+
+    def test_stats(self):
+        lock = PathLock()
+        with lock.lock_op([shared('vol', 'grp')]):
+            stats = lock.dump_stats()
+            assert stats['held'] == [{'path': 'vol/grp', 'readers': 1, 'exclusive': False}]
+
+        first = Holder([exclusive('vol')])
+        first.start()
+        assert first.acquired.wait(TIMEOUT)
+        second = Holder([shared('vol', 'grp')])
+        second.start()
+        wait_for_waiters(1)
+        first.stop()
+        assert second.acquired.wait(TIMEOUT)
+        second.stop()
+
+        stats = lock.dump_stats()
+        assert stats['acquired'] == 3
+        assert stats['contended'] == 1
+        assert stats['waiting'] == 0
+        assert stats['wait_time_total'] > 0
+        assert stats['wait_time_max'] == stats['wait_time_total']
+        assert stats['held'] == []
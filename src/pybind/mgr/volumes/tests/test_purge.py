@@ -0,0 +1,172 @@
+import json
+import threading
+import time
+
+from tests import mock
+
+import pytest
+
+from volumes.fs.exception import VolumeException
+from volumes.fs.operations import trash
+from volumes.fs.operations.trash import PurgeProgress, RateLimiter, Trash, TreePurger
+from volumes.fs.purge_queue import ThreadPoolPurgeQueueMixin
+from volumes.fs.vol_spec import VolSpec
+from volumes.fs.volume import VolumeClient
+
+from .fake_fs import Error
+
+
+@pytest.fixture
+def tree(fs):
+    """
+    /trash/entry with 3 directories of 5 files each, one of them nested
+    """
+    fs.mkdirs(b'/trash/entry/d0/d1', 0o755)
+    fs.mkdir(b'/trash/entry/d2', 0o755)
+    for d in (b'/trash/entry/d0', b'/trash/entry/d0/d1', b'/trash/entry/d2'):
+        for i in range(5):
+            fs.make_file(d + b'/f' + str(i).encode('utf-8'), b'x')
+    return fs
+
+
+class TestTreePurger(object):
+
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_purge(self, tree, workers):
+        progress = PurgeProgress()
+        with mock.patch.object(TreePurger, 'UNLINK_BATCH', 2):
+            TreePurger(tree, lambda: False, workers, None, progress).purge(b'/trash/entry')
+        assert not tree.exists(b'/trash/entry')
+        assert tree.exists(b'/trash')
+        dump = progress.dump()
+        # every entry below the root, and the root itself
+        assert dump['entries_total'] == 18
+        assert dump['entries_removed'] == 19
+        assert dump['percentage_removed'] == '100.00%'
+
+    def test_cancel(self, tree):
+        calls = []
+
+        def should_cancel():
+            calls.append(1)
+            return len(calls) > 5
+        TreePurger(tree, should_cancel, 2, None, None).purge(b'/trash/entry')
+        # stopped without error, the rest is left for the next attempt
+        assert tree.exists(b'/trash/entry')
+
+    def test_error(self, tree):
+        unlink = tree.unlink
+
+        def failing_unlink(path):
+            if path.endswith(b'/f3'):
+                raise Error(5, 'I/O error')
+            unlink(path)
+        tree.unlink = failing_unlink
+        purger = TreePurger(tree, lambda: False, 4, None, None)
+        with pytest.raises(Error):
+            purger.purge(b'/trash/entry')
+        # every work item has been accounted for
+        assert purger.outstanding == 0
+        assert tree.exists(b'/trash/entry')
+
+    def test_trash_purge(self, tree):
+        tree.unlink = mock.Mock(side_effect=Error(13, 'Permission denied'))
+        with pytest.raises(VolumeException) as e:
+            Trash(tree, VolSpec('.snap')).purge(b'/trash/entry', lambda: False, workers=2)
+        assert e.value.errno == -13
+
+    def test_vanished_entries(self, tree):
+        # entries removed behind the purger's back are fine
+        rmdir = tree.rmdir
+
+        def racing_rmdir(path):
+            rmdir(path)
+            raise trash.cephfs.ObjectNotFound(2, 'gone')
+        tree.rmdir = racing_rmdir
+        TreePurger(tree, lambda: False, 2, None, None).purge(b'/trash/entry')
+        assert not tree.exists(b'/trash/entry')
+
+
+class TestRateLimiter(object):
+
+    def test_unlimited(self):
+        with mock.patch.object(trash.time, 'sleep') as sleep:
+            limiter = RateLimiter()
+            for _ in range(10):
+                limiter.acquire()
+        sleep.assert_not_called()
+
+    def test_rate(self):
+        with mock.patch.object(trash.time, 'monotonic', return_value=100.0), \
+                mock.patch.object(trash.time, 'sleep') as sleep:
+            limiter = RateLimiter(4)
+            for _ in range(3):
+                limiter.acquire()
+            assert sleep.call_args_list == [mock.call(0.25), mock.call(0.5)]
+            limiter.set_rate(0)
+            limiter.acquire()
+            assert sleep.call_count == 2
+
+    def test_threads(self):
+        limiter = RateLimiter(200)
+        threads = [threading.Thread(target=lambda: [limiter.acquire() for _ in range(5)])
+                   for _ in range(4)]
+        start = time.monotonic()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # the 20 requests of all the threads are spaced by 5ms
+        assert time.monotonic() - start >= 19 * 0.005
+
+
+class TestPurgeQueue(object):
+
+    @pytest.fixture
+    def queue(self):
+        # no purge threads
+        return ThreadPoolPurgeQueueMixin(mock.Mock(), 0)
+
+    def test_configure(self, queue):
+        queue.configure(4, 100)
+        assert queue.purge_concurrency == 4
+        assert queue.throttle.rate == 100
+        queue.configure(0, -1)
+        assert queue.purge_concurrency == 1
+        assert queue.throttle.rate == 0
+
+    def test_progress(self, queue):
+        started = threading.Event()
+        finish = threading.Event()
+        seen = []
+
+        def purge(vc, volname, job, should_cancel, workers, throttle, progress):
+            seen.append((workers, throttle))
+            progress.entries_total = 10
+            progress.removed(4)
+            started.set()
+            finish.wait(5)
+        queue.configure(3, 0)
+        with mock.patch('volumes.fs.purge_queue.purge_trash_entry_for_volume', purge):
+            thread = threading.Thread(target=queue.execute_job,
+                                      args=('vol1', b'entry1', lambda: False))
+            thread.start()
+            assert started.wait(5)
+            assert queue.get_progress('vol2') == {}
+            progress = queue.get_progress('vol1')
+            assert list(progress) == ['entry1']
+            assert progress['entry1']['entries_removed'] == 4
+            assert progress['entry1']['percentage_removed'] == '40.00%'
+            finish.set()
+            thread.join(5)
+        assert seen == [(3, queue.throttle)]
+        assert queue.get_progress('vol1') == {}
+
+    def test_purge_status(self, queue):
+        progress = PurgeProgress()
+        progress.entries_total = 2
+        queue.progress[('vol1', b'entry1')] = progress
+        vc = mock.Mock(purge_queue=queue)
+        ret, out, err = VolumeClient.purge_status(vc, vol_name='vol1')
+        assert ret == 0
+        assert json.loads(out)['entry1']['entries_total'] == 2
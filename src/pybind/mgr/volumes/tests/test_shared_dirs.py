@@ -0,0 +1,47 @@
+from tests import mock
+
+import pytest
+
+from volumes.fs.exception import IndexException, VolumeException
+from volumes.fs.operations.clone_index import CloneIndex, create_clone_index
+from volumes.fs.operations.trash import Trash, create_trashcan
+from volumes.fs.operations.versions import loaded_subvolumes
+from volumes.fs.vol_spec import VolSpec
+
+
+@pytest.fixture
+def vol_spec():
+    return VolSpec('.snap')
+
+
+class TestSharedDirs(object):
+    """
+    directories shared by the subvolumes are created by operations that only
+    lock a single subvolume: concurrent ones may find them just created.
+    """
+
+    def test_create_trashcan(self, fs, vol_spec):
+        create_trashcan(fs, vol_spec)
+        create_trashcan(fs, vol_spec)
+        assert fs.exists(Trash(fs, vol_spec).path)
+
+    def test_create_clone_index(self, fs, vol_spec):
+        create_clone_index(fs, vol_spec)
+        create_clone_index(fs, vol_spec)
+        assert fs.exists(CloneIndex(fs, vol_spec).path)
+
+    def test_upgrade_legacy_subvolumes(self, fs):
+        for name in (b'sub1', b'sub2'):
+            subvolume = mock.Mock(legacy_mode=True, legacy_dir=b'/volumes/_legacy',
+                                  base_path=b'/volumes/_nogroup/' + name)
+            loaded_subvolumes.upgrade_legacy_subvolume(fs, subvolume)
+            subvolume.init_config.assert_called_once()
+        assert fs.exists(b'/volumes/_legacy')
+
+    def test_other_errors(self, fs, vol_spec):
+        # a file in place of the base directory
+        fs.make_file(vol_spec.base_dir.encode('utf-8'))
+        with pytest.raises(VolumeException):
+            create_trashcan(fs, vol_spec)
+        with pytest.raises(IndexException):
+            create_clone_index(fs, vol_spec)
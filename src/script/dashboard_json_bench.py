@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the dashboard REST response path on a synthetic
+`GET /api/osd` payload: JSON encoding with each available encoder, ETag
+hashing and gzip compression (as done by the cherrypy gzip tool).
+
+Usage: src/script/dashboard_json_bench.py [--osds N] [--points N] [--rounds N]
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+
+MGR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       '..', 'pybind', 'mgr')
+sys.path.insert(0, MGR_DIR)
+# mock the ceph bindings imported by the dashboard
+os.environ.setdefault('UNITTEST', 'true')
+
+from dashboard.tools import JSON_ENCODERS  # noqa: E402
+
+
+def osd_payload(osd_id, points):
+    now = time.time()
+    host = 'node{:03d}'.format(osd_id // 12)
+    return {
+        'osd': osd_id,
+        'id': osd_id,
+        'uuid': '5b2b1a4c-{:04x}-4a8e-9c3b-7a1d2e3f4a5b'.format(osd_id),
+        'up': 1,
+        'in': 1,
+        'weight': 1.0,
+        'primary_affinity': 1.0,
+        'last_clean_begin': 0,
+        'last_clean_end': 0,
+        'up_from': 12, 'up_thru': 4242, 'down_at': 0, 'lost_at': 0,
+        'public_addr': '10.0.{}.{}:6800/{}'.format(osd_id // 256, osd_id % 256, 1000 + osd_id),
+        'cluster_addr': '10.1.{}.{}:6800/{}'.format(osd_id // 256, osd_id % 256, 1000 + osd_id),
+        'state': ['exists', 'up'],
+        'tree': {'id': osd_id, 'device_class': 'hdd', 'type': 'osd', 'type_id': 0,
+                 'crush_weight': 3.63, 'depth': 2, 'name': 'osd.{}'.format(osd_id)},
+        'host': {'id': -(osd_id // 12) - 2, 'name': host, 'type': 'host', 'type_id': 1,
+                 'children': list(range(osd_id // 12 * 12, osd_id // 12 * 12 + 12))},
+        'stats': {
+            'op_w': random.random() * 100, 'op_in_bytes': random.random() * 1e7,
+            'op_r': random.random() * 100, 'op_out_bytes': random.random() * 1e7,
+            'numpg': random.randint(80, 200), 'stat_bytes': 4000787030016,
+            'stat_bytes_used': random.randint(0, 4000787030016),
+        },
+        'stats_history': {
+            prop: [[now - 5 * i, random.random() * 1e6] for i in range(points)]
+            for prop in ('op_w', 'op_in_bytes', 'op_r', 'op_out_bytes')
+        },
+    }
+
+
+def bench(fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = fn()
+    return (time.perf_counter() - start) / rounds * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--osds', type=int, default=1000)
+    parser.add_argument('--points', type=int, default=20,
+                        help='samples per stats_history series')
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(42)
+    payload = [osd_payload(i, args.points) for i in range(args.osds)]
+
+    encoders = [('json (previous)', lambda obj: json.dumps(obj).encode('utf8'))]
+    encoders += list(JSON_ENCODERS.items())
+    print('{} OSDs, {} samples per series'.format(args.osds, args.points))
+    body = b''
+    for name, encode in encoders:
+        ms, body = bench(lambda: encode(payload), args.rounds)
+        print('  encode {:<16} {:8.2f} ms {:10d} bytes'.format(name, ms, len(body)))
+
+    body = next(iter(JSON_ENCODERS.values()))(payload)
+    ms, _ = bench(lambda: hashlib.blake2b(body, digest_size=16).hexdigest(), args.rounds)
+    print('  etag (blake2b)          {:8.2f} ms'.format(ms))
+    ms, compressed = bench(lambda: gzip.compress(body, compresslevel=5), args.rounds)
+    print('  gzip (level 5)          {:8.2f} ms {:10d} bytes'.format(ms, len(compressed)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the NFS-Ganesha configuration parser shared by the dashboard
+and the volumes mgr modules (mgr_util.GaneshaConfParser).
+
+Generates synthetic configurations holding up to 10k exports and measures
+parsing them as a single file, as one object per export (the way they are
+stored in RADOS) and serializing them back.
+
+Usage: src/script/ganesha_conf_bench.py [--exports N] [--steps S]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+MGR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       '..', 'pybind', 'mgr')
+sys.path.insert(0, MGR_DIR)
+# mock the ceph bindings imported by mgr_util
+os.environ.setdefault('UNITTEST', 'true')
+
+from mgr_util import GaneshaConfParser  # noqa: E402
+
+EXPORT = """
+EXPORT {{
+    Export_ID = {id};
+    Path = "/volumes/_nogroup/sub{id}";
+    Pseudo = "/cephfs/sub{id}";
+    Access_Type = RW;
+    Squash = no_root_squash;
+    Protocols = 4;
+    Transports = TCP;
+    # generated by ganesha_conf_bench
+    FSAL {{
+        Name = CEPH;
+        User_Id = "nfs.bench.{id}";
+        Filesystem = "a";
+        Secret_Access_Key = "AQBZ0ZVgAAAAABAAZ6bLNE3e4kkzOs6X3Hhj2A==";
+    }}
+    CLIENT {{
+        Clients = 192.168.{hi}.{lo}, 10.0.{hi}.0/24;
+        Access_Type = RO;
+    }}
+}}
+"""
+
+
+def export_conf(export_id):
+    return EXPORT.format(id=export_id, hi=export_id // 256 % 256, lo=export_id % 256)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--exports', type=int, default=10000)
+    parser.add_argument('--steps', type=int, default=4)
+    args = parser.parse_args()
+
+    print('{:>8} {:>10} {:>12} {:>12} {:>12}'.format(
+        'exports', 'bytes', 'parse (s)', 'objects (s)', 'write (s)'))
+    for step in range(1, args.steps + 1):
+        count = args.exports * step // args.steps
+        objects = [export_conf(i) for i in range(1, count + 1)]
+        text = ''.join(objects)
+
+        parse_time, blocks = timed(lambda: GaneshaConfParser(text).parse())
+        assert len(blocks) == count
+        objects_time, _ = timed(lambda: [GaneshaConfParser(o).parse() for o in objects])
+        write_time, written = timed(lambda: GaneshaConfParser.write_conf(blocks))
+        assert GaneshaConfParser(written).parse() == blocks
+
+        print('{:>8} {:>10} {:>12.3f} {:>12.3f} {:>12.3f}'.format(
+            count, len(text), parse_time, objects_time, write_time))
+
+
+if __name__ == '__main__':
+    main()